@@ -15,6 +15,7 @@ from .dept import router as dept_router
 from .dict_data import router as dict_data_router
 from .dict_type import router as dict_type_router
 from .menu import router as menu_router
+from .monitor import router as monitor_router
 from .role import router as role_router
 from .user import router as user_router
 
@@ -25,6 +26,7 @@ router.include_router(dept_router, prefix='/depts', tags=['部门管理'])
 router.include_router(dict_data_router, prefix='/dict_datas', tags=['字典数据管理'])
 router.include_router(dict_type_router, prefix='/dict_types', tags=['字典类型管理'])
 router.include_router(menu_router, prefix='/menus', tags=['菜单管理'])
+router.include_router(monitor_router, prefix='/monitors', tags=['系统监控'])
 router.include_router(role_router, prefix='/roles', tags=['角色管理'])
 router.include_router(user_router, prefix='/users', tags=['用户管理'])
 
@@ -11,7 +11,7 @@
 from typing import Annotated, Optional
 from fastapi import APIRouter, Depends, Path, Query
 
-from backend.app.schemas.dept import CreateDeptParam, GetDeptListDetails, UpdateDeptParam
+from backend.app.schemas.dept import BulkUpdateDeptParam, CreateDeptParam, GetDeptListDetails, UpdateDeptParam
 from backend.app.services.service_dept import dept_service
 from backend.app.common.response.response_schema import ResponseModel, response_base
 from backend.app.common.security.jwt import DependsJwtAuth
@@ -45,6 +45,18 @@ async def create_dept(obj: CreateDeptParam) -> ResponseModel:
     return await response_base.success()
 
 
+@router.post('/bulk', summary='批量创建部门', dependencies=[Depends(RequestPermission('sys:dept:add')), DependsRBAC])
+async def bulk_create_dept(objs: list[CreateDeptParam]) -> ResponseModel:
+    count = await dept_service.bulk_create(objs=objs)
+    return await response_base.success(data=count)
+
+
+@router.put('/bulk', summary='批量更新部门', dependencies=[Depends(RequestPermission('sys:dept:edit')), DependsRBAC])
+async def bulk_update_dept(objs: list[BulkUpdateDeptParam]) -> ResponseModel:
+    count = await dept_service.bulk_update(objs=objs)
+    return await response_base.success(data=count)
+
+
 @router.put('/{pk}', summary='更新部门', dependencies=[Depends(RequestPermission('sys:dept:edit')), DependsRBAC])
 async def update_dept(pk: Annotated[int, Path(...)], obj: UpdateDeptParam) -> ResponseModel:
     count = await dept_service.update(dept_id=pk, obj=obj)
@@ -11,7 +11,7 @@
 from typing import Annotated, Optional
 from fastapi import APIRouter, Depends, Path, Query
 
-from backend.app.schemas.dict_data import CreateDictDataParam, GetDictDataListDetails, UpdateDictDataParam
+from backend.app.schemas.dict_data import BulkUpdateDictDataParam, CreateDictDataParam, GetDictDataListDetails, UpdateDictDataParam
 from backend.app.services.service_dict_data import dict_data_service
 from backend.app.common.pagination import DependsPagination, paging_data
 from backend.app.common.response.response_schema import ResponseModel, response_base
@@ -45,6 +45,24 @@ async def create_dict_data(obj: CreateDictDataParam) -> ResponseModel:
     return await response_base.success()
 
 
+@router.post('/bulk', summary='批量创建字典', dependencies=[Depends(RequestPermission('sys:dict:data:add')), DependsRBAC])
+async def bulk_create_dict_data(objs: list[CreateDictDataParam]) -> ResponseModel:
+    count = await dict_data_service.bulk_create(objs=objs)
+    return await response_base.success(data=count)
+
+
+@router.put('/bulk', summary='批量更新字典', dependencies=[Depends(RequestPermission('sys:dict:data:edit')), DependsRBAC])
+async def bulk_update_dict_data(objs: list[BulkUpdateDictDataParam]) -> ResponseModel:
+    count = await dict_data_service.bulk_update(objs=objs)
+    return await response_base.success(data=count)
+
+
+@router.post('/bulk/upsert', summary='批量导入字典, 已存在时更新', dependencies=[Depends(RequestPermission('sys:dict:data:add')), DependsRBAC])
+async def bulk_upsert_dict_data(objs: list[CreateDictDataParam]) -> ResponseModel:
+    count = await dict_data_service.bulk_upsert(objs=objs)
+    return await response_base.success(data=count)
+
+
 @router.put('/{pk}', summary='更新字典', dependencies=[Depends(RequestPermission('sys:dict:data:edit')), DependsRBAC])
 async def update_dict_data(pk: Annotated[int, Path(...)], obj: UpdateDictDataParam) -> ResponseModel:
     count = await dict_data_service.update(pk=pk, obj=obj)
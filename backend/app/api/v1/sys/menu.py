@@ -12,7 +12,7 @@ from typing import Annotated, Optional
 
 from fastapi import APIRouter, Depends, Path, Query, Request
 
-from backend.app.schemas.menu import CreateMenuParam, GetMenuListDetails, UpdateMenuParam
+from backend.app.schemas.menu import BulkUpdateMenuParam, CreateMenuParam, GetMenuListDetails, UpdateMenuParam
 from backend.app.services.service_menu import menu_service
 from backend.app.common.response.response_schema import ResponseModel, response_base
 from backend.app.common.security.jwt import DependsJwtAuth
@@ -49,6 +49,18 @@ async def create_menu(obj: CreateMenuParam) -> ResponseModel:
     return await response_base.success()
 
 
+@router.post('/bulk', summary='批量创建菜单', dependencies=[Depends(RequestPermission('sys:menu:add')), DependsRBAC])
+async def bulk_create_menu(objs: list[CreateMenuParam]) -> ResponseModel:
+    count = await menu_service.bulk_create(objs=objs)
+    return await response_base.success(data=count)
+
+
+@router.put('/bulk', summary='批量更新菜单', dependencies=[Depends(RequestPermission('sys:menu:edit')), DependsRBAC])
+async def bulk_update_menu(objs: list[BulkUpdateMenuParam]) -> ResponseModel:
+    count = await menu_service.bulk_update(objs=objs)
+    return await response_base.success(data=count)
+
+
 @router.put('/{pk}',summary='更新菜单', dependencies=[Depends(RequestPermission('sys:menu:edit')), DependsRBAC])
 async def update_menu(pk: Annotated[int, Path(...)], obj: UpdateMenuParam) -> ResponseModel:
     count = await menu_service.update(pk=pk, obj=obj)
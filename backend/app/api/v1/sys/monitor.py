@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   monitor.py
+@Time    :   2024/05/25 11:02:47
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+from typing import Annotated, Literal
+
+from fastapi import APIRouter, Query
+
+from backend.app.common.response.response_schema import ResponseModel, response_base
+from backend.app.common.security.jwt import DependsJwtAuth
+from backend.app.common.security.rbac import DependsRBAC
+from backend.app.databases import pool_metrics, query_profiler
+
+router = APIRouter()
+
+@router.get('/db', summary='数据库连接池监控', dependencies=[DependsJwtAuth])
+async def get_db_pool_info() -> ResponseModel:
+    return await response_base.success(data=pool_metrics.snapshot())
+
+
+@router.get('/queries', summary='SQL 语句指纹统计', dependencies=[DependsJwtAuth])
+async def get_query_stats(
+    order_by: Annotated[
+        Literal['count', 'total_ms', 'avg_ms', 'p50_ms', 'p99_ms', 'max_ms', 'rows', 'n_plus_one'], Query()
+    ] = 'total_ms',
+    limit: Annotated[int, Query(gt=0, le=500)] = 50,
+) -> ResponseModel:
+    return await response_base.success(data=query_profiler.snapshot(order_by=order_by, limit=limit))
+
+
+@router.delete('/queries', summary='清空 SQL 语句指纹统计', dependencies=[DependsRBAC])
+async def reset_query_stats() -> ResponseModel:
+    query_profiler.reset()
+    return await response_base.success()
@@ -15,7 +15,7 @@ from backend.app.core.conf import settings
 from backend.app.common.security.jwt import DependsJwtAuth
 from backend.app.common.security.rbac import DependsRBAC
 from backend.app.common.security.permission import RequestPermission
-from backend.app.common.pagination import DependsPagination
+from backend.app.common.pagination import DependsPagination, CursorParams
 from backend.app.common.response.response_schema import ResponseModel, response_base
 from backend.app.schemas import (
     CreateUserParam, 
@@ -56,9 +56,20 @@ async def password_reset(request: Request, obj: ResetPasswordParam) -> ResponseM
 
 @router.get('/me', summary='获取当前用户信息', dependencies=[DependsJwtAuth], response_model_exclude={'password'})
 async def get_current_user(request: Request) -> ResponseModel:
-    data = GetCurrentUserInfoDetail(**await select_as_dict(request.user))
+    data = GetCurrentUserInfoDetail.model_validate(request.user)
     return await response_base.success(data=data)
 
+@router.get('/cursor', summary='（模糊条件）游标分页获取所有用户', dependencies=[DependsJwtAuth])
+async def get_cursor_pagination_users(
+    params: CursorParams,
+    dept: Annotated[Optional[int], Query()] = None,
+    username: Annotated[Optional[str], Query()] = None,
+    phone: Annotated[Optional[str], Query()] = None,
+    status: Annotated[Optional[int], Query()] = None,
+) -> ResponseModel:
+    page_data = await user_service.get_cursor_pagination(params=params, dept=dept, username=username, phone=phone, status=status)
+    return await response_base.success(data=page_data)
+
 @router.get('/{username}', summary='查看用户信息', dependencies=[DependsJwtAuth])
 async def get_user(username: Annotated[str, Path(...)]) -> ResponseModel:
     current_user = await user_service.get_userinfo(username=username)
@@ -1,3 +1,3 @@
 from .redis import redis_client
 from .object import SimpleDataCache
-from .memory import image_cache, custom_cache
\ No newline at end of file
+from .memory import image_cache, custom_cache, ip_location_cache
\ No newline at end of file
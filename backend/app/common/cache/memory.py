@@ -8,22 +8,29 @@
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
-from typing import Any
+from typing import Any, Optional
 from collections import OrderedDict
 from copy import deepcopy
 
+from backend.app.common.metrics import observe_cache
 from backend.app.core.conf import settings
 
 
 class LRUCache:
-    def __init__(self, capacity: int):
+    def __init__(self, capacity: int, name: Optional[str] = None):
         self.cache = OrderedDict()
         self.capacity = capacity
+        # 指定名称时记录命中指标
+        self.name = name
 
     def get(self, key: str) -> Any:
         if key not in self.cache:
+            if self.name:
+                observe_cache(self.name, False)
             return None
         else:
+            if self.name:
+                observe_cache(self.name, True)
             self.cache.move_to_end(key)
             return self.cache[key]
 
@@ -44,5 +51,6 @@ class ImageLRUCache(LRUCache):
         return cloned
 
 
-image_cache = ImageLRUCache(settings.MEMORY_LRU_CACHE_CAPACITY)
-custom_cache = LRUCache(settings.MEMORY_LRU_CACHE_CAPACITY)
\ No newline at end of file
+image_cache = ImageLRUCache(settings.MEMORY_LRU_CACHE_CAPACITY, 'image')
+custom_cache = LRUCache(settings.MEMORY_LRU_CACHE_CAPACITY, 'custom')
+ip_location_cache = LRUCache(settings.IP_LOCATION_LRU_CACHE_CAPACITY, 'ip_location')
\ No newline at end of file
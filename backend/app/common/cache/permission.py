@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   permission.py
+@Time    :   2024/05/26 14:08:31
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+import json
+from typing import Any, Iterable, NamedTuple, Optional, Sequence
+
+from backend.app.common.cache.redis import redis_client
+from backend.app.common.enums import StatusType
+from backend.app.common.metrics import observe_cache
+from backend.app.core.conf import settings
+
+
+class RolePermissions(NamedTuple):
+    enable: frozenset[str]
+    disable: frozenset[str]
+
+
+def _split_perms(perms: Optional[str]) -> list[str]:
+    return [perm.strip() for perm in perms.split(',') if perm.strip()] if perms else []
+
+
+class PermissionStore:
+    """
+    预计算的角色权限标识集合
+
+    角色或菜单变更后由 rebuild 计算每个角色启用与禁用的权限标识, 写入 redis 哈希并递增版本号;
+    各 worker 在进程内以 frozenset 保存, 版本号随 token 校验一并通过 MGET 读取, 变化时才重新读取哈希.
+    鉴权时只对用户的每个角色做一次集合成员判断
+    """
+
+    def __init__(self):
+        self.version_key = f'{settings.PERMISSION_REDIS_PREFIX}:version'
+        self._roles_key = f'{settings.PERMISSION_REDIS_PREFIX}:roles'
+        self._roles: dict[int, RolePermissions] = {}
+        self._version: Optional[str] = None
+        self._observed: Optional[str] = None
+
+    @staticmethod
+    def compute(menus: Iterable[Any]) -> RolePermissions:
+        """
+        根据角色的菜单计算权限标识集合
+
+        :param menus: 包含 perms、status 属性的菜单
+        :return:
+        """
+        enable, disable = set(), set()
+        for menu in menus:
+            (enable if menu.status == StatusType.enable else disable).update(_split_perms(menu.perms))
+        return RolePermissions(frozenset(enable), frozenset(disable))
+
+    def observe(self, version: Optional[str]) -> None:
+        """
+        记录认证时读取到的版本号
+
+        :param version:
+        :return:
+        """
+        self._observed = version or '0'
+
+    async def _sync(self) -> None:
+        version = self._observed
+        if version is None:
+            version = await redis_client.get(self.version_key) or '0'
+        if version == self._version:
+            return
+        data = await redis_client.hgetall(self._roles_key)
+        roles = {}
+        for role_id, value in data.items():
+            enable, disable = json.loads(value)
+            roles[int(role_id)] = RolePermissions(frozenset(enable), frozenset(disable))
+        self._roles = roles
+        self._version = version
+
+    async def get_roles(self, roles: Sequence[Any]) -> list[RolePermissions]:
+        """
+        获取角色的权限标识集合
+
+        尚未预计算的角色(如 redis 数据丢失)根据认证用户中已加载的菜单计算, 不访问数据库
+
+        :param roles: 包含 id、menus 属性的角色
+        :return:
+        """
+        await self._sync()
+        result = []
+        for role in roles:
+            perms = self._roles.get(role.id)
+            observe_cache('permission', perms is not None)
+            result.append(perms or self.compute(role.menus))
+        return result
+
+    async def exists(self) -> bool:
+        """
+        redis 中是否已有预计算结果, 首次部署或 redis 数据丢失时为 False
+
+        :return:
+        """
+        return await redis_client.exists(self.version_key, self._roles_key) == 2
+
+    async def rebuild(self, rows: Iterable[tuple[int, Optional[str], int]]) -> None:
+        """
+        重新计算所有角色的权限标识集合, 在角色菜单或菜单变更的事务提交后调用
+
+        :param rows: (角色 id, 菜单权限标识, 菜单状态)
+        :return:
+        """
+        enable: dict[int, set[str]] = {}
+        disable: dict[int, set[str]] = {}
+        for role_id, perms, status in rows:
+            enable.setdefault(role_id, set())
+            disable.setdefault(role_id, set())
+            (enable if status == StatusType.enable else disable)[role_id].update(_split_perms(perms))
+        mapping = {
+            role_id: json.dumps([sorted(enable[role_id]), sorted(disable[role_id])], ensure_ascii=False)
+            for role_id in enable
+        }
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(self._roles_key)
+            if mapping:
+                pipe.hset(self._roles_key, mapping=mapping)
+            pipe.incr(self.version_key)
+            await pipe.execute()
+        self._version = None
+
+
+permission_store = PermissionStore()
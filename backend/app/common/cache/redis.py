@@ -9,24 +9,88 @@
 @Desc    :   None
 '''
 from typing import Optional, Union
+import re
 import sys
+import time
 from redis.asyncio.client import Redis
 from redis.exceptions import AuthenticationError, TimeoutError
 
 from backend.app.common.log import log
+from backend.app.common.metrics import redis_command_duration
+from backend.app.common.tracing import SPAN_KIND_CLIENT, end_span, start_span
 from backend.app.core.conf import settings
 
+# glob 特殊字符, SCAN MATCH 时需要转义
+_GLOB_ESCAPE = re.compile(r'[\\*?\[\]]')
+
+# 清理索引中已过期的成员, 索引的过期时间不早于其中最晚过期的成员
+_INDEX_EXPIRE_LUA = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+local last = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+if last[2] == 'inf' then
+    redis.call('PERSIST', KEYS[1])
+elseif last[2] then
+    redis.call('EXPIREAT', KEYS[1], math.ceil(tonumber(last[2])))
+end
+"""
+
+# 写入 key 并登记到有序集合索引
+_SET_INDEXED_LUA = """
+local now = tonumber(ARGV[3])
+if ARGV[2] == '' then
+    redis.call('SET', KEYS[2], ARGV[1])
+    redis.call('ZADD', KEYS[1], '+inf', KEYS[2])
+else
+    local ex = tonumber(ARGV[2])
+    redis.call('SET', KEYS[2], ARGV[1], 'EX', ex)
+    redis.call('ZADD', KEYS[1], now + ex, KEYS[2])
+end
+""" + _INDEX_EXPIRE_LUA
+
+# 将已存在的 key 按剩余过期时间登记到索引, 已登记的不变
+_BACKFILL_INDEX_LUA = """
+local now = tonumber(ARGV[1])
+local ttl = redis.call('TTL', KEYS[2])
+if ttl == -2 then
+    return 0
+elseif ttl == -1 then
+    redis.call('ZADD', KEYS[1], 'NX', '+inf', KEYS[2])
+else
+    redis.call('ZADD', KEYS[1], 'NX', now + ttl, KEYS[2])
+end
+""" + _INDEX_EXPIRE_LUA
+
 
 class RedisCli(Redis):
-    def __init__(self):
+    def __init__(self, **kwargs):
         super(RedisCli, self).__init__(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            password=settings.REDIS_PASSWORD,
-            db=settings.REDIS_DATABASE,
-            socket_timeout=settings.REDIS_TIMEOUT,
-            decode_responses=True,  # 转码 utf-8
+            **{
+                'host': settings.REDIS_HOST,
+                'port': settings.REDIS_PORT,
+                'password': settings.REDIS_PASSWORD,
+                'db': settings.REDIS_DATABASE,
+                'socket_timeout': settings.REDIS_TIMEOUT,
+                'decode_responses': True,  # 转码 utf-8
+                **kwargs,
+            }
         )
+        self._set_indexed_script = self.register_script(_SET_INDEXED_LUA)
+        self._backfill_index_script = self.register_script(_BACKFILL_INDEX_LUA)
+
+    async def execute_command(self, *args, **options):
+        # pipeline 的命令不经过此方法, 不单独计时
+        command = str(args[0]).upper()
+        handle = start_span('redis', kind=SPAN_KIND_CLIENT, **{'db.operation': command})
+        start = time.perf_counter()
+        error = None
+        try:
+            return await super().execute_command(*args, **options)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            redis_command_duration.labels(command).observe(time.perf_counter() - start)
+            end_span(handle, error)
 
     async def startup(self):
         """
@@ -49,26 +113,114 @@ class RedisCli(Redis):
     async def shutdown(self):
         await self.close()
 
-    async def delete_prefix(self, prefix: str, exclude: Optional[Union[str, list]] = None):
+    @staticmethod
+    def index_key(prefix: str) -> str:
+        """
+        前缀索引的 key, 索引为有序集合, 成员为该前缀下的 key, 分值为过期时间戳
+
+        :param prefix:
+        :return:
+        """
+        return f'{prefix}:index'
+
+    async def set_indexed(self, prefix: str, name: str, value: str, ex: Optional[int] = None) -> None:
+        """
+        写入 key 并登记到前缀索引, 以便通过 delete_indexed 按前缀删除
+
+        :param prefix: 索引前缀, name 应以该前缀开头
+        :param name:
+        :param value:
+        :param ex: 过期时间，单位：秒
+        :return:
+        """
+        await self._set_indexed_script(
+            keys=[self.index_key(prefix), name], args=[value, ex or '', time.time()]
+        )
+
+    async def backfill_index(self, prefix: str, batch: int = 500) -> bool:
+        """
+        将 prefix 下未经 set_indexed 写入的 key 登记到各自的前缀索引, key 格式为 {prefix}:{owner}:..., 索引前缀为 {prefix}:{owner}
+
+        用于启用前缀索引之前写入的 key, 否则 delete_indexed 无法删除; 以 SCAN 遍历一次, 多个进程中只有一个执行,
+        中途退出时标记过期后重新执行
+
+        :param prefix:
+        :param batch:
+        :return: 是否执行
+        """
+        marker = f'{prefix}_index_backfill'
+        if not await self.set(marker, 'running', nx=True, ex=600):
+            return False
+        match = _GLOB_ESCAPE.sub(r'\\\g<0>', prefix) + ':*'
+        keys = []
+        async for key in self.scan_iter(match=match, count=batch):
+            owner, sep, rest = key[len(prefix) + 1 :].partition(':')
+            if sep and rest != 'index':
+                keys.append((self.index_key(f'{prefix}:{owner}'), key))
+            if len(keys) >= batch:
+                await self._backfill_index(keys)
+                keys.clear()
+        if len(keys) > 0:
+            await self._backfill_index(keys)
+        await self.set(marker, 'done')
+        return True
+
+    async def _backfill_index(self, keys: list[tuple[str, str]]) -> None:
+        now = time.time()
+        async with self.pipeline(transaction=False) as pipe:
+            for index, key in keys:
+                await self._backfill_index_script(keys=[index, key], args=[now], client=pipe)
+            await pipe.execute()
+
+    async def delete_indexed(self, prefix: str, exclude: Optional[Union[str, list]] = None, batch: int = 500) -> None:
+        """
+        删除前缀索引中登记的所有key, 复杂度只与该前缀下的 key 数量相关; 启用索引之前写入的 key 需先经 backfill_index 登记
+
+        :param prefix:
+        :param exclude:
+        :param batch:
+        :return:
+        """
+        index = self.index_key(prefix)
+        excludes = self._excludes(exclude)
+        keys = [key for key in await self.zrange(index, 0, -1) if key not in excludes]
+        async with self.pipeline(transaction=False) as pipe:
+            for i in range(0, len(keys), batch):
+                chunk = keys[i : i + batch]
+                pipe.unlink(*chunk)
+                pipe.zrem(index, *chunk)
+            await pipe.execute()
+
+    async def delete_prefix(self, prefix: str, exclude: Optional[Union[str, list]] = None, batch: int = 500):
         """
         删除指定前缀的所有key
 
+        通过 SCAN 分批遍历并 UNLINK, 不会长时间阻塞 redis; 已登记索引的前缀应优先使用 delete_indexed
+
         :param prefix:
         :param exclude:
+        :param batch:
         :return:
         """
+        excludes = self._excludes(exclude)
+        match = _GLOB_ESCAPE.sub(r'\\\g<0>', prefix) + '*'
         keys = []
-        for key in await self.keys(f'{prefix}*'):
-            if isinstance(exclude, str):
-                if key != exclude:
-                    keys.append(key)
-            elif isinstance(exclude, list):
-                if key not in exclude:
-                    keys.append(key)
-            else:
+        async for key in self.scan_iter(match=match, count=batch):
+            if key not in excludes:
                 keys.append(key)
+            if len(keys) >= batch:
+                await self.unlink(*keys)
+                keys.clear()
         if len(keys) > 0:
-            await self.delete(*keys)
+            await self.unlink(*keys)
+
+    @staticmethod
+    def _excludes(exclude: Optional[Union[str, list]]) -> set:
+        if isinstance(exclude, str):
+            return {exclude}
+        elif isinstance(exclude, list):
+            return set(exclude)
+        return set()
 
 
 # 创建 redis 客户端实例
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   tree.py
+@Time    :   2024/05/24 15:36:20
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+from backend.app.common.cache.redis import redis_client
+from backend.app.common.metrics import observe_cache
+from backend.app.core.conf import settings
+from backend.app.utils.build_tree import TreeIndex
+from backend.app.utils.serializers import RowData, serialize_rows
+
+
+class TreeCache:
+    """
+    进程内的树形结构缓存
+
+    缓存的索引与完整树带有 redis 中的版本号, 任一 worker 调用 invalidate 后所有 worker 在下次读取时重新加载
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._version_key = f'{settings.TREE_REDIS_PREFIX}:{name}:version'
+        self._version: Optional[str] = None
+        self._index: Optional[TreeIndex] = None
+        self._tree: Optional[list[dict[str, Any]]] = None
+
+    async def get_index(self, loader: Callable[[], Awaitable[Sequence[RowData]]]) -> TreeIndex:
+        """
+        获取树形结构索引
+
+        :param loader: 加载全部节点
+        :return:
+        """
+        # 先读取版本号再加载, 加载期间发生的变更会使下次读取重新加载
+        version = await redis_client.get(self._version_key) or '0'
+        hit = self._index is not None and version == self._version
+        observe_cache(f'{self.name}_tree', hit)
+        if not hit:
+            rows = await loader()
+            self._index = TreeIndex(serialize_rows(rows))
+            self._tree = None
+            self._version = version
+        return self._index
+
+    async def get_tree(self, loader: Callable[[], Awaitable[Sequence[RowData]]]) -> list[dict[str, Any]]:
+        """
+        获取完整的树, 返回值为共享的缓存对象, 调用方不应修改
+
+        :param loader: 加载全部节点
+        :return:
+        """
+        index = await self.get_index(loader)
+        if self._tree is None:
+            self._tree = index.to_tree()
+        return self._tree
+
+    async def invalidate(self) -> None:
+        """
+        使缓存失效, 在节点新增、修改、删除后调用
+
+        :return:
+        """
+        self._index = None
+        self._tree = None
+        await redis_client.incr(self._version_key)
+
+
+menu_tree_cache = TreeCache('menu')
+dept_tree_cache = TreeCache('dept')
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   metrics.py
+@Time    :   2024/05/27 09:32:16
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+
+gunicorn 多进程部署时, 启动前设置环境变量 PROMETHEUS_MULTIPROC_DIR 为一个清空的目录, 并在 gunicorn 配置中添加:
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+'''
+import os
+import time
+from typing import Any
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.requests import Request
+from starlette.responses import Response
+
+# 进程内的 redis、casbin 等操作耗时较短, 使用更细的桶
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+http_request_duration = Histogram(
+    'http_request_duration_seconds',
+    '请求耗时',
+    ['route', 'method', 'status'],
+)
+db_statement_duration = Histogram(
+    'db_statement_duration_seconds',
+    'SQL 语句执行耗时',
+    ['engine', 'operation'],
+    buckets=FAST_BUCKETS,
+)
+redis_command_duration = Histogram(
+    'redis_command_duration_seconds',
+    'redis 命令耗时',
+    ['command'],
+    buckets=FAST_BUCKETS,
+)
+casbin_enforce_duration = Histogram(
+    'casbin_enforce_duration_seconds',
+    'casbin 鉴权耗时',
+    buckets=FAST_BUCKETS,
+)
+cache_requests = Counter(
+    'cache_requests_total',
+    '缓存读取次数',
+    ['cache', 'result'],
+)
+
+_SQL_OPERATIONS = frozenset({'select', 'insert', 'update', 'delete', 'replace', 'with'})
+
+
+def observe_cache(cache: str, hit: bool) -> None:
+    """
+    记录一次缓存读取
+
+    :param cache: 缓存名称
+    :param hit: 是否命中
+    :return:
+    """
+    cache_requests.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def _operation(statement: str) -> str:
+    parts = statement.split(None, 1)
+    operation = parts[0].lower() if parts else ''
+    return operation if operation in _SQL_OPERATIONS else 'other'
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """
+    通过引擎事件记录 SQL 语句耗时, 按语句类型统计, 不包含取连接的等待时间
+
+    :param engine: 同步引擎, 异步引擎传入 async_engine.sync_engine
+    :param name: 引擎名称, 如 primary / replica
+    :return:
+    """
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany) -> None:
+        start = conn.info['metrics_query_start'].pop()
+        db_statement_duration.labels(name, _operation(statement)).observe(time.perf_counter() - start)
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(context) -> None:
+        starts = context.connection.info.get('metrics_query_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+def generate_metrics() -> tuple[bytes, str]:
+    """
+    生成指标文本, 设置了 PROMETHEUS_MULTIPROC_DIR 时汇总所有 worker 进程的指标
+
+    :return: 内容与 content type
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def metrics_endpoint(request: Request) -> Any:
+    """
+    prometheus 抓取接口, 多进程模式下需要读取指标文件, 以同步接口在线程池中执行
+
+    :param request:
+    :return:
+    """
+    content, content_type = generate_metrics()
+    return Response(content, media_type=content_type)
@@ -10,22 +10,36 @@
 '''
 from __future__ import annotations
 
+import base64
+import hashlib
+import json
 import math
-from typing import TypeVar, Generic, Sequence, Dict, TYPE_CHECKING, Union, Optional, Any
+from datetime import datetime
+from typing import TypeVar, Generic, Sequence, Dict, TYPE_CHECKING, Union, Optional, Any, Literal, Annotated
 from fastapi import Query, Depends
-from fastapi_pagination import pagination_ctx
+from fastapi_pagination import pagination_ctx, resolve_params
 from fastapi_pagination.bases import AbstractPage, AbstractParams, RawParams
-from fastapi_pagination.ext.sqlalchemy import paginate
+from fastapi_pagination.ext.sqlalchemy import count_query, paginate_query
+from fastapi_pagination.ext.utils import unwrap_scalars
 from fastapi_pagination.links.bases import create_links
 from pydantic import BaseModel
+from sqlalchemy import Table, and_, or_, text
+
+from backend.app.core.conf import settings
+from backend.app.common.cache.redis import redis_client
+from backend.app.common.metrics import observe_cache
+from backend.app.common.tracing import span
+from backend.app.common.exception import errors
 
 if TYPE_CHECKING:
     from sqlalchemy import Select
     from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import InstrumentedAttribute
 
 T = TypeVar('T')
 DataT = TypeVar('DataT')
 SchemaT = TypeVar('SchemaT')
+CountMode = Literal['exact', 'cached', 'estimated']
 
 
 class _Params(BaseModel, AbstractParams):
@@ -48,6 +62,7 @@ class _Page(AbstractPage[T], Generic[T]):
     size: int  # 每页数量
     total_pages: int  # 总页数
     links: Dict[str, Optional[str]]  # 跳转链接
+    count_mode: CountMode = 'exact'  # 总数的统计方式
 
     __params_type__ = _Params  # 使用自定义的Params
 
@@ -57,6 +72,8 @@ class _Page(AbstractPage[T], Generic[T]):
         items: Sequence[T],
         total: int,
         params: _Params,
+        *,
+        count_mode: CountMode = 'exact',
     ) -> _Page[T]:
         page = params.page
         size = params.size
@@ -70,26 +87,212 @@ class _Page(AbstractPage[T], Generic[T]):
             }
         ).model_dump()
 
-        return cls(items=items, total=total, page=params.page, size=params.size, total_pages=total_pages, links=links)
+        return cls(
+            items=items,
+            total=total,
+            page=params.page,
+            size=params.size,
+            total_pages=total_pages,
+            links=links,
+            count_mode=count_mode,
+        )
 
 
 class _PageData(BaseModel, Generic[DataT]):
     page_data: Optional[DataT] = None
 
 
-async def paging_data(db: AsyncSession, select: Select, page_data_schema: SchemaT) -> dict:
+async def _exact_count(db: AsyncSession, select: Select) -> int:
+    return await db.scalar(count_query(select))
+
+
+async def _cached_count(db: AsyncSession, select: Select) -> int:
+    # 以编译后的语句与绑定参数作为过滤条件的规范化表示
+    compiled = select.order_by(None).compile(dialect=db.bind.dialect)
+    material = f'{compiled.string}|{sorted(compiled.params.items(), key=lambda x: x[0])!r}'
+    key = f'{settings.PAGINATION_COUNT_REDIS_PREFIX}:{hashlib.md5(material.encode()).hexdigest()}'
+    total = await redis_client.get(key)
+    observe_cache('pagination_count', total is not None)
+    if total is not None:
+        return int(total)
+    total = await _exact_count(db, select)
+    await redis_client.set(key, total, ex=settings.PAGINATION_COUNT_EXPIRE_SECONDS)
+    return total
+
+
+async def _estimated_count(db: AsyncSession, select: Select) -> Optional[int]:
+    # 仅无过滤条件的单表查询可以使用表统计信息, 其他情况返回 None
+    froms = select.get_final_froms()
+    if db.bind.dialect.name != 'mysql' or select.whereclause is not None or len(froms) != 1:
+        return None
+    table = froms[0]
+    if not isinstance(table, Table):
+        return None
+    return await db.scalar(
+        text(
+            'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name'
+        ),
+        {'name': table.name},
+    )
+
+
+async def count_total(db: AsyncSession, select: Select, count_mode: CountMode) -> tuple[int, CountMode]:
+    """
+    按统计方式获取查询总数
+
+    exact: 每次执行 COUNT(*);
+    cached: 以过滤条件的哈希为键在 redis 中缓存 COUNT(*) 结果, 在 PAGINATION_COUNT_EXPIRE_SECONDS 内可能滞后;
+    estimated: 无过滤条件时使用 information_schema 中的表行数估计值, 有过滤条件或估计值小于
+    PAGINATION_COUNT_ESTIMATE_THRESHOLD 时分别退回 cached 与 exact
+
+    :param db:
+    :param select:
+    :param count_mode:
+    :return: 总数与实际使用的统计方式
+    """
+    if count_mode == 'estimated':
+        total = await _estimated_count(db, select)
+        if total is None:
+            count_mode = 'cached'
+        elif total < settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD:
+            count_mode = 'exact'
+        else:
+            return total, count_mode
+    if count_mode == 'cached':
+        return await _cached_count(db, select), count_mode
+    return await _exact_count(db, select), 'exact'
+
+
+async def paging_data(
+    db: AsyncSession, select: Select, page_data_schema: SchemaT, *, count_mode: Optional[CountMode] = None
+) -> dict:
     """
     基于 SQLAlchemy 创建分页数据
 
     :param db:
     :param select:
     :param page_data_schema:
+    :param count_mode: 总数的统计方式, 默认为 PAGINATION_COUNT_MODE
     :return:
     """
-    _paginate = await paginate(db, select)
+    params: _Params = resolve_params()
+    with span('paging.count'):
+        total, count_mode = await count_total(db, select, count_mode or settings.PAGINATION_COUNT_MODE)
+    with span('paging.select'):
+        result = await db.execute(paginate_query(select, params))
+        items = unwrap_scalars(result.unique().all())
+    _paginate = _Page[page_data_schema].create(items, total, params, count_mode=count_mode)
     page_data = _PageData[_Page[page_data_schema]](page_data=_paginate).model_dump()['page_data']
     return page_data
 
 
+class _CursorParams(BaseModel):
+    cursor: Optional[str] = Query(None, description='Page cursor')
+    size: int = Query(20, gt=0, le=100, description='Page size')  # 默认 20 条记录
+    with_total: bool = Query(False, description='Count total')  # 统计总数需要额外的 COUNT(*)
+
+
+class _CursorPage(BaseModel, Generic[T]):
+    items: Sequence[T]  # 数据
+    total: Optional[int] = None  # 总数据数, 未统计时为空
+    size: int  # 每页数量
+    next_cursor: Optional[str] = None  # 下一页游标
+    prev_cursor: Optional[str] = None  # 上一页游标
+
+
+def encode_cursor(direction: Literal['next', 'prev'], values: Sequence[Any]) -> str:
+    """
+    编码游标
+
+    :param direction: 翻页方向
+    :param values: 边界行的排序键
+    :return:
+    """
+    payload = [direction, *(v.isoformat() if isinstance(v, datetime) else v for v in values)]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, keys: Sequence[InstrumentedAttribute]) -> tuple[str, list[Any]]:
+    """
+    解码游标
+
+    :param cursor:
+    :param keys: 排序键
+    :return:
+    """
+    try:
+        direction, *values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if direction not in ('next', 'prev') or len(values) != len(keys):
+            raise ValueError(cursor)
+        values = [
+            datetime.fromisoformat(v) if key.type.python_type is datetime else key.type.python_type(v)
+            for key, v in zip(keys, values)
+        ]
+    except Exception:
+        raise errors.RequestError(msg='无效的分页游标')
+    return direction, values
+
+
+def _seek_condition(keys: Sequence[InstrumentedAttribute], values: Sequence[Any], *, after: bool):
+    # (k1, k2, ...) < (v1, v2, ...) 展开为 k1 < v1 OR (k1 = v1 AND k2 < v2) ..., 以便 MySQL 走范围索引
+    conditions = []
+    for i, (key, value) in enumerate(zip(keys, values)):
+        bound = key > value if after else key < value
+        conditions.append(and_(*(k == v for k, v in zip(keys[:i], values[:i])), bound))
+    return or_(*conditions)
+
+
+async def cursor_paging_data(
+    db: AsyncSession,
+    select: Select,
+    page_data_schema: SchemaT,
+    *,
+    params: _CursorParams,
+    keys: Sequence[InstrumentedAttribute],
+) -> dict:
+    """
+    基于 SQLAlchemy 创建游标(keyset)分页数据
+
+    按 keys 降序排列, 通过上一页边界行的排序键定位下一页, 耗时与页码无关; 总数仅在 with_total 时统计
+
+    :param db:
+    :param select: 查询语句, 原有排序会被 keys 替换
+    :param page_data_schema:
+    :param params:
+    :param keys: 唯一确定顺序的排序键, 最后一个通常为主键
+    :return:
+    """
+    direction, values = decode_cursor(params.cursor, keys) if params.cursor else ('next', None)
+    backward = direction == 'prev'
+    stmt = select.order_by(None).order_by(*(key.asc() if backward else key.desc() for key in keys))
+    if values is not None:
+        stmt = stmt.where(_seek_condition(keys, values, after=backward))
+    rows = list((await db.scalars(stmt.limit(params.size + 1))).all())
+    has_more = len(rows) > params.size
+    rows = rows[:params.size]
+    if backward:
+        rows.reverse()
+
+    def boundary(row: Any) -> list[Any]:
+        return [getattr(row, key.key) for key in keys]
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if backward or has_more:
+            next_cursor = encode_cursor('next', boundary(rows[-1]))
+        if (not backward and params.cursor) or (backward and has_more):
+            prev_cursor = encode_cursor('prev', boundary(rows[0]))
+    total = None
+    if params.with_total:
+        total = await _exact_count(db, select)
+    page = _CursorPage[page_data_schema](
+        items=rows, total=total, size=params.size, next_cursor=next_cursor, prev_cursor=prev_cursor
+    )
+    return page.model_dump()
+
+
 # 分页依赖注入
-DependsPagination = Depends(pagination_ctx(_Page))
\ No newline at end of file
+DependsPagination = Depends(pagination_ctx(_Page))
+
+# 游标分页参数
+CursorParams = Annotated[_CursorParams, Depends()]
\ No newline at end of file
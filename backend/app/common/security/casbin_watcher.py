@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   casbin_watcher.py
+@Time    :   2024/05/20 10:12:36
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+import asyncio
+import os
+from typing import Optional
+from uuid import uuid4
+
+import msgspec
+from redis.asyncio.client import PubSub
+
+from backend.app.common.cache.redis import redis_client
+from backend.app.common.log import log
+from backend.app.common.security.rbac import rbac
+from backend.app.core.conf import settings
+
+
+class CasbinRedisWatcher:
+    """
+    基于 redis pub/sub 的 casbin 策略变更广播
+
+    每个 worker 订阅同一频道, 收到其他 worker 的变更事件后增量更新本进程的内存模型
+    """
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._task: Optional[asyncio.Task] = None
+        self._pubsub: Optional[PubSub] = None
+        # 当前 worker 标识, 用于忽略自身发布的消息; 在 fork 出的 worker 进程中启动时生成
+        self.worker_id: Optional[str] = None
+
+    async def startup(self):
+        """
+        启动订阅
+
+        :return:
+        """
+        if self._task is None:
+            self.worker_id = f'{os.getpid()}:{uuid4().hex}'
+            self._task = asyncio.create_task(self._listen())
+
+    async def shutdown(self):
+        """
+        停止订阅
+
+        :return:
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def notify(
+        self,
+        op: str,
+        sec: str,
+        ptype: str,
+        *,
+        rules: Optional[list[list[str]]] = None,
+        new_rules: Optional[list[list[str]]] = None,
+        field_index: int = 0,
+        field_values: Optional[list[str]] = None,
+        apply_local: bool = False,
+    ) -> None:
+        """
+        广播策略变更事件
+
+        :param op: add / remove / update / remove_filtered / reload
+        :param sec:
+        :param ptype:
+        :param rules:
+        :param new_rules:
+        :param field_index:
+        :param field_values:
+        :param apply_local: 变更未经过本进程执行器时(例如直接操作数据库), 同时应用到本进程
+        :return:
+        """
+        event = dict(
+            op=op,
+            sec=sec,
+            ptype=ptype,
+            rules=rules,
+            new_rules=new_rules,
+            field_index=field_index,
+            field_values=field_values,
+        )
+        if apply_local:
+            rbac.apply_policy_change(**event)
+        else:
+            # 变更已由本进程执行器写入内存模型, 仅需丢弃预编译索引
+            rbac.invalidate_index()
+        try:
+            await redis_client.publish(self.channel, msgspec.json.encode({'worker': self.worker_id, **event}))
+        except Exception as e:
+            log.error(f'casbin 策略变更广播失败: {e}')
+
+    async def _listen(self):
+        while True:
+            try:
+                self._pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                await self._pubsub.subscribe(self.channel)
+                # 订阅建立前(或断线期间)的变更可能已丢失, 全量重新加载一次
+                rbac.bump_policy_version()
+                while True:
+                    message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message:
+                        self._on_message(message['data'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error(f'casbin 策略订阅异常, 稍后重连: {e}')
+                await asyncio.sleep(1)
+            finally:
+                if self._pubsub is not None:
+                    try:
+                        await self._pubsub.reset()
+                    except Exception:
+                        pass
+                    self._pubsub = None
+
+    def _on_message(self, data: str) -> None:
+        try:
+            event = msgspec.json.decode(data)
+        except msgspec.DecodeError:
+            log.warning(f'无法解析的 casbin 策略变更消息: {data}')
+            return
+        if event.pop('worker', None) == self.worker_id:
+            return
+        try:
+            rbac.apply_policy_change(**event)
+        except Exception as e:
+            log.error(f'casbin 策略增量更新失败, 回退为全量加载: {e}')
+            rbac.bump_policy_version()
+
+
+casbin_watcher = CasbinRedisWatcher(settings.CASBIN_WATCHER_CHANNEL)
@@ -21,8 +21,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from backend.app.common.exception.errors import AuthorizationError, TokenError
 from backend.app.core.conf import settings
 from backend.app.common.cache.redis import redis_client
+from backend.app.common.cache.permission import permission_store
+from backend.app.common.security.principal import UserSnapshot, principal_cache
+from backend.app.common.tracing import traced
 from backend.app.utils.timezone import timezone
-from backend.app.databases.mysql import async_session
+from backend.app.databases import uow
+from backend.app.databases.mysql import async_session, read_router
 from backend.app.models import User
 from backend.app.crud.crud_user import user_dao
 
@@ -73,11 +77,11 @@ async def create_access_token(sub: str, expires_delta: Optional[timedelta] = Non
     multi_login = kwargs.pop('multi_login', None)
     to_encode = {'exp': expire, 'sub': sub, **kwargs}
     token = jwt.encode(to_encode, settings.TOKEN_SECRET_KEY, settings.TOKEN_ALGORITHM)
+    prefix = f'{settings.TOKEN_REDIS_PREFIX}:{sub}'
     if multi_login is False:
-        prefix = f'{settings.TOKEN_REDIS_PREFIX}:{sub}:'
-        await redis_client.delete_prefix(prefix)
-    key = f'{settings.TOKEN_REDIS_PREFIX}:{sub}:{token}'
-    await redis_client.setex(key, expire_seconds, token)
+        await redis_client.delete_indexed(prefix)
+    key = f'{prefix}:{token}'
+    await redis_client.set_indexed(prefix, key, token, ex=expire_seconds)
     return token, expire
 
 
@@ -102,11 +106,11 @@ async def create_refresh_token(sub: str, expire_time: Optional[datetime] = None,
     multi_login = kwargs.pop('multi_login', None)
     to_encode = {'exp': expire, 'sub': sub, **kwargs}
     refresh_token = jwt.encode(to_encode, settings.TOKEN_SECRET_KEY, settings.TOKEN_ALGORITHM)
+    prefix = f'{settings.TOKEN_REFRESH_REDIS_PREFIX}:{sub}'
     if multi_login is False:
-        prefix = f'{settings.TOKEN_REFRESH_REDIS_PREFIX}:{sub}:'
-        await redis_client.delete_prefix(prefix)
-    key = f'{settings.TOKEN_REFRESH_REDIS_PREFIX}:{sub}:{refresh_token}'
-    await redis_client.setex(key, expire_seconds, refresh_token)
+        await redis_client.delete_indexed(prefix)
+    key = f'{prefix}:{refresh_token}'
+    await redis_client.set_indexed(prefix, key, refresh_token, ex=expire_seconds)
     return refresh_token, expire
 
 
@@ -165,7 +169,8 @@ def jwt_decode(token: str) -> int:
     return user_id
 
 
-async def jwt_authentication(token: str) -> User:
+@traced('jwt_authentication')
+async def jwt_authentication(token: str) -> UserSnapshot:
     """
     JWT authentication，在jwt_decode的基础上验证token的有效时间
 
@@ -174,20 +179,25 @@ async def jwt_authentication(token: str) -> User:
         header中的Bear token
     ---
     returns
-    + user: User
-        返回user对象
+    + user: UserSnapshot
+        返回用户快照, 命中进程内缓存时不访问数据库
     """
     user_id = await jwt_decode(token)
     key = f'{settings.TOKEN_REDIS_PREFIX}:{user_id}:{token}'
-    token_verify = await redis_client.get(key)
+    version_keys = principal_cache.version_keys(user_id)
+    token_verify, permission_version, *values = await redis_client.mget(
+        key, permission_store.version_key, *version_keys, *read_router.sticky_keys(user_id)
+    )
     if not token_verify:
         raise TokenError(msg='token 已过期')
-    async with async_session() as db:
-        user = await get_current_user_with_relation(db, user_id)
-    if not user:
-        raise TokenError(msg='token 无效')
-    if not user.status:
-        raise AuthorizationError(msg='用户已锁定')
+    permission_store.observe(permission_version)
+    read_router.bind(user_id, sticky=any(values[len(version_keys):]))
+    version = principal_cache.make_version(*values[:len(version_keys)])
+    user = principal_cache.get(user_id, version)
+    if user is None:
+        async with uow.primary_session(async_session) as db:
+            user = UserSnapshot.from_model(await get_current_user_with_relation(db, user_id))
+        principal_cache.put(user_id, version, user)
     return user
 
 async def get_current_user_with_relation(db: AsyncSession, user_id: int) -> User:
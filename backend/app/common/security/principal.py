@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   principal.py
+@Time    :   2024/05/22 09:46:11
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Any, Optional
+
+from backend.app.common.cache.redis import redis_client
+from backend.app.common.metrics import observe_cache
+from backend.app.core.conf import settings
+
+
+def _columns(cls, obj: Any, **kwargs) -> dict[str, Any]:
+    data = {f.name: getattr(obj, f.name) for f in fields(cls) if f.name not in kwargs}
+    data.update(kwargs)
+    return data
+
+
+@dataclass(frozen=True, slots=True)
+class MenuSnapshot:
+    id: int
+    title: str
+    name: str
+    level: int
+    sort: int
+    icon: Optional[str]
+    path: Optional[str]
+    menu_type: int
+    component: Optional[str]
+    perms: Optional[str]
+    status: int
+    show: int
+    cache: int
+    remark: Optional[str]
+    parent_id: Optional[int]
+    create_time: datetime
+    update_time: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, menu) -> 'MenuSnapshot':
+        return cls(**_columns(cls, menu))
+
+
+@dataclass(frozen=True, slots=True)
+class RoleSnapshot:
+    id: int
+    name: str
+    data_scope: Optional[int]
+    status: int
+    remark: Optional[str]
+    create_time: datetime
+    update_time: Optional[datetime]
+    menus: tuple[MenuSnapshot, ...]
+
+    @classmethod
+    def from_model(cls, role) -> 'RoleSnapshot':
+        return cls(**_columns(cls, role, menus=tuple(MenuSnapshot.from_model(m) for m in role.menus)))
+
+
+@dataclass(frozen=True, slots=True)
+class DeptSnapshot:
+    id: int
+    name: str
+    level: int
+    sort: int
+    leader: Optional[str]
+    phone: Optional[str]
+    email: Optional[str]
+    status: int
+    del_flag: bool
+    parent_id: Optional[int]
+    create_time: datetime
+    update_time: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, dept) -> 'DeptSnapshot':
+        return cls(**_columns(cls, dept))
+
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    """
+    已认证用户的只读快照, 作为 request.user 使用, 字段与 User 模型及其 dept / roles / menus 关系保持一致
+    """
+
+    id: int
+    uuid: str
+    username: str
+    nickname: Optional[str]
+    password: str
+    salt: Optional[str]
+    email: str
+    is_superuser: bool
+    status: int
+    avatar: Optional[str]
+    phone: Optional[str]
+    join_time: datetime
+    last_login_time: Optional[datetime]
+    dept_id: Optional[int]
+    dept: Optional[DeptSnapshot]
+    roles: tuple[RoleSnapshot, ...]
+
+    @classmethod
+    def from_model(cls, user) -> 'UserSnapshot':
+        return cls(
+            **_columns(
+                cls,
+                user,
+                dept=DeptSnapshot.from_model(user.dept) if user.dept else None,
+                roles=tuple(RoleSnapshot.from_model(r) for r in user.roles),
+            )
+        )
+
+
+class PrincipalCache:
+    """
+    进程内的认证用户缓存
+
+    缓存项带有 redis 中的版本号, 版本号随 token 校验一并通过 MGET 读取, 不增加额外的往返;
+    任一 worker 调用 evict / evict_all 后, 所有 worker 上的旧缓存立即失效, TTL 作为兜底
+    """
+
+    def __init__(self, capacity: int, expire_seconds: int):
+        self.capacity = capacity
+        self.expire_seconds = expire_seconds
+        self._cache: OrderedDict[int, tuple[float, str, UserSnapshot]] = OrderedDict()
+        self._global_key = f'{settings.PRINCIPAL_REDIS_PREFIX}:version'
+
+    def version_keys(self, user_id: int) -> tuple[str, str]:
+        """
+        缓存版本号在 redis 中的键
+
+        :param user_id:
+        :return:
+        """
+        return f'{settings.PRINCIPAL_REDIS_PREFIX}:version:{user_id}', self._global_key
+
+    @staticmethod
+    def make_version(*versions: Optional[str]) -> str:
+        return ':'.join(v or '0' for v in versions)
+
+    def get(self, user_id: int, version: str) -> Optional[UserSnapshot]:
+        """
+        获取缓存
+
+        :param user_id:
+        :param version:
+        :return:
+        """
+        item = self._cache.get(user_id)
+        if item is None:
+            observe_cache('principal', False)
+            return None
+        expire_at, cached_version, user = item
+        if cached_version != version or expire_at < time.monotonic():
+            del self._cache[user_id]
+            observe_cache('principal', False)
+            return None
+        self._cache.move_to_end(user_id)
+        observe_cache('principal', True)
+        return user
+
+    def put(self, user_id: int, version: str, user: UserSnapshot) -> None:
+        """
+        写入缓存
+
+        :param user_id:
+        :param version:
+        :param user:
+        :return:
+        """
+        self._cache[user_id] = (time.monotonic() + self.expire_seconds, version, user)
+        self._cache.move_to_end(user_id)
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+
+    async def evict(self, user_id: int) -> None:
+        """
+        使指定用户的缓存失效
+
+        :param user_id:
+        :return:
+        """
+        self._cache.pop(user_id, None)
+        await redis_client.incr(self.version_keys(user_id)[0])
+
+    async def evict_all(self) -> None:
+        """
+        使所有用户的缓存失效, 用于角色、菜单、部门等影响多个用户的变更
+
+        :return:
+        """
+        self._cache.clear()
+        await redis_client.incr(self._global_key)
+
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_CAPACITY, settings.PRINCIPAL_CACHE_EXPIRE_SECONDS)
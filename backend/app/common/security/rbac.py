@@ -8,50 +8,159 @@
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
+import asyncio
+import time
+from typing import Optional
+
 import casbin
 import casbin_async_sqlalchemy_adapter
 from fastapi import Depends, Request
 
 from backend.app.models import CasbinRule
-from backend.app.common.enums import MethodType, StatusType
-from backend.app.common.cache.redis import redis_client
+from backend.app.common.enums import MethodType
+from backend.app.common.metrics import casbin_enforce_duration
+from backend.app.common.tracing import traced
+from backend.app.common.cache.permission import permission_store
 from backend.app.common.exception.errors import AuthorizationError, TokenError
 from backend.app.common.security.jwt import DependsJwtAuth
+from backend.app.common.security.rbac_index import PolicyIndex
 from backend.app.core.conf import settings
 from backend.app.databases.mysql import async_engine
 
 
+_CASBIN_RBAC_MODEL_CONF_TEXT = """
+[request_definition]
+r = sub, obj, act
+
+[policy_definition]
+p = sub, obj, act
+
+[role_definition]
+g = _, _
+
+[policy_effect]
+e = some(where (p.eft == allow))
+
+[matchers]
+m = g(r.sub, p.sub) && (keyMatch(r.obj, p.obj) || keyMatch3(r.obj, p.obj)) && (r.act == p.act || p.act == "*")
+"""
+
+
 class RBAC:
 
+    def __init__(self):
+        # 每个 worker 进程常驻一个执行器, 仅在策略版本变化时重新加载策略
+        self._enforcer: Optional[casbin.AsyncEnforcer] = None
+        self._loaded_version: int = -1
+        self._lock = asyncio.Lock()
+        self._index: Optional[PolicyIndex] = None
+        self.policy_version: int = 0
+
+    def bump_policy_version(self) -> int:
+        """
+        策略变更后递增策略版本, 下次获取执行器时重新加载策略
+
+        :return:
+        """
+        self.policy_version += 1
+        return self.policy_version
+
+    def invalidate_index(self) -> None:
+        """
+        内存模型变化后丢弃预编译索引, 下次鉴权时重新构建
+
+        :return:
+        """
+        self._index = None
+
     async def enforcer(self) -> casbin.AsyncEnforcer:
         """
         获取 casbin 执行器
 
         :return:
         """
-        # 规则数据作为死数据直接在方法内定义
-        _CASBIN_RBAC_MODEL_CONF_TEXT = """
-        [request_definition]
-        r = sub, obj, act
+        if self._enforcer is not None and self._loaded_version == self.policy_version:
+            return self._enforcer
+        async with self._lock:
+            if self._enforcer is None:
+                adapter = casbin_async_sqlalchemy_adapter.Adapter(async_engine, db_class=CasbinRule)
+                model = casbin.AsyncEnforcer.new_model(text=_CASBIN_RBAC_MODEL_CONF_TEXT)
+                self._enforcer = casbin.AsyncEnforcer(model, adapter)
+            if self._loaded_version != self.policy_version:
+                version = self.policy_version
+                await self._enforcer.load_policy()
+                self._loaded_version = version
+                self._index = None
+        return self._enforcer
 
-        [policy_definition]
-        p = sub, obj, act
+    async def enforce(self, sub: str, obj: str, act: str) -> bool:
+        """
+        基于预编译索引鉴权, 结果与执行器的 enforce 一致
 
-        [role_definition]
-        g = _, _
+        :param sub:
+        :param obj:
+        :param act:
+        :return:
+        """
+        # 耗时包含策略重新加载与索引重建
+        start = time.perf_counter()
+        enforcer = await self.enforcer()
+        index = self._index
+        if index is None:
+            index = self._index = PolicyIndex(enforcer.get_policy(), enforcer.get_grouping_policy())
+        result = index.enforce(sub, obj, act)
+        casbin_enforce_duration.observe(time.perf_counter() - start)
+        return result
 
-        [policy_effect]
-        e = some(where (p.eft == allow))
+    def apply_policy_change(
+        self,
+        op: str,
+        sec: str,
+        ptype: str,
+        rules: Optional[list[list[str]]] = None,
+        new_rules: Optional[list[list[str]]] = None,
+        field_index: int = 0,
+        field_values: Optional[list[str]] = None,
+    ) -> None:
+        """
+        将其他 worker 广播的策略变更增量应用到本进程的内存模型, 不重新读取策略表
 
-        [matchers]
-        m = g(r.sub, p.sub) && (keyMatch(r.obj, p.obj) || keyMatch3(r.obj, p.obj)) && (r.act == p.act || p.act == "*")
+        :param op: add / remove / update / remove_filtered, 其他值触发全量重新加载
+        :param sec: p / g
+        :param ptype:
+        :param rules:
+        :param new_rules:
+        :param field_index:
+        :param field_values:
+        :return:
         """
-        adapter = casbin_async_sqlalchemy_adapter.Adapter(async_engine, db_class=CasbinRule)
-        model = casbin.AsyncEnforcer.new_model(text=_CASBIN_RBAC_MODEL_CONF_TEXT)
-        enforcer = casbin.AsyncEnforcer(model, adapter)
-        await enforcer.load_policy()
-        return enforcer
+        if self._enforcer is None:
+            return
+        if self._loaded_version != self.policy_version:
+            # 全量加载进行中或待进行, 该加载可能读取到变更前的数据, 再次递增版本保证最终一致
+            self.bump_policy_version()
+            return
+        model = self._enforcer.get_model()
+        if op == 'add':
+            for rule in rules or []:
+                if not model.has_policy(sec, ptype, rule):
+                    model.add_policy(sec, ptype, rule)
+        elif op == 'remove':
+            for rule in rules or []:
+                if model.has_policy(sec, ptype, rule):
+                    model.remove_policy(sec, ptype, rule)
+        elif op == 'update':
+            model.update_policies(sec, ptype, rules or [], new_rules or [])
+        elif op == 'remove_filtered':
+            model.remove_filtered_policy(sec, ptype, field_index, *(field_values or []))
+        else:
+            self.bump_policy_version()
+            return
+        if sec == 'g':
+            self._enforcer.build_role_links()
+        self._index = None
 
+    @traced('rbac_verify')
     async def rbac_verify(self, request: Request, _token: str = DependsJwtAuth) -> None:
         """
         RBAC 权限校验
@@ -82,52 +191,22 @@ class RBAC:
         if data_scope:
             return
         user_uuid = request.user.uuid
-        path_auth_perm = request.state.permission
+        path_auth_perm = getattr(request.state, 'permission', None)
+        if settings.PERMISSION_MODE == 'role-menu' and path_auth_perm in settings.ROLE_MENU_EXCLUDE:
+            return
+        # 角色权限标识集合已在角色、菜单变更时预计算
+        role_perms = await permission_store.get_roles(user_roles)
+        if path_auth_perm is not None and any(path_auth_perm in perms.disable for perms in role_perms):
+            raise AuthorizationError(msg='菜单已禁用，授权失败')
         if settings.PERMISSION_MODE == 'role-menu':
             # 角色菜单权限校验
-            if path_auth_perm in set(settings.ROLE_MENU_EXCLUDE):
-                return
-            user_menu_perms = await redis_client.get(f'{settings.PERMISSION_REDIS_PREFIX}:{user_uuid}:enable')
-            user_forbid_menu_perms = await redis_client.get(f'{settings.PERMISSION_REDIS_PREFIX}:{user_uuid}:disable')
-            if not user_menu_perms or not user_forbid_menu_perms:
-                user_menu_perms = []
-                user_forbid_menu_perms = []
-                for role in user_roles:
-                    for menu in role.menus:
-                        if menu.status == StatusType.enable:
-                            user_menu_perms.extend(menu.perms.split(','))
-                        else:
-                            user_forbid_menu_perms.extend(menu.perms.split(','))
-                await redis_client.set(
-                    f'{settings.PERMISSION_REDIS_PREFIX}:{user_uuid}:enable', ','.join(user_menu_perms)
-                )
-                await redis_client.set(
-                    f'{settings.PERMISSION_REDIS_PREFIX}:{user_uuid}:disable', ','.join(user_forbid_menu_perms)
-                )
-            if path_auth_perm in user_forbid_menu_perms:
-                raise AuthorizationError(msg='菜单已禁用，授权失败')
-            if path_auth_perm not in user_menu_perms:
+            if not any(path_auth_perm in perms.enable for perms in role_perms):
                 raise AuthorizationError
         else:
             # casbin 权限校验
-            user_forbid_menu_perms = await redis_client.get(
-                f'{settings.PERMISSION_REDIS_PREFIX}:{request.user.uuid}:disable'
-            )
-            if not user_forbid_menu_perms:
-                user_forbid_menu_perms = []
-                for role in user_roles:
-                    for menu in role.menus:
-                        if menu.status == StatusType.disable:
-                            user_forbid_menu_perms.extend(menu.perms.split(','))
-                await redis_client.set(
-                    f'{settings.PERMISSION_REDIS_PREFIX}:{user_uuid}:disable', ','.join(user_forbid_menu_perms)
-                )
-            if path_auth_perm in user_forbid_menu_perms:
-                raise AuthorizationError(msg='菜单已禁用，授权失败')
             if (method, path) in settings.CASBIN_EXCLUDE:
                 return
-            enforcer = await self.enforcer()
-            if not enforcer.enforce(user_uuid, path, method):
+            if not await self.enforce(user_uuid, path, method):
                 raise AuthorizationError
 
 
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   rbac_index.py
+@Time    :   2024/05/21 14:05:18
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+import re
+from collections import defaultdict, deque
+from typing import Iterable, Optional, Sequence
+
+from casbin.util.builtin_operators import key_match, key_match3
+
+# 不含正则元字符的普通路径段, 在 keyMatch 与 keyMatch3 下都等价于字符串相等
+_LITERAL_SEGMENT = re.compile(r"^[\w\-~%:@,;=!&']*$")
+# 完整占位段 {param}, keyMatch3 下匹配一个非空且不含 / 的路径段
+_PARAM_SEGMENT = re.compile(r'^\{[^/{}]+\}$')
+
+
+class _Node:
+    __slots__ = ('literals', 'param', 'wildcard', 'terminal')
+
+    def __init__(self):
+        self.literals: dict[str, _Node] = {}
+        self.param: Optional[_Node] = None
+        self.wildcard: bool = False
+        self.terminal: bool = False
+
+
+def _compile_pattern(pattern: str) -> Optional[tuple[list[Optional[str]], bool]]:
+    """
+    将策略路径编译为路径段, 段值为 None 表示占位段
+
+    无法精确表达为前缀树的路径(中间通配、段内占位、正则元字符等)返回 None, 交由原始匹配函数处理
+
+    :param pattern:
+    :return: (路径段, 是否以 /* 结尾)
+    """
+    wildcard = pattern.endswith('/*')
+    body = pattern[:-2] if wildcard else pattern
+    if '*' in body:
+        return None
+    segments: list[Optional[str]] = []
+    for segment in body.split('/'):
+        if _LITERAL_SEGMENT.match(segment):
+            segments.append(segment)
+        elif _PARAM_SEGMENT.match(segment):
+            segments.append(None)
+        else:
+            return None
+    return segments, wildcard
+
+
+def _insert(root: _Node, segments: list[Optional[str]], wildcard: bool) -> None:
+    node = root
+    for segment in segments:
+        if segment is None:
+            if node.param is None:
+                node.param = _Node()
+            node = node.param
+        else:
+            child = node.literals.get(segment)
+            if child is None:
+                child = node.literals[segment] = _Node()
+            node = child
+    if wildcard:
+        node.wildcard = True
+    else:
+        node.terminal = True
+
+
+def _match(node: _Node, segments: Sequence[str], i: int) -> bool:
+    # /* 匹配以 "前缀/" 开头的任意路径, 即前缀之后至少还有一个(可为空的)路径段
+    if node.wildcard and len(segments) > i:
+        return True
+    if i == len(segments):
+        return node.terminal
+    segment = segments[i]
+    child = node.literals.get(segment)
+    if child is not None and _match(child, segments, i + 1):
+        return True
+    if node.param is not None and segment and _match(node.param, segments, i + 1):
+        return True
+    return False
+
+
+class PolicyIndex:
+    """
+    casbin 策略的预编译索引, 与 RBAC 模型的 matcher 等价:
+
+    g(r.sub, p.sub) && (keyMatch(r.obj, p.obj) || keyMatch3(r.obj, p.obj)) && (r.act == p.act || p.act == "*")
+
+    p 策略按 主体 -> 请求方法 -> 路径段前缀树 组织, g 策略预先计算每个主体可继承的角色闭包,
+    鉴权耗时近似为 O(角色数 * 路径深度), 与策略总数无关
+    """
+
+    def __init__(
+        self,
+        policies: Iterable[Sequence[str]],
+        groupings: Iterable[Sequence[str]] = (),
+        *,
+        max_hierarchy_level: int = 10,
+    ):
+        self._tries: dict[str, dict[str, _Node]] = defaultdict(dict)
+        self._fallback: dict[str, list[tuple[str, str]]] = defaultdict(list)
+        self._roles: dict[str, tuple[str, ...]] = {}
+        for rule in policies:
+            if len(rule) < 3:
+                continue
+            sub, obj, act = rule[0], rule[1], rule[2]
+            compiled = _compile_pattern(obj)
+            if compiled is None:
+                self._fallback[sub].append((obj, act))
+                continue
+            root = self._tries[sub].get(act)
+            if root is None:
+                root = self._tries[sub][act] = _Node()
+            _insert(root, *compiled)
+        self._build_role_closure(groupings, max_hierarchy_level)
+
+    def _build_role_closure(self, groupings: Iterable[Sequence[str]], max_hierarchy_level: int) -> None:
+        links: dict[str, set[str]] = defaultdict(set)
+        for rule in groupings:
+            if len(rule) >= 2:
+                links[rule[0]].add(rule[1])
+        for sub in links:
+            seen = {sub: 0}
+            queue = deque([sub])
+            while queue:
+                current = queue.popleft()
+                level = seen[current]
+                if level >= max_hierarchy_level:
+                    continue
+                for role in links.get(current, ()):
+                    if role not in seen:
+                        seen[role] = level + 1
+                        queue.append(role)
+            self._roles[sub] = tuple(seen)
+
+    def enforce(self, sub: str, obj: str, act: str) -> bool:
+        """
+        鉴权
+
+        :param sub: 用户 uuid
+        :param obj: 请求路径
+        :param act: 请求方法
+        :return:
+        """
+        segments = obj.split('/')
+        for subject in self._roles.get(sub, (sub,)):
+            tries = self._tries.get(subject)
+            if tries:
+                for method in (act, '*'):
+                    root = tries.get(method)
+                    if root is not None and _match(root, segments, 0):
+                        return True
+            for pattern, method in self._fallback.get(subject, ()):
+                if (method == act or method == '*') and (key_match(obj, pattern) or key_match3(obj, pattern)):
+                    return True
+        return False
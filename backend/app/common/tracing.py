@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   tracing.py
+@Time    :   2024/05/27 14:18:02
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+import asyncio
+import functools
+import inspect
+import json
+import os
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+from backend.app.common.log import log
+from backend.app.core import path_conf
+from backend.app.core.conf import settings
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+# OTLP span kind
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+
+class Span:
+    __slots__ = ('name', 'span_id', 'parent_id', 'kind', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name: str, parent_id: Optional[str], kind: int, attributes: dict[str, Any]):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class Trace:
+    """
+    一次请求的链路, 保存已结束的 span
+
+    sampled 为 False 时只用于生成 Server-Timing, 不导出
+    """
+
+    __slots__ = ('trace_id', 'sampled', 'spans')
+
+    def __init__(self, sampled: bool):
+        self.trace_id = secrets.token_hex(16)
+        self.sampled = sampled
+        self.spans: list[Span] = []
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar('trace', default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar('trace_span', default=None)
+
+SpanHandle = Optional[tuple[Trace, Span, Token]]
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def start_trace(sampled: bool) -> tuple[Trace, Token]:
+    """
+    开始记录当前请求的链路
+
+    :param sampled: 是否导出
+    :return:
+    """
+    trace = Trace(sampled)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token: Token) -> None:
+    _current_trace.reset(token)
+
+
+def start_span(name: str, *, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> SpanHandle:
+    """
+    开始一个 span, 父 span 为当前上下文中的 span; 当前请求未记录链路时返回 None, 几乎没有开销
+
+    用于无法使用 with 的场景(例如 SQLAlchemy 的前后事件), 其他场景使用 span
+
+    :param name:
+    :param kind:
+    :param attributes:
+    :return: 传给 end_span
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    parent = _current_span.get()
+    span = Span(name, parent.span_id if parent is not None else None, kind, attributes)
+    return trace, span, _current_span.set(span)
+
+
+def end_span(handle: SpanHandle, error: Optional[BaseException] = None) -> None:
+    """
+    结束 span
+
+    :param handle: start_span 的返回值
+    :param error:
+    :return:
+    """
+    if handle is None:
+        return
+    trace, span, token = handle
+    span.end_ns = time.time_ns()
+    if error is not None:
+        span.error = f'{type(error).__name__}: {error}'
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # 在其他上下文中结束(例如跨任务), 不影响当前上下文
+        pass
+    trace.spans.append(span)
+
+
+@contextmanager
+def span(name: str, *, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    在上下文中记录一个 span
+
+    E.g. ::
+
+        with span('paging.count'):
+            total = await count_total(db, select, count_mode)
+
+    :param name:
+    :param kind:
+    :param attributes:
+    :return:
+    """
+    handle = start_span(name, kind=kind, **attributes)
+    try:
+        yield handle[1] if handle is not None else None
+    except BaseException as e:
+        end_span(handle, e)
+        raise
+    end_span(handle)
+
+
+def traced(name: Optional[str] = None) -> Callable[[F], F]:
+    """
+    以 span 记录函数的执行, 支持同步与异步函数
+
+    :param name: 默认为函数的限定名
+    :return:
+    """
+
+    def decorator(func: F) -> F:
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _current_trace.get() is None:
+                    return await func(*args, **kwargs)
+                with span(span_name):
+                    return await func(*args, **kwargs)
+
+            async_wrapper.__traced__ = True
+            return async_wrapper  # type: ignore
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        wrapper.__traced__ = True
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+def trace_public_methods(cls: type) -> type:
+    """
+    以 span 记录类的公开异步方法(包括继承的方法), span 名称为 类名.方法名; 未启用 TRACE_ENABLED 时不做处理
+
+    :param cls:
+    :return:
+    """
+    if not settings.TRACE_ENABLED:
+        return cls
+    for attr in dir(cls):
+        if attr.startswith('_'):
+            continue
+        value = inspect.getattr_static(cls, attr)
+        if getattr(value, '__traced__', False):
+            # 父类中已记录的方法以子类名称重新包装
+            value = value.__wrapped__
+        if inspect.iscoroutinefunction(value):
+            setattr(cls, attr, traced(f'{cls.__name__}.{attr}')(value))
+    return cls
+
+
+def trace_engine(engine: Any) -> None:
+    """
+    通过引擎事件以 span 记录 SQL 语句的执行
+
+    :param engine: 同步引擎, 异步引擎传入 async_engine.sync_engine
+    :return:
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        handle = start_span('db', kind=SPAN_KIND_CLIENT, **{'db.statement': statement[:1000]})
+        if handle is not None:
+            conn.info.setdefault('trace_span', []).append(handle)
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany) -> None:
+        handles = conn.info.get('trace_span')
+        if handles:
+            end_span(handles.pop())
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(context) -> None:
+        handles = context.connection.info.get('trace_span') if context.connection is not None else None
+        if handles:
+            end_span(handles.pop(), context.original_exception)
+
+
+def server_timing(trace: Trace) -> str:
+    """
+    按 span 名称汇总已结束 span 的耗时, 生成 Server-Timing 响应头; 同名 span 的耗时相加, desc 为次数
+
+    :param trace:
+    :return:
+    """
+    totals: dict[str, list] = {}
+    for item in trace.spans:
+        total = totals.setdefault(item.name, [0.0, 0])
+        total[0] += item.duration_ms
+        total[1] += 1
+    return ', '.join(
+        f'{name.replace(" ", "_")};dur={duration:.2f};desc="{count}"' for name, (duration, count) in totals.items()
+    )
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp_span(trace: Trace, item: Span) -> dict[str, Any]:
+    data = {
+        'traceId': trace.trace_id,
+        'spanId': item.span_id,
+        'name': item.name,
+        'kind': item.kind,
+        'startTimeUnixNano': str(item.start_ns),
+        'endTimeUnixNano': str(item.end_ns),
+        'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in item.attributes.items()],
+        'status': {'code': 2, 'message': item.error} if item.error else {'code': 0},
+    }
+    if item.parent_id:
+        data['parentSpanId'] = item.parent_id
+    return data
+
+
+class TraceExporter:
+    """
+    链路导出器
+
+    采样的链路进入有界队列, 由后台任务每隔 TRACE_EXPORT_INTERVAL_MS 毫秒导出: otlp 以 OTLP/HTTP JSON 发送到采集器,
+    jsonl 每个 span 一行追加到日志目录下的文件; 队列已满时丢弃并计数
+    """
+
+    def __init__(self, exporter: str, *, interval_ms: int, max_queue_size: int):
+        self.exporter = exporter
+        self.interval = interval_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.exported = 0
+        self.dropped = 0
+        self._pending: list[Trace] = []
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def startup(self) -> None:
+        if self._task is None and self.exporter != 'none':
+            if self.exporter == 'otlp':
+                self._client = httpx.AsyncClient(timeout=5)
+            self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await self._flush()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def submit(self, trace: Trace) -> None:
+        """
+        提交已结束的链路
+
+        :param trace:
+        :return:
+        """
+        if self._task is None:
+            return
+        if len(self._pending) >= self.max_queue_size:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                log.warning(f'链路导出队列已满, 累计丢弃 {self.dropped} 条链路')
+            return
+        self._pending.append(trace)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._flush()
+
+    async def _flush(self) -> None:
+        traces, self._pending = self._pending, []
+        if not traces:
+            return
+        spans = [to_otlp_span(trace, item) for trace in traces for item in trace.spans]
+        try:
+            if self.exporter == 'otlp':
+                await self._export_otlp(spans)
+            else:
+                await run_in_threadpool(self._export_jsonl, spans)
+            self.exported += len(traces)
+        except Exception as e:
+            log.warning(f'链路导出失败, 丢弃 {len(traces)} 条链路: {e}')
+
+    async def _export_otlp(self, spans: list[dict[str, Any]]) -> None:
+        payload = {
+            'resourceSpans': [
+                {
+                    'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': settings.APP_NAME}}]},
+                    'scopeSpans': [{'scope': {'name': settings.APP_NAME}, 'spans': spans}],
+                }
+            ]
+        }
+        response = await self._client.post(settings.TRACE_OTLP_ENDPOINT, json=payload)
+        response.raise_for_status()
+
+    @staticmethod
+    def _export_jsonl(spans: list[dict[str, Any]]) -> None:
+        os.makedirs(path_conf.LOG_DIR, exist_ok=True)
+        with open(os.path.join(path_conf.LOG_DIR, settings.TRACE_JSONL_FILENAME), 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(item, ensure_ascii=False) + '\n' for item in spans)
+
+
+trace_exporter = TraceExporter(
+    settings.TRACE_EXPORTER,
+    interval_ms=settings.TRACE_EXPORT_INTERVAL_MS,
+    max_queue_size=settings.TRACE_QUEUE_MAX_SIZE,
+)
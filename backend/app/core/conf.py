@@ -59,12 +59,17 @@ class Settings(BaseSettings):
     ]
 
     # Task
-    TASK_QUEUE_ENABLED: bool = True
+    TASK_QUEUE_ENABLED: bool = False  # 日志等由任务队列写入，需要 broker 与 worker（celery -A backend.app.tasks worker）；关闭时在请求中直接写入
     TASK_QUEUE_USER: str = "admin"
     TASK_QUEUE_PASSWORD: str = "password"
     TASK_QUEUE_HOST: str = "localhost"
     TASK_QUEUE_PORT: int = 5672
     TASK_QUEUE_URL: str = f"{TASK_QUEUE_HOST}:{TASK_QUEUE_PORT}" 
+    TASK_QUEUE_BROKER_URL: Optional[str] = None  # 为空时使用上述 RabbitMQ 配置，测试时可设置为 memory://
+    TASK_QUEUE_ALWAYS_EAGER: bool = False  # 在调用方直接执行任务，用于测试
+    TASK_QUEUE_NAME: str = f'{APP_NAME}_tasks'
+    TASK_QUEUE_ONCE_REDIS_PREFIX: str = f'{APP_NAME}_task_once'
+    TASK_QUEUE_ONCE_EXPIRE_SECONDS: int = 60 * 60 * 24  # 任务幂等标记的保留时间，单位：秒
 
     # Redis
     MEMORY_LRU_CACHE_CAPACITY: int = 500
@@ -84,6 +89,20 @@ class Settings(BaseSettings):
     MYSQL_DATABASE: str = f"{APP_NAME}"
     MYSQL_ECHO: bool = False
     MYSQL_CHARSET: str = "utf8mb4"
+    MYSQL_POOL_SIZE: int = 10  # 连接池常驻连接数
+    MYSQL_POOL_MAX_OVERFLOW: int = 20  # 连接池满时允许额外创建的连接数
+    MYSQL_POOL_TIMEOUT: int = 30  # 取连接的最长等待时间，单位：秒
+    MYSQL_POOL_RECYCLE: int = 60 * 60  # 连接最长存活时间，应小于 MySQL 的 wait_timeout，单位：秒
+    MYSQL_POOL_DISCONNECT: Literal['optimistic', 'pessimistic'] = 'optimistic'  # optimistic: 出错时失效重连; pessimistic: 每次取连接前 ping
+    MYSQL_REPLICA_HOST: Optional[str] = None  # 从库地址，为空时读写均使用主库
+    MYSQL_REPLICA_PORT: int = 3306
+    MYSQL_REPLICA_STICKY_SECONDS: int = 5  # 用户写入后在该时间内读取主库，单位：秒
+    MYSQL_REPLICA_REDIS_PREFIX: str = f'{APP_NAME}_db_route'
+    MYSQL_PROFILER: bool = True  # 按语句指纹统计执行次数与耗时
+    MYSQL_SLOW_QUERY_MS: int = 200  # 超过该耗时的语句记录到日志，单位：毫秒
+    MYSQL_PROFILER_SAMPLE_SIZE: int = 1000  # 每个指纹保留的最近耗时样本数，用于计算 p50 / p99
+    MYSQL_PROFILER_MAX_FINGERPRINTS: int = 1000  # 统计的指纹数上限，超出后归入 <other>
+    MYSQL_N_PLUS_ONE_THRESHOLD: int = 10  # 同一请求中同一指纹执行超过该次数时记录疑似 N+1 查询
 
     # Uvicorn
     UVICORN_HOST: str = '127.0.0.1'
@@ -92,6 +111,12 @@ class Settings(BaseSettings):
 
     LOCATION_PARSE: Literal['online', 'offline', 'false'] = 'offline'
 
+    # Pagination
+    PAGINATION_COUNT_MODE: Literal['exact', 'cached', 'estimated'] = 'exact'  # 分页总数的默认统计方式
+    PAGINATION_COUNT_REDIS_PREFIX: str = f'{APP_NAME}_pagination_count'
+    PAGINATION_COUNT_EXPIRE_SECONDS: int = 30  # cached 模式的缓存时间，单位：秒
+    PAGINATION_COUNT_ESTIMATE_THRESHOLD: int = 10000  # estimated 模式下估计值低于该值时精确统计
+
     # Limiter
     LIMITER_REDIS_PREFIX: str = f'{APP_NAME}_limiter'
 
@@ -111,15 +136,40 @@ class Settings(BaseSettings):
     MIDDLEWARE_CORS: bool = True
     MIDDLEWARE_GZIP: bool = True
     MIDDLEWARE_ACCESS: bool = False
+    MIDDLEWARE_UNIT_OF_WORK: bool = True
+
+    # Metrics
+    METRICS_ENABLED: bool = True
+    METRICS_URL: str = '/metrics'  # prometheus 抓取地址, 不在 API_V1_STR 下, 不需要认证，应只对内网开放
+
+    # Tracing
+    TRACE_ENABLED: bool = False
+    TRACE_SAMPLE_RATE: float = 0.1  # 导出链路的请求比例, 0 ~ 1
+    TRACE_EXPORTER: Literal['otlp', 'jsonl', 'none'] = 'jsonl'
+    TRACE_OTLP_ENDPOINT: str = 'http://localhost:4318/v1/traces'  # OTLP/HTTP JSON 采集地址
+    TRACE_JSONL_FILENAME: str = f'{APP_NAME}_trace.jsonl'  # 位于日志目录
+    TRACE_EXPORT_INTERVAL_MS: int = 1000  # 导出间隔，单位：毫秒
+    TRACE_QUEUE_MAX_SIZE: int = 1000  # 待导出链路数上限
+    TRACE_SERVER_TIMING: bool = True  # dev 环境下记录所有请求并添加 Server-Timing 响应头
 
     # RBAC Permission
     PERMISSION_MODE: Literal['casbin', 'role-menu'] = 'casbin'
     PERMISSION_REDIS_PREFIX: str = f'{APP_NAME}_permission'
+    ROLE_MENU_EXCLUDE: set[str] = set()  # role-menu 模式下免校验的权限标识
 
     CASBIN_EXCLUDE: set[tuple[str, str]] = {
         ('POST', f'{API_V1_STR}/auth/logout'),
         ('POST', f'{API_V1_STR}/auth/token/new')
     }
+    CASBIN_WATCHER_CHANNEL: str = f'{APP_NAME}_casbin_policy'
+
+    # Principal cache
+    PRINCIPAL_CACHE_CAPACITY: int = 5000
+    PRINCIPAL_CACHE_EXPIRE_SECONDS: int = 60  # 过期时间，单位：秒
+    PRINCIPAL_REDIS_PREFIX: str = f'{APP_NAME}_principal'
+
+    # Tree cache
+    TREE_REDIS_PREFIX: str = f'{APP_NAME}_tree'
 
     # Opera log
     OPERA_LOG_EXCLUDE: list[str] = [
@@ -132,10 +182,25 @@ class Settings(BaseSettings):
     ]
     OPERA_LOG_ENCRYPT: int = 1  # 0: AES (性能损耗); 1: md5; 2: ItsDangerous; 3: 不加密, others: 替换为 ******
     OPERA_LOG_ENCRYPT_INCLUDE: list[str] = ['password', 'old_password', 'new_password', 'confirm_password']
+    OPERA_LOG_ARGS_MAX_BYTES: int = 1024 * 64  # 记录请求参数时截留的最大请求体，超出部分不记录
+    OPERA_LOG_BATCH_SIZE: int = 200  # 每批写入的最大条数
+    OPERA_LOG_FLUSH_INTERVAL_MS: int = 500  # 批量写入间隔，单位：毫秒
+    OPERA_LOG_QUEUE_MAX_SIZE: int = 10000  # 待写入队列长度
+    OPERA_LOG_QUEUE_OVERFLOW: Literal['drop', 'block'] = 'drop'  # 队列已满时丢弃并计数或等待
 
     # ip location
     IP_LOCATION_REDIS_PREFIX: str = f'{APP_NAME}_ip_location'
     IP_LOCATION_EXPIRE_SECONDS: int = 60 * 60 * 24 * 1  # 过期时间，单位：秒
+    IP_LOCATION_LRU_CACHE_CAPACITY: int = 2048
+    IP_LOCATION_ONLINE_URL: str = 'http://ip-api.com/json/{ip}?lang=zh-CN'
+    IP_LOCATION_ONLINE_TIMEOUT: float = 3  # 单位：秒
+    IP_LOCATION_ONLINE_CONCURRENCY: int = 10  # 同时进行的在线查询上限
+    IP_LOCATION_ONLINE_FAILURE_THRESHOLD: int = 5  # 连续失败次数达到该值后熔断
+    IP_LOCATION_ONLINE_RECOVERY_SECONDS: int = 60  # 熔断持续时间，单位：秒
+    IP_LOCATION_NEGATIVE_EXPIRE_SECONDS: int = 60 * 10  # 查询失败的 ip 在该时间内不再在线查询，单位：秒
+
+    # user agent
+    USER_AGENT_LRU_CACHE_CAPACITY: int = 1024
 
 @lru_cache()
 def get_settings():
@@ -23,10 +23,17 @@ from backend.app.core.conf import settings
 from backend.app.core.path_conf import STATIC_DIR, UPLOAD_DIR
 from backend.app.common.log import log
 from backend.app.common.cache.redis import redis_client
+from backend.app.common.security.casbin_watcher import casbin_watcher
+from backend.app.common.tracing import trace_exporter
 from backend.app.databases.mysql import create_table
 from backend.app.databases.superuser import initialize_superuser
 from backend.app.middlewares.jwt_auth_middleware import JwtAuthMiddleware
 from backend.app.middlewares.opera_log_middleware import OperaLogMiddleware
+from backend.app.middlewares.tracing_middleware import SpanMiddleware, TracingMiddleware
+from backend.app.services.service_opera_log import opera_log_writer
+from backend.app.services.service_role import role_service
+from backend.app.tasks import drain as drain_tasks
+from backend.app.utils.request_parse import online_location_client
 from backend.app.utils.health_check import ensure_unique_route_names, http_limit_callback
 from backend.app.utils.openapi import simplify_operation_ids
 from backend.app.utils.serializers import MsgSpecJSONResponse
@@ -55,11 +62,45 @@ async def register_init(app: FastAPI):
     # 启动 redis
     await redis_client.startup()
 
+    # 为启用前缀索引之前签发的 token 登记索引, 使其可以被 delete_indexed 删除
+    for prefix in (settings.TOKEN_REDIS_PREFIX, settings.TOKEN_REFRESH_REDIS_PREFIX):
+        await redis_client.backfill_index(prefix)
+
+    # 首次部署或 redis 数据丢失时预计算角色权限, 避免鉴权时按角色菜单临时计算
+    await role_service.rebuild_permissions(missing_only=True)
+
     # 初始化 limiter
     await FastAPILimiter.init(redis_client, prefix=settings.LIMITER_REDIS_PREFIX, http_callback=http_limit_callback)
+
+    # 订阅 casbin 策略变更
+    await casbin_watcher.startup()
+
+    # 启动操作日志批量写入
+    await opera_log_writer.startup()
+
+    # 在线 ip 属地查询客户端
+    if settings.LOCATION_PARSE == 'online':
+        await online_location_client.startup()
+
+    # 链路导出
+    if settings.TRACE_ENABLED:
+        await trace_exporter.startup()
     
     yield
 
+    # 写入剩余操作日志, 等待本地执行的任务完成
+    await opera_log_writer.shutdown()
+    await drain_tasks()
+
+    # 停止 casbin 策略订阅
+    await casbin_watcher.shutdown()
+
+    # 关闭在线 ip 属地查询客户端
+    await online_location_client.shutdown()
+
+    # 导出剩余链路
+    await trace_exporter.shutdown()
+
     # 关闭 redis
     await redis_client.shutdown()
 
@@ -109,6 +150,19 @@ def register_static_file(app: FastAPI):
             os.mkdir(STATIC_DIR)
         app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
+def _add_middleware(app: FastAPI, middleware_class: type, **options):
+    """
+    添加中间件, 启用链路记录时在其外层添加 SpanMiddleware 记录该中间件及其之后的处理耗时
+
+    :param app:
+    :param middleware_class:
+    :param options:
+    :return:
+    """
+    app.add_middleware(middleware_class, **options)
+    if settings.TRACE_ENABLED:
+        app.add_middleware(SpanMiddleware, name=f'middleware.{middleware_class.__name__}')
+
 def register_middleware(app: FastAPI):
     """
     中间件，执行顺序从下往上
@@ -120,18 +174,36 @@ def register_middleware(app: FastAPI):
     if settings.MIDDLEWARE_GZIP:
         from fastapi.middleware.gzip import GZipMiddleware
 
-        app.add_middleware(GZipMiddleware)
+        _add_middleware(app, GZipMiddleware)
     # Opera log
-    app.add_middleware(OperaLogMiddleware)
+    _add_middleware(app, OperaLogMiddleware)
     # JWT auth, required
-    app.add_middleware(
-        AuthenticationMiddleware, backend=JwtAuthMiddleware(), on_error=JwtAuthMiddleware.auth_exception_handler
+    _add_middleware(
+        app, AuthenticationMiddleware, backend=JwtAuthMiddleware(), on_error=JwtAuthMiddleware.auth_exception_handler
     )
+    # Unit of work: 包含认证在内共用一个数据库会话
+    if settings.MIDDLEWARE_UNIT_OF_WORK:
+        from backend.app.middlewares.uow_middleware import UnitOfWorkMiddleware
+
+        _add_middleware(app, UnitOfWorkMiddleware)
+    # Query profiler: 包含认证在内的请求语句统计
+    if settings.MYSQL_PROFILER:
+        from backend.app.middlewares.query_profiler_middleware import QueryProfilerMiddleware
+
+        _add_middleware(app, QueryProfilerMiddleware)
     # Access log
     if settings.MIDDLEWARE_ACCESS:
         from backend.app.middlewares.access_middleware import AccessMiddleware
 
-        app.add_middleware(AccessMiddleware)
+        _add_middleware(app, AccessMiddleware)
+    # Metrics: 请求耗时包含其他中间件
+    if settings.METRICS_ENABLED:
+        from backend.app.middlewares.metrics_middleware import MetricsMiddleware
+
+        app.add_middleware(MetricsMiddleware)
+    # Tracing: 链路的根 span
+    if settings.TRACE_ENABLED:
+        app.add_middleware(TracingMiddleware)
     # CORS: Always at the end
     if settings.MIDDLEWARE_CORS:
         from fastapi.middleware.cors import CORSMiddleware
@@ -153,6 +225,12 @@ def register_router(app: FastAPI):
     # 项目API
     app.include_router(v1_router)
 
+    # Prometheus
+    if settings.METRICS_ENABLED:
+        from backend.app.common.metrics import metrics_endpoint
+
+        app.add_route(settings.METRICS_URL, metrics_endpoint, include_in_schema=False)
+
     # Extra
     ensure_unique_route_names(app)
     simplify_operation_ids(app)
@@ -8,16 +8,18 @@
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+from typing import Any, Dict, Generic, Iterable, List, Optional, Sequence, Set, Tuple, Type, TypeVar, Union
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from sqlalchemy import Select, select, update, delete, and_, desc
+from sqlalchemy import Select, Table, bindparam, insert, select, update, delete, and_, desc
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import InstrumentedAttribute, MappedColumn
 from sqlalchemy.sql.elements import BinaryExpression, UnaryExpression, BooleanClauseList, ExpressionClauseList
 
 from backend.app.models.base import Base
 from backend.app.common.log import log
+from backend.app.utils.timezone import timezone
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
@@ -65,6 +67,34 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         result = await db.execute(select(self.model).where(*where_list))
         return result.scalars().one_or_none()
     
+    async def get_by_ids(self, db: AsyncSession, *, pks: Iterable[int]) -> Sequence[ModelType]:
+        """
+        通过主键 id 列表获取数据, 一次 IN 查询
+
+        :param db:
+        :param pks:
+        :return:
+        """
+        pks = set(pks)
+        if not pks:
+            return []
+        result = await db.execute(select(self.model).where(self.model.id.in_(pks)))
+        return result.scalars().all()
+
+    async def get_missing_ids(self, db: AsyncSession, *, pks: Iterable[int]) -> Set[int]:
+        """
+        获取不存在的主键 id, 只查询主键列
+
+        :param db:
+        :param pks:
+        :return:
+        """
+        pks = set(pks)
+        if not pks:
+            return set()
+        result = await db.execute(select(self.model.id).where(self.model.id.in_(pks)))
+        return pks - set(result.scalars().all())
+
     async def single(
             self, 
             db: AsyncSession, 
@@ -183,6 +213,128 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         result = await db.execute(update(self.model).where(self.model.id == pk).values(**update_data))
         return result.rowcount
 
+    def _bulk_rows(
+            self,
+            objs: Sequence[Union[BaseModel, Dict[str, Any]]],
+            *,
+            user_id: Optional[int] = None,
+            user_column: str = 'create_user',
+        ) -> List[Dict[str, Any]]:
+        cols = self.model.__table__.columns
+        rows = []
+        for obj in objs:
+            row = dict(obj) if isinstance(obj, dict) else obj.model_dump(exclude_unset=user_column == 'update_user')
+            if user_id and user_column in cols:
+                row[user_column] = user_id
+            rows.append(row)
+        return rows
+
+    async def bulk_create(
+            self,
+            db: AsyncSession,
+            *,
+            objs: Sequence[Union[CreateSchemaType, Dict[str, Any]]],
+            user_id: Optional[int] = None
+        ) -> int:
+        """
+        批量新增数据
+
+        使用 Core insert 的 executemany, 不经过 ORM 工作单元, 也不返回新增的对象及主键
+
+        :param db:
+        :param objs: Pydantic 模型类 or 对应数据库字段的字典
+        :param user_id:
+        :return: 新增的行数
+        """
+        rows = self._bulk_rows(objs, user_id=user_id)
+        if not rows:
+            return 0
+        if 'create_time' in self.model.__table__.columns:
+            # create_time 的默认值只在 ORM 构造对象时生成
+            now = timezone.now()
+            for row in rows:
+                row.setdefault('create_time', now)
+        result = await db.execute(insert(self.model.__table__), rows)
+        return result.rowcount
+
+    async def bulk_update(
+            self,
+            db: AsyncSession,
+            *,
+            objs: Sequence[Union[UpdateSchemaType, Dict[str, Any]]],
+            user_id: Optional[int] = None
+        ) -> int:
+        """
+        通过主键 id 批量更新数据, 每行的更新值可以不同
+
+        相同字段的行合并为一条 UPDATE 语句的 executemany
+
+        :param db:
+        :param objs: 包含 id 的 Pydantic 模型类 or 对应数据库字段的字典
+        :param user_id:
+        :return: 更新的行数
+        """
+        table = self.model.__table__
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for row in self._bulk_rows(objs, user_id=user_id, user_column='update_user'):
+            pk = row.pop('id', None)
+            assert pk is not None, '更新错误, 批量更新的数据必须包含 id'
+            if not row:
+                continue
+            row['_pk'] = pk
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+        count = 0
+        for keys, rows in groups.items():
+            stmt = update(table).where(table.c.id == bindparam('_pk')).values(
+                {key: bindparam(key) for key in keys if key != '_pk'}
+            )
+            result = await db.execute(stmt, rows)
+            count += result.rowcount
+        return count
+
+    async def bulk_upsert(
+            self,
+            db: AsyncSession,
+            *,
+            objs: Sequence[Union[CreateSchemaType, Dict[str, Any]]],
+            update_columns: Optional[Sequence[str]] = None,
+            user_id: Optional[int] = None,
+            batch_size: int = 1000
+        ) -> int:
+        """
+        批量新增或更新数据, 仅支持 MySQL
+
+        使用 INSERT ... ON DUPLICATE KEY UPDATE, 主键或唯一索引冲突的行更新 update_columns 字段
+
+        :param db:
+        :param objs: Pydantic 模型类 or 对应数据库字段的字典
+        :param update_columns: 冲突时更新的字段, 默认为除 id 与创建信息外传入的所有字段
+        :param user_id:
+        :param batch_size: 每条语句包含的最大行数
+        :return: MySQL 的影响行数, 新增的行计 1, 更新的行计 2, 未变化的行计 0
+        """
+        rows = self._bulk_rows(objs, user_id=user_id)
+        if not rows:
+            return 0
+        cols = self.model.__table__.columns
+        now = timezone.now()
+        if 'create_time' in cols:
+            for row in rows:
+                row.setdefault('create_time', now)
+        if update_columns is None:
+            update_columns = [key for key in rows[0] if key not in ('id', 'create_time', 'create_user')]
+        count = 0
+        for i in range(0, len(rows), batch_size):
+            stmt = mysql_insert(self.model.__table__).values(rows[i:i + batch_size])
+            values = {key: stmt.inserted[key] for key in update_columns}
+            if 'update_time' in cols:
+                values['update_time'] = now
+            if user_id and 'update_user' in cols:
+                values['update_user'] = user_id
+            result = await db.execute(stmt.on_duplicate_key_update(values))
+            count += result.rowcount
+        return count
+
     async def delete(
             self, 
             db: AsyncSession,
@@ -212,6 +364,40 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
                 result = await db.execute(update(self.model).where(self.model.id == pk).values(del_flag=del_flag))
         return result.rowcount
 
+    @staticmethod
+    async def sync_association(
+            db: AsyncSession,
+            *,
+            table: Table,
+            owner_column: str,
+            owner_id: int,
+            target_column: str,
+            target_ids: Iterable[int]
+        ) -> Tuple[int, int]:
+        """
+        按差异更新关联表, 只删除移除的关联并批量插入新增的关联
+
+        直接操作关联表, 会话中已加载的关系集合需要调用方 expire
+
+        :param db:
+        :param table: 关联表, 如 RoleMenu
+        :param owner_column: 所属方外键列名, 如 role_id
+        :param owner_id:
+        :param target_column: 关联方外键列名, 如 menu_id
+        :param target_ids: 更新后的全部关联 id
+        :return: 新增与删除的关联数
+        """
+        owner, target = table.c[owner_column], table.c[target_column]
+        result = await db.execute(select(target).where(owner == owner_id))
+        current = set(result.scalars().all())
+        target_ids = set(target_ids)
+        removed, added = current - target_ids, target_ids - current
+        if removed:
+            await db.execute(delete(table).where(owner == owner_id, target.in_(removed)))
+        if added:
+            await db.execute(insert(table), [{owner_column: owner_id, target_column: pk} for pk in sorted(added)])
+        return len(added), len(removed)
+
     def criterionize(self, criterions:Union[List[Union[str, InstrumentedAttribute, BinaryExpression, BooleanClauseList]],Dict[Union[str, InstrumentedAttribute], Any]]) -> List[Any]:
         '''统一 sorts、 filters格式
             criterions
@@ -20,12 +20,14 @@ from backend.app.schemas.login_log import CreateLoginLogParam, UpdateLoginLogPar
 
 
 class CRUDLoginLog(CRUDBase[LoginLog, CreateLoginLogParam, UpdateLoginLogParam]):
+    # 游标分页排序键
+    cursor_keys = (LoginLog.create_time, LoginLog.id)
 
     def get_select_list(self, 
                         username: Optional[str] = None, 
                         status: Optional[int] = None, 
                         ip: Optional[str] = None) -> Select:
-        se = select(self.model).order_by(desc(self.model.create_time))
+        se = select(self.model).order_by(desc(self.model.create_time), desc(self.model.id))
         where_list = []
         if username:
             where_list.append(self.model.username.like(f'%{username}%'))
@@ -19,11 +19,14 @@ from backend.app.schemas.opera_log import CreateOperaLogParam, UpdateOperaLogPar
 
 
 class CRUDOperaLog(CRUDBase[OperaLog, CreateOperaLogParam, UpdateOperaLogParam]):
-    async def get_select_list(self, 
-                              username: Optional[str] = None, 
-                              status: Optional[int] = None, 
-                              ip: Optional[str] = None) -> Select:
-        se = select(self.model).order_by(desc(self.model.create_time))
+    # 游标分页排序键
+    cursor_keys = (OperaLog.create_time, OperaLog.id)
+
+    def get_select_list(self, 
+                        username: Optional[str] = None, 
+                        status: Optional[int] = None, 
+                        ip: Optional[str] = None) -> Select:
+        se = select(self.model).order_by(desc(self.model.create_time), desc(self.model.id))
         where_list = []
         if username:
             where_list.append(self.model.username.like(f'%{username}%'))
@@ -16,7 +16,7 @@ from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.app.crud.crud_base import CRUDBase
-from backend.app.models import User, Role, Menu
+from backend.app.models import User, Role, Menu, RoleMenu
 from backend.app.schemas.role import CreateRoleParam, UpdateRoleParam, UpdateRoleMenuParam
 from backend.app.common.security import jwt
 from backend.app.utils.timezone import timezone
@@ -79,19 +79,33 @@ class CRUDRole(CRUDBase[Role, CreateRoleParam, UpdateRoleParam]):
             se = se.where(*where_list)
         return se
 
-    async def update_menus(self, db: AsyncSession, *, role_id: int, menu_ids: UpdateRoleMenuParam) -> int:
+    async def get_menu_perms(self, db: AsyncSession) -> Sequence[tuple[int, Optional[str], Optional[int]]]:
+        """
+        获取所有角色的菜单权限标识, 未分配菜单的角色权限标识为空
+
+        :param db:
+        :return: (角色 id, 菜单权限标识, 菜单状态)
+        """
+        result = await db.execute(
+            select(self.model.id, Menu.perms, Menu.status)
+            .outerjoin(RoleMenu, RoleMenu.c.role_id == self.model.id)
+            .outerjoin(Menu, Menu.id == RoleMenu.c.menu_id)
+        )
+        return result.tuples().all()
+
+    async def update_menus(self, db: AsyncSession, *, role: Role, menu_ids: UpdateRoleMenuParam) -> int:
         """
         更新角色菜单
 
         :param db:
-        :param role_id:
+        :param role:
         :param menu_ids:
         :return:
         """
-        current_role = await self.get_with_relation(db, role_id=role_id)
-        # 更新菜单
-        menus = await db.execute(select(Menu).where(Menu.id.in_(menu_ids.menus)))
-        current_role.menus = menus.scalars().all()
-        return len(current_role.menus)
+        await self.sync_association(
+            db, table=RoleMenu, owner_column='role_id', owner_id=role.id, target_column='menu_id', target_ids=menu_ids.menus
+        )
+        db.expire(role, ['menus'])
+        return len(set(menu_ids.menus))
     
 role_dao: CRUDRole = CRUDRole(Role)
\ No newline at end of file
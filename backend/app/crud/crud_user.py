@@ -16,7 +16,7 @@ from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.app.crud.crud_base import CRUDBase
-from backend.app.models import User, Role, Dept
+from backend.app.models import User, Role, Dept, UserRole
 from backend.app.schemas.user import (
     CreateUserParam, 
     UpdateUserParam, 
@@ -28,6 +28,9 @@ from backend.app.utils.timezone import timezone
 
 
 class CRUDUser(CRUDBase[User, CreateUserParam, UpdateUserParam]):
+    # 游标分页排序键
+    cursor_keys = (User.join_time, User.id)
+
     async def get_by_username(self, db: AsyncSession, *, username: str) -> Optional[User]:
         return await self.single(db, filters={User.username: username})
     
@@ -55,9 +58,12 @@ class CRUDUser(CRUDBase[User, CreateUserParam, UpdateUserParam]):
         dict_obj = obj.model_dump(exclude={'roles'})
         dict_obj.update({'salt': salt})
         new_user = self.model(**dict_obj)
-        role_list = [await db.get(Role, role_id) for role_id in obj.roles]
-        new_user.roles.extend(role_list)
         db.add(new_user)
+        await db.flush()
+        await self.sync_association(
+            db, table=UserRole, owner_column='user_id', owner_id=new_user.id, target_column='role_id', target_ids=obj.roles
+        )
+        db.expire(new_user, ['roles'])
         return new_user
 
     async def update_userinfo(self, db: AsyncSession, *, input_user: User, obj: UpdateUserParam) -> int:
@@ -80,18 +86,10 @@ class CRUDUser(CRUDBase[User, CreateUserParam, UpdateUserParam]):
         :param obj:
         :return:
         """
-        # 现有角色Id
-        cur_role_ids = [r.id for r in input_user.roles]
-        # 删除用户角色
-        for r in list(input_user.roles):
-            if r.id not in obj.roles:
-                input_user.roles.remove(r)
-        # 添加用户角色
-        role_list = []
-        for role_id in obj.roles:
-            if role_id not in cur_role_ids:
-                role_list.append(await db.get(Role, role_id))
-        input_user.roles.extend(role_list)
+        await self.sync_association(
+            db, table=UserRole, owner_column='user_id', owner_id=input_user.id, target_column='role_id', target_ids=obj.roles
+        )
+        db.expire(input_user, ['roles'])
 
     async def update_avatar(self, db: AsyncSession, *, current_user: User, avatar: AvatarParam) -> int:
         """
@@ -163,7 +161,7 @@ class CRUDUser(CRUDBase[User, CreateUserParam, UpdateUserParam]):
             select(self.model)
             .options(selectinload(self.model.dept))
             .options(selectinload(self.model.roles).selectinload(Role.menus))
-            .order_by(desc(self.model.join_time))
+            .order_by(desc(self.model.join_time), desc(self.model.id))
         )
         where_list = []
         if dept:
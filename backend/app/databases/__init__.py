@@ -1 +1,3 @@
-from .mysql import async_engine, async_session, CurrentSession, create_table
\ No newline at end of file
+from .mysql import async_engine, async_session, async_read_session, read_router, CurrentSession, create_table
+from .pool import pool_metrics
+from .profiler import query_profiler
\ No newline at end of file
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   batch_writer.py
+@Time    :   2024/05/23 10:31:52
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+import asyncio
+from typing import Any, Awaitable, Callable, Literal, Optional, Type
+
+from sqlalchemy import insert
+
+from backend.app.common.log import log
+from backend.app.databases.mysql import async_session
+from backend.app.models.base import MappedBase
+
+# 停止信号
+_STOP = object()
+
+
+class BatchWriter:
+    """
+    进程内的批量写入器
+
+    记录先进入有界队列, 由后台任务每攒够 batch_size 条或每隔 flush_interval_ms 毫秒以一条多行 INSERT 写入,
+    指定 sink 时整批交给 sink 处理(例如提交到任务队列);
+    队列写满时按 overflow 策略丢弃并计数(drop)或等待队列空出(block)
+    """
+
+    def __init__(
+        self,
+        model: Type[MappedBase],
+        *,
+        batch_size: int,
+        flush_interval_ms: int,
+        max_queue_size: int,
+        overflow: Literal['drop', 'block'] = 'drop',
+        sink: Optional[Callable[[list[dict[str, Any]]], Awaitable[None]]] = None,
+    ):
+        self.model = model
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.overflow = overflow
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def startup(self) -> None:
+        """
+        启动后台写入任务
+
+        :return:
+        """
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        """
+        写入队列中剩余的记录并停止后台任务
+
+        :return:
+        """
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        await self._queue.put(_STOP)
+        await task
+        self._queue = None
+
+    async def put(self, row: dict[str, Any]) -> None:
+        """
+        提交一条记录
+
+        :param row: 列名 -> 值, 同一写入器的记录应包含相同的列
+        :return:
+        """
+        if self._task is None:
+            # 未启动(例如脚本中调用)时直接写入
+            await self._flush([row])
+            return
+        if self.overflow == 'block':
+            await self._queue.put(row)
+            return
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                log.warning(f'{self.model.__tablename__} 写入队列已满, 累计丢弃 {self.dropped} 条记录')
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[dict[str, Any]]) -> None:
+        try:
+            if self.sink is not None:
+                await self.sink(batch)
+            else:
+                async with async_session.begin() as db:
+                    await db.execute(insert(self.model.__table__).values(batch))
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            log.error(f'{self.model.__tablename__} 批量写入 {len(batch)} 条记录失败: {e}')
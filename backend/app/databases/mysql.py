@@ -14,43 +14,85 @@ from fastapi import Depends
 from typing_extensions import Annotated
 from sqlalchemy import create_engine
 from sqlalchemy import URL
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import Session, sessionmaker, scoped_session
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 
 from backend.app.core.conf import settings
 from backend.app.common.log import log
+from backend.app.common.metrics import instrument_engine
+from backend.app.common.tracing import trace_engine
 from backend.app.models.base import MappedBase
+from backend.app.databases.pool import MeteredAsyncAdaptedQueuePool, pool_metrics
+from backend.app.databases.profiler import query_profiler
+from backend.app.databases.routing import PrimarySession, ReadRouter
+from backend.app.databases.uow import current_uow
 
 T = TypeVar('T', str, bytes)
 
 DB_SCHEMAS = ["mysql+pymysql", "mysql+asyncmy"]
 TEMPLATE = (
-    f'{{DB_SCHEMA}}://{settings.MYSQL_USER}:{settings.MYSQL_PASSWORD}@{settings.MYSQL_HOST}:'
-    f'{settings.MYSQL_PORT}/{settings.MYSQL_DB}?charset={settings.MYSQL_CHARSET}'
+    f'{{DB_SCHEMA}}://{settings.MYSQL_USER}:{settings.MYSQL_PASSWORD}@{{HOST}}:'
+    f'{{PORT}}/{settings.MYSQL_DB}?charset={settings.MYSQL_CHARSET}'
 )
 
-def get_db_url(is_async: bool=True):
-    return TEMPLATE.format(DB_SCHEMA=DB_SCHEMAS[is_async])
+def get_db_url(is_async: bool=True, replica: bool=False):
+    if replica:
+        return TEMPLATE.format(DB_SCHEMA=DB_SCHEMAS[is_async], HOST=settings.MYSQL_REPLICA_HOST, PORT=settings.MYSQL_REPLICA_PORT)
+    return TEMPLATE.format(DB_SCHEMA=DB_SCHEMAS[is_async], HOST=settings.MYSQL_HOST, PORT=settings.MYSQL_PORT)
 
-def create_engine_and_session(url, is_async: bool=True):
+def create_engine_and_session(url, is_async: bool=True, replica: bool=False):
+    pool_options = dict(
+        pool_size=settings.MYSQL_POOL_SIZE,
+        max_overflow=settings.MYSQL_POOL_MAX_OVERFLOW,
+        pool_timeout=settings.MYSQL_POOL_TIMEOUT,
+        pool_recycle=settings.MYSQL_POOL_RECYCLE,
+        # optimistic 模式下断开的连接在使用出错时失效, 同时失效池中更早创建的连接
+        pool_pre_ping=settings.MYSQL_POOL_DISCONNECT == 'pessimistic',
+    )
     try:
-        engine = create_async_engine(url, echo=settings.MYSQL_ECHO, future=True, pool_pre_ping=True) \
+        engine = create_async_engine(url, echo=settings.MYSQL_ECHO, future=True, poolclass=None if replica else MeteredAsyncAdaptedQueuePool, **pool_options) \
                     if is_async else \
-                    create_engine(url, echo=settings.MYSQL_ECHO, pool_pre_ping=True)
+                    create_engine(url, echo=settings.MYSQL_ECHO, **pool_options)
         
     except Exception as e:
         log.error('❌ 数据库链接失败 {}', e)
         sys.exit()
     else:
         if is_async:
-            session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+            session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False, sync_session_class=Session if replica else PrimarySession)
         else:
             session = scoped_session(sessionmaker(bind=engine, autoflush=False, expire_on_commit=False, autocommit=False))
         return engine, session
 
 async_engine, async_session = create_engine_and_session(get_db_url())
+pool_metrics.bind(async_engine)
+
+# 从库
+if settings.MYSQL_REPLICA_HOST:
+    async_read_engine, async_read_session = create_engine_and_session(get_db_url(replica=True), replica=True)
+else:
+    async_read_engine, async_read_session = async_engine, async_session
+if settings.METRICS_ENABLED:
+    instrument_engine(async_engine.sync_engine, 'primary')
+    if async_read_engine is not async_engine:
+        instrument_engine(async_read_engine.sync_engine, 'replica')
+if settings.MYSQL_PROFILER:
+    query_profiler.bind(async_engine.sync_engine)
+    if async_read_engine is not async_engine:
+        query_profiler.bind(async_read_engine.sync_engine)
+if settings.TRACE_ENABLED:
+    trace_engine(async_engine.sync_engine)
+    if async_read_engine is not async_engine:
+        trace_engine(async_read_engine.sync_engine)
+read_router = ReadRouter(async_session, async_read_session, sticky_seconds=settings.MYSQL_REPLICA_STICKY_SECONDS)
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    current = current_uow()
+    if current is not None:
+        # 存在请求级工作单元时加入请求会话
+        async with current.session() as session:
+            yield session
+        return
     session = async_session()
     try:
         yield session
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   pool.py
+@Time    :   2024/05/25 10:18:36
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+import time
+from bisect import bisect_left
+from typing import Any, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+# 等待时间直方图的桶上界，单位：秒
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, float('inf'))
+
+
+class PoolMetrics:
+    """
+    连接池指标
+
+    等待时间由 MeteredAsyncAdaptedQueuePool 在每次取连接时记录, 使用中、溢出等瞬时值在 snapshot 时从池中读取
+    """
+
+    def __init__(self):
+        self.engine: Optional[AsyncEngine] = None
+        self.checkouts = 0
+        self.timeouts = 0
+        self.invalidated = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_buckets = [0] * len(WAIT_BUCKETS)
+
+    def bind(self, engine: AsyncEngine) -> None:
+        """
+        绑定引擎
+
+        :param engine:
+        :return:
+        """
+        self.engine = engine
+        event.listen(engine.sync_engine, 'invalidate', self._on_invalidate)
+
+    def _on_invalidate(self, *args: Any) -> None:
+        self.invalidated += 1
+
+    def observe_wait(self, seconds: float, *, timeout: bool = False) -> None:
+        """
+        记录一次取连接的等待时间
+
+        :param seconds:
+        :param timeout: 是否等待超时
+        :return:
+        """
+        if timeout:
+            self.timeouts += 1
+            return
+        self.checkouts += 1
+        self.wait_seconds_total += seconds
+        if seconds > self.wait_seconds_max:
+            self.wait_seconds_max = seconds
+        self.wait_buckets[bisect_left(WAIT_BUCKETS, seconds)] += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        获取当前指标
+
+        :return:
+        """
+        pool: Optional[Pool] = self.engine.pool if self.engine is not None else None
+        return {
+            'pool_size': pool.size() if pool is not None else 0,
+            'checked_in': pool.checkedin() if pool is not None else 0,
+            'in_use': pool.checkedout() if pool is not None else 0,
+            'overflow': max(pool.overflow(), 0) if pool is not None else 0,
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'invalidated': self.invalidated,
+            'wait_seconds_total': self.wait_seconds_total,
+            'wait_seconds_avg': self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+            'wait_seconds_max': self.wait_seconds_max,
+            'wait_buckets': {str(le): count for le, count in zip(WAIT_BUCKETS, self.wait_buckets)},
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class MeteredAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """记录取连接等待时间的连接池, 等待时间包含排队、新建溢出连接与 pre ping 的耗时"""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_metrics.observe_wait(time.perf_counter() - start, timeout=True)
+            raise
+        pool_metrics.observe_wait(time.perf_counter() - start)
+        return connection
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   profiler.py
+@Time    :   2024/05/27 17:26:44
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+import re
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+
+from sqlalchemy import event
+
+from backend.app.common.log import log
+from backend.app.core.conf import settings
+
+# 字符串、数字字面量
+_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\b\d+(?:\.\d+)?\b")
+# 占位符列表, 如 IN (%s, %s) 与多行 VALUES
+_PARAM_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_VALUES_LIST = re.compile(r'(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|:\w+|\?')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement: str) -> str:
+    """
+    将语句规范化为指纹: 字面量与占位符替换为 ?, 占位符列表折叠为 (...), 合并空白
+
+    :param statement:
+    :return:
+    """
+    text = _LITERAL.sub('?', statement)
+    text = _PLACEHOLDER.sub('?', text)
+    text = _PARAM_LIST.sub('(...)', text)
+    text = _VALUES_LIST.sub(r'\1', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+class QueryStats:
+    """单个指纹的统计, 最近 sample_size 次的耗时保存在环形缓冲中用于计算分位数"""
+
+    __slots__ = ('count', 'total', 'max', 'rows', 'n_plus_one', 'samples')
+
+    def __init__(self, sample_size: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.n_plus_one = 0
+        self.samples: deque[float] = deque(maxlen=sample_size)
+
+    def observe(self, seconds: float, rows: int) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.rows += rows
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1e3, 3),
+            'avg_ms': round(self.total * 1e3 / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.5) * 1e3, 3),
+            'p99_ms': round(self.percentile(0.99) * 1e3, 3),
+            'max_ms': round(self.max * 1e3, 3),
+            'rows': self.rows,
+            'n_plus_one': self.n_plus_one,
+        }
+
+
+class _RequestQueries:
+    __slots__ = ('scope', 'counts')
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.counts: Counter[str] = Counter()
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get('route')
+        name = getattr(route, 'name', None)
+        return f'{name} {self.scope["path"]}' if name else self.scope['path']
+
+
+# 当前请求执行的语句, 由 QueryProfilerMiddleware 设置
+_request_queries: ContextVar[Optional[_RequestQueries]] = ContextVar('db_request_queries', default=None)
+
+
+class QueryProfiler:
+    """
+    SQL 语句分析器
+
+    通过引擎事件按指纹统计执行次数、耗时分位数与返回行数; 超过 slow_ms 的语句连同发起请求的路由记录到日志;
+    同一请求中同一指纹执行超过 n_plus_one_threshold 次时记录疑似 N+1 查询
+    """
+
+    def __init__(self, *, slow_ms: int, sample_size: int, max_fingerprints: int, n_plus_one_threshold: int):
+        self.slow_seconds = slow_ms / 1000
+        self.sample_size = sample_size
+        self.max_fingerprints = max_fingerprints
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.stats: dict[str, QueryStats] = {}
+        self.slow = 0
+        # 语句 -> 指纹, 已编译语句会被 SQLAlchemy 缓存, 相同文本反复出现
+        self._fingerprints: OrderedDict[str, str] = OrderedDict()
+
+    def bind(self, engine: Any) -> None:
+        """
+        绑定引擎
+
+        :param engine: 同步引擎, 异步引擎传入 async_engine.sync_engine
+        :return:
+        """
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+        event.listen(engine, 'handle_error', self._error)
+
+    def fingerprint(self, statement: str) -> str:
+        fp = self._fingerprints.get(statement)
+        if fp is None:
+            fp = self._fingerprints[statement] = fingerprint(statement)
+            if len(self._fingerprints) > self.max_fingerprints:
+                self._fingerprints.popitem(last=False)
+        else:
+            self._fingerprints.move_to_end(statement)
+        return fp
+
+    @staticmethod
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault('profiler_query_start', []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        seconds = time.perf_counter() - conn.info['profiler_query_start'].pop()
+        fp = self.fingerprint(statement)
+        stats = self.stats.get(fp)
+        if stats is None:
+            # 指纹数量达到上限后新指纹合并统计, 请求内仍按原指纹计数, 避免不同语句被误判为 N+1
+            key = fp if len(self.stats) < self.max_fingerprints else '<other>'
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = QueryStats(self.sample_size)
+        rowcount = getattr(cursor, 'rowcount', -1)
+        stats.observe(seconds, rowcount if rowcount and rowcount > 0 else 0)
+        request = _request_queries.get()
+        if request is not None:
+            request.counts[fp] += 1
+        if seconds >= self.slow_seconds:
+            self.slow += 1
+            route = request.route if request is not None else '-'
+            log.warning(f'慢查询 {seconds * 1e3:.1f} ms | {route} | {_WHITESPACE.sub(" ", statement)[:2000]}')
+
+    @staticmethod
+    def _error(context) -> None:
+        starts = context.connection.info.get('profiler_query_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    @contextmanager
+    def request(self, scope: dict) -> Iterator[None]:
+        """
+        统计一次请求中执行的语句, 结束时检查 N+1 查询
+
+        :param scope: ASGI scope, 用于获取路由
+        :return:
+        """
+        queries = _RequestQueries(scope)
+        token = _request_queries.set(queries)
+        try:
+            yield
+        finally:
+            _request_queries.reset(token)
+            for fp, count in queries.counts.items():
+                if count > self.n_plus_one_threshold:
+                    stats = self.stats.get(fp)
+                    if stats is not None:
+                        stats.n_plus_one += 1
+                    log.warning(f'疑似 N+1 查询: {queries.route} 中同一语句执行 {count} 次 | {fp[:2000]}')
+
+    def snapshot(self, *, order_by: str = 'total_ms', limit: int = 50) -> dict[str, Any]:
+        """
+        获取按 order_by 排序的前 limit 个指纹的统计
+
+        :param order_by: count / total_ms / avg_ms / p50_ms / p99_ms / max_ms / rows / n_plus_one
+        :param limit:
+        :return:
+        """
+        items = [{'fingerprint': fp, **stats.snapshot()} for fp, stats in list(self.stats.items())]
+        items.sort(key=lambda item: item.get(order_by, 0), reverse=True)
+        return {
+            'fingerprints': len(self.stats),
+            'slow': self.slow,
+            'slow_ms': self.slow_seconds * 1e3,
+            'queries': items[:limit],
+        }
+
+    def reset(self) -> None:
+        self.stats.clear()
+        self.slow = 0
+
+
+query_profiler = QueryProfiler(
+    slow_ms=settings.MYSQL_SLOW_QUERY_MS,
+    sample_size=settings.MYSQL_PROFILER_SAMPLE_SIZE,
+    max_fingerprints=settings.MYSQL_PROFILER_MAX_FINGERPRINTS,
+    n_plus_one_threshold=settings.MYSQL_N_PLUS_ONE_THRESHOLD,
+)
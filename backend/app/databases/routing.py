@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   routing.py
+@Time    :   2024/05/25 14:06:51
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from backend.app.common.cache.redis import redis_client
+from backend.app.common.log import log
+from backend.app.core.conf import settings
+
+
+class PrimarySession(Session):
+    """主库会话, ReadRouter 通过其事件感知写入"""
+
+
+class _RouteState:
+    __slots__ = ('user_id', 'sticky')
+
+    def __init__(self, user_id: int, sticky: bool):
+        self.user_id = user_id
+        self.sticky = sticky
+
+
+# 当前请求的用户与粘滞状态, 由认证时 bind 设置
+_route_state: ContextVar[Optional[_RouteState]] = ContextVar('db_route_state', default=None)
+# 显式指定主库
+_force_primary: ContextVar[bool] = ContextVar('db_force_primary', default=False)
+
+
+class ReadRouter:
+    """
+    读写分离路由
+
+    只读会话默认使用从库; 用户提交写入后的 sticky_seconds 秒内, 该用户的读取使用主库以读到自己的写入.
+    写入标记同时记录在进程内与 redis 中, 认证时随 token 校验一并读取, 不额外增加 redis 往返.
+    未配置从库时所有会话均来自主库
+    """
+
+    def __init__(self, primary: async_sessionmaker, replica: async_sessionmaker, *, sticky_seconds: int):
+        self.primary = primary
+        self.replica = replica
+        self.sticky_seconds = sticky_seconds
+        self._recent_writers: dict[int, float] = {}
+        self._tasks: set[asyncio.Task] = set()
+        if self.enabled:
+            event.listen(PrimarySession, 'do_orm_execute', self._on_execute)
+            event.listen(PrimarySession, 'after_flush', self._on_flush)
+            event.listen(PrimarySession, 'after_commit', self._on_commit)
+            event.listen(PrimarySession, 'after_rollback', self._on_rollback)
+
+    @property
+    def enabled(self) -> bool:
+        return self.replica is not self.primary
+
+    def sticky_key(self, user_id: int) -> str:
+        return f'{settings.MYSQL_REPLICA_REDIS_PREFIX}:sticky:{user_id}'
+
+    def sticky_keys(self, user_id: int) -> list[str]:
+        """
+        认证时需要一并读取的 redis 键, 未配置从库时为空
+
+        :param user_id:
+        :return:
+        """
+        return [self.sticky_key(user_id)] if self.enabled else []
+
+    def bind(self, user_id: int, *, sticky: bool = False) -> None:
+        """
+        绑定当前请求的用户
+
+        :param user_id:
+        :param sticky: redis 中是否存在该用户的写入标记
+        :return:
+        """
+        if not self.enabled:
+            return
+        expires = self._recent_writers.get(user_id)
+        if expires is not None and expires < time.monotonic():
+            self._recent_writers.pop(user_id, None)
+            expires = None
+        _route_state.set(_RouteState(user_id, sticky or expires is not None))
+
+    def prefers_primary(self, *, primary: bool = False) -> bool:
+        """
+        当前读取是否应使用主库
+
+        :param primary: 是否强制使用主库
+        :return:
+        """
+        if primary or not self.enabled or _force_primary.get():
+            return True
+        state = _route_state.get()
+        return state is not None and state.sticky
+
+    def session(self, *, primary: bool = False) -> AsyncSession:
+        """
+        获取只读会话
+
+        :param primary: 是否强制使用主库
+        :return:
+        """
+        return self.primary() if self.prefers_primary(primary=primary) else self.replica()
+
+    @contextmanager
+    def use_primary(self) -> Iterator[None]:
+        """
+        在上下文中强制读取主库
+
+        :return:
+        """
+        token = _force_primary.set(True)
+        try:
+            yield
+        finally:
+            _force_primary.reset(token)
+
+    def mark_write(self) -> None:
+        """
+        标记当前用户刚刚提交了写入
+
+        :return:
+        """
+        state = _route_state.get()
+        if state is None:
+            return
+        state.sticky = True
+        now = time.monotonic()
+        # 粘滞时长相同, 重新插入到末尾后记录按过期时间有序, 从头部清理已过期的记录
+        self._recent_writers.pop(state.user_id, None)
+        self._recent_writers[state.user_id] = now + self.sticky_seconds
+        while self._recent_writers:
+            user_id, expires = next(iter(self._recent_writers.items()))
+            if expires > now:
+                break
+            del self._recent_writers[user_id]
+        task = asyncio.get_running_loop().create_task(self._publish(state.user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _publish(self, user_id: int) -> None:
+        try:
+            await redis_client.set(self.sticky_key(user_id), 1, ex=self.sticky_seconds)
+        except Exception as e:
+            log.warning(f'写入主库粘滞标记失败: {e}')
+
+    @staticmethod
+    def _on_execute(orm_execute_state) -> None:
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            orm_execute_state.session.info['db_write'] = True
+
+    @staticmethod
+    def _on_flush(session: Session, flush_context) -> None:
+        session.info['db_write'] = True
+
+    def _on_commit(self, session: Session) -> None:
+        if session.info.pop('db_write', False):
+            self.mark_write()
+
+    @staticmethod
+    def _on_rollback(session: Session) -> None:
+        session.info.pop('db_write', None)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   uow.py
+@Time    :   2024/05/25 16:40:12
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncContextManager, AsyncIterator, Optional
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, async_sessionmaker
+
+
+class UnitOfWork:
+    """
+    请求级工作单元
+
+    一个请求内所有加入的会话共用同一个 AsyncSession, 该会话绑定在首次使用时取出的一条连接上, 直到请求结束才归还连接池.
+    事务边界为最外层的 transaction: 最外层正常退出时提交, 异常时回滚; 嵌套的 transaction 作为外层事务中的 SAVEPOINT
+    """
+
+    def __init__(self, engine: AsyncEngine, session_factory: async_sessionmaker):
+        self.engine = engine
+        self.session_factory = session_factory
+        self._connection: Optional[AsyncConnection] = None
+        self._session: Optional[AsyncSession] = None
+        self._depth = 0
+
+    async def _ensure(self) -> AsyncSession:
+        if self._session is None:
+            self._connection = await self.engine.connect()
+            self._session = self.session_factory(bind=self._connection)
+        return self._session
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """
+        加入请求会话, 退出时不提交也不关闭
+
+        :return:
+        """
+        yield await self._ensure()
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[AsyncSession]:
+        """
+        加入请求事务, 最外层退出时提交
+
+        :return:
+        """
+        db = await self._ensure()
+        if self._depth:
+            # 嵌套事务使用 SAVEPOINT, 内层失败只回滚内层
+            self._depth += 1
+            try:
+                async with db.begin_nested():
+                    yield db
+            finally:
+                self._depth -= 1
+            return
+        self._depth = 1
+        try:
+            yield db
+        except BaseException:
+            await db.rollback()
+            raise
+        else:
+            await db.commit()
+        finally:
+            self._depth = 0
+
+    async def close(self) -> None:
+        """
+        回滚未提交的事务并归还连接
+
+        :return:
+        """
+        session, connection = self._session, self._connection
+        self._session = self._connection = None
+        self._depth = 0
+        try:
+            if session is not None:
+                await session.close()
+        finally:
+            if connection is not None:
+                await connection.close()
+
+
+_current_uow: ContextVar[Optional[UnitOfWork]] = ContextVar('db_unit_of_work', default=None)
+
+
+def current_uow() -> Optional[UnitOfWork]:
+    return _current_uow.get()
+
+
+@asynccontextmanager
+async def unit_of_work(engine: AsyncEngine, session_factory: async_sessionmaker) -> AsyncIterator[UnitOfWork]:
+    """
+    开启请求级工作单元
+
+    :param engine:
+    :param session_factory:
+    :return:
+    """
+    uow = UnitOfWork(engine, session_factory)
+    token = _current_uow.set(uow)
+    try:
+        yield uow
+    finally:
+        _current_uow.reset(token)
+        await uow.close()
+
+
+def primary_session(session_factory: async_sessionmaker, *, independent: bool = False) -> AsyncContextManager[AsyncSession]:
+    """
+    获取主库会话, 存在工作单元时加入请求会话
+
+    :param session_factory: 没有工作单元或 independent 时使用的会话工厂
+    :param independent: 是否使用独立的会话
+    :return:
+    """
+    uow = _current_uow.get()
+    if uow is None or independent:
+        return session_factory()
+    return uow.session()
+
+
+def transaction(session_factory: async_sessionmaker, *, independent: bool = False) -> AsyncContextManager[AsyncSession]:
+    """
+    开启主库事务, 存在工作单元时加入请求事务
+
+    :param session_factory: 没有工作单元或 independent 时使用的会话工厂
+    :param independent: 是否使用独立的事务, 例如无论请求成败都需要保存的日志
+    :return:
+    """
+    uow = _current_uow.get()
+    if uow is None or independent:
+        return session_factory.begin()
+    return uow.transaction()
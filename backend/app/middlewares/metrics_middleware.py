@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   metrics_middleware.py
+@Time    :   2024/05/27 10:05:48
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.app.common.metrics import http_request_duration
+from backend.app.core.conf import settings
+
+
+class MetricsMiddleware:
+    """
+    请求耗时指标中间件
+
+    以 APIRoute.name 作为路由标签(ensure_unique_route_names 保证唯一), 文档等非 APIRoute 路由使用接口函数名,
+    未匹配路由的请求归为 <unmatched>, 避免标签数量随路径增长
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or scope['path'] == settings.METRICS_URL:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            name = getattr(route, 'name', None) or getattr(scope.get('endpoint'), '__name__', None) or '<unmatched>'
+            http_request_duration.labels(name, scope['method'], str(status)).observe(time.perf_counter() - start)
@@ -8,99 +8,138 @@
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
-from typing import Any, AsyncGenerator, Optional, Dict, Tuple
-from fastapi import Response
+from typing import Any, Optional, Dict
 from asgiref.sync import sync_to_async
-from starlette.background import BackgroundTask
 from starlette.datastructures import UploadFile
 from starlette.requests import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp, Scope, Receive, Send
+from starlette.types import ASGIApp, Message, Scope, Receive, Send
 
 from backend.app.common.enums import OperaLogCipherType
 from backend.app.common.log import log
+from backend.app.common.tracing import span
 from backend.app.core.conf import settings
 from backend.app.schemas import CreateOperaLogParam
 from backend.app.services import opera_log_service
 from backend.app.utils.encrypt import AESCipher, Md5Cipher, ItsDCipher
-from backend.app.utils.request_parse import parse_user_agent_info, parse_ip_info
+from backend.app.utils.request_parse import parse_user_agent_info, get_request_ip
 from backend.app.utils.timezone import timezone
 
-class OperaLogMiddleware(BaseHTTPMiddleware):
+
+class _BodyTee:
+    """
+    透传 receive 消息, 同时截留不超过 max_bytes 的请求体用于日志记录
+
+    超出上限后丢弃已截留内容, 请求体(例如文件上传)按原样流式传递给下游
+    """
+
+    def __init__(self, receive: Receive, max_bytes: int):
+        self._receive = receive
+        self.max_bytes = max_bytes
+        self.chunks: list[bytes] = []
+        self.size = 0
+        self.truncated = False
+
+    async def receive(self) -> Message:
+        message = await self._receive()
+        if message['type'] == 'http.request':
+            body = message.get('body', b'')
+            self.size += len(body)
+            if not self.truncated:
+                if self.size > self.max_bytes:
+                    self.truncated = True
+                    self.chunks.clear()
+                elif body:
+                    self.chunks.append(body)
+        return message
+
+    @property
+    def body(self) -> bytes:
+        return b''.join(self.chunks)
+
+
+class OperaLogMiddleware:
     """操作日志中间件"""
 
-    async def dispatch(self, request: Request, call_next) -> Response:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
         # 排除记录白名单
-        path = request.url.path
+        path = scope['path']
         if path in settings.OPERA_LOG_EXCLUDE or not path.startswith(f'{settings.API_V1_STR}'):
-            return await call_next(request)
-        
+            await self.app(scope, receive, send)
+            return
+
         # 请求解析
-        user_agent, device, os, browser = await parse_user_agent_info(request)
-        ip, country, region, city = await parse_ip_info(request)
+        request = Request(scope)
+        with span('opera_log.parse'):
+            user_agent, device, os, browser = parse_user_agent_info(request)
+            # 属地不在请求中解析, 由日志写入后的后台任务补全, 接口需要时见 get_request_location
+            ip = await get_request_ip(request)
         try:
             # 此信息依赖于 jwt 中间件
             username = request.user.username
         except AttributeError:
             username = None
         method = request.method
-        router = request.scope.get('route')
-        summary = getattr(router, 'summary', None) or ''
-        args = await self.get_request_args(request)
-        args = await self.desensitization(args)
 
         # 设置附加请求信息
         request.state.ip = ip
-        request.state.country = country
-        request.state.region = region
-        request.state.city = city
         request.state.user_agent = user_agent
         request.state.os = os
         request.state.browser = browser
         request.state.device = device
 
         # 执行请求
+        tee = _BodyTee(receive, settings.OPERA_LOG_ARGS_MAX_BYTES)
         start_time = timezone.now()
-        code, msg, status, err, response = await self.execute_request(request, call_next)
+        code, msg, status, err = await self.execute_request(request, tee.receive, send)
         end_time = timezone.now()
         cost_time = (end_time - start_time).total_seconds() * 1000.0
 
-        # 日志创建
-        opera_log_in = CreateOperaLogParam(
-            username=username,
-            method=method,
-            title=summary,
-            path=path,
-            ip=ip,
-            country=country,
-            region=region,
-            city=city,
-            user_agent=user_agent,
-            os=os,
-            browser=browser,
-            device=device,
-            args=args,
-            status=status,
-            code=code,
-            msg=msg,
-            cost_time=cost_time,
-            opera_time=start_time,
-        )
-        back = BackgroundTask(opera_log_service.create, obj=opera_log_in)
-        await back()
+        with span('opera_log.record'):
+            # 响应已发送, 此时再解析路由信息与请求参数
+            router = scope.get('route')
+            summary = getattr(router, 'summary', None) or ''
+            args = await self.get_request_args(request, tee)
+            args = await self.desensitization(args)
+
+            # 日志创建
+            opera_log_in = CreateOperaLogParam(
+                username=username,
+                method=method,
+                title=summary,
+                path=path,
+                ip=ip,
+                country=getattr(request.state, 'country', None),
+                region=getattr(request.state, 'region', None),
+                city=getattr(request.state, 'city', None),
+                user_agent=user_agent,
+                os=os,
+                browser=browser,
+                device=device,
+                args=args,
+                status=status,
+                code=code,
+                msg=msg,
+                cost_time=cost_time,
+                opera_time=start_time,
+            )
+            await opera_log_service.append(obj=opera_log_in)
 
         # 错误抛出
         if err:
             raise err from None
 
-        return response
-
-    async def execute_request(self, request: Request, call_next) -> tuple:
+    async def execute_request(self, request: Request, receive: Receive, send: Send) -> tuple:
         """执行请求"""
         err = None
-        response = None
         try:
-            response = await call_next(request)
+            await self.app(request.scope, receive, send)
             code, msg, status = await self.request_exception_handler(request)
         except Exception as e:
             log.exception(e)
@@ -110,7 +149,7 @@ class OperaLogMiddleware(BaseHTTPMiddleware):
             status = 0
             err = e
 
-        return str(code), msg, status, err, response
+        return str(code), msg, status, err
 
     @staticmethod
     @sync_to_async
@@ -138,25 +177,33 @@ class OperaLogMiddleware(BaseHTTPMiddleware):
         return code, msg, status
 
     @staticmethod
-    async def get_request_args(request: Request) -> dict:
+    async def get_request_args(request: Request, tee: _BodyTee) -> dict:
         args = dict(request.query_params)
         args.update(request.path_params)
-        # Tip: .body() 必须在 .form() 之前获取
-        # https://github.com/encode/starlette/discussions/1933
-        body_data = await request.body()
-        form_data = await request.form()
-        if len(form_data) > 0:
-            args.update({k: v.filename if isinstance(v, UploadFile) else v for k, v in form_data.items()})
-        else:
-            if body_data:
-                json_data = await request.json()
+        if tee.truncated:
+            args['__body__'] = f'<{tee.size} bytes, exceeds {tee.max_bytes} bytes>'
+            return args
+        body_data = tee.body
+        if not body_data:
+            return args
+
+        async def replay() -> Message:
+            return {'type': 'http.request', 'body': body_data, 'more_body': False}
+
+        # 以截留的请求体重建请求, 下游已消费的 receive 不可再次读取
+        captured = Request(request.scope, replay)
+        content_type = captured.headers.get('content-type', '')
+        try:
+            if content_type.startswith(('multipart/form-data', 'application/x-www-form-urlencoded')):
+                async with captured.form() as form_data:
+                    args.update({k: v.filename if isinstance(v, UploadFile) else v for k, v in form_data.items()})
+            else:
+                json_data = await captured.json()
                 if not isinstance(json_data, dict):
-                    json_data = {
-                        f'{type(json_data)}_to_dict_data': json_data.decode('utf-8')
-                        if isinstance(json_data, bytes)
-                        else json_data
-                    }
+                    json_data = {f'{type(json_data)}_to_dict_data': json_data}
                 args.update(json_data)
+        except Exception:
+            args['__body__'] = body_data.decode('utf-8', errors='replace')
         return args
 
     @staticmethod
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   query_profiler_middleware.py
+@Time    :   2024/05/27 18:02:15
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from backend.app.databases.profiler import query_profiler
+
+
+class QueryProfilerMiddleware:
+    """按请求统计执行的 SQL 语句, 为慢查询日志提供路由, 并在请求结束时检查 N+1 查询"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        with query_profiler.request(scope):
+            await self.app(scope, receive, send)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   tracing_middleware.py
+@Time    :   2024/05/27 15:02:37
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+import random
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from backend.app.common.tracing import (
+    SPAN_KIND_SERVER,
+    end_span,
+    end_trace,
+    server_timing,
+    span,
+    start_span,
+    start_trace,
+    trace_exporter,
+)
+from backend.app.core.conf import settings
+
+
+class TracingMiddleware:
+    """
+    链路记录中间件
+
+    按 TRACE_SAMPLE_RATE 采样导出; dev 环境开启 TRACE_SERVER_TIMING 时记录所有请求, 并在响应头中以 Server-Timing
+    返回响应发送前已结束的各 span 耗时
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.server_timing = settings.ENVIRONMENT == 'dev' and settings.TRACE_SERVER_TIMING
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        sampled = random.random() < settings.TRACE_SAMPLE_RATE
+        if not sampled and not self.server_timing:
+            await self.app(scope, receive, send)
+            return
+
+        trace, token = start_trace(sampled)
+        root = start_span('http.request', kind=SPAN_KIND_SERVER, **{'http.method': scope['method'], 'http.target': scope['path']})
+
+        async def send_wrapper(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                root[1].attributes['http.status_code'] = message['status']
+                if self.server_timing:
+                    total = f'total;dur={(time.time_ns() - root[1].start_ns) / 1e6:.2f}'
+                    timing = server_timing(trace)
+                    MutableHeaders(scope=message).append('Server-Timing', f'{timing}, {total}' if timing else total)
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            route = scope.get('route')
+            if route is not None:
+                root[1].attributes['http.route'] = route.name
+            end_span(root, error)
+            end_trace(token)
+            if sampled:
+                trace_exporter.submit(trace)
+
+
+class SpanMiddleware:
+    """以 span 记录外层中间件及其之后的处理耗时, 由 register_middleware 在每个中间件外添加"""
+
+    def __init__(self, app: ASGIApp, name: str):
+        self.app = app
+        self.name = name
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        with span(self.name):
+            await self.app(scope, receive, send)
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   uow_middleware.py
+@Time    :   2024/05/25 17:12:30
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from backend.app.databases.mysql import async_engine, async_session
+from backend.app.databases.uow import unit_of_work
+
+
+class UnitOfWorkMiddleware:
+    """请求级工作单元中间件, 请求内首次访问数据库时取出连接, 请求结束后归还"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        async with unit_of_work(async_engine, async_session):
+            await self.app(scope, receive, send)
@@ -80,13 +80,16 @@ def uuid4_str() -> str:
 
 class SQLIntEnum(types.TypeDecorator):
     impl = Integer
+    # 枚举类型作为缓存键的一部分, 允许 SQLAlchemy 缓存包含该类型的已编译语句
+    cache_ok = True
+
     def __init__(self, enumtype, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._enumtype = enumtype
+        self.enumtype = enumtype
 
     def process_bind_param(self, value, dialect):
         return value.value if isinstance(value, Enum) else value
 
     def process_result_value(self, value, dialect):
         if value is not None:
-            return self._enumtype(value)
\ No newline at end of file
+            return self.enumtype(value)
\ No newline at end of file
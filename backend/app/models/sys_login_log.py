@@ -38,4 +38,4 @@ class LoginLog(DataClassBase):
     device: Mapped[Optional[str]] = mapped_column(String(50), comment='设备')
     msg: Mapped[str] = mapped_column(LONGTEXT, comment='提示消息')
     login_time: Mapped[datetime] = mapped_column(comment='登录时间')
-    create_time: Mapped[datetime] = mapped_column(init=False, default_factory=timezone.now, comment='创建时间')
+    create_time: Mapped[datetime] = mapped_column(init=False, default_factory=timezone.now, index=True, comment='创建时间')
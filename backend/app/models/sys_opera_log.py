@@ -43,4 +43,4 @@ class OperaLog(DataClassBase):
     msg: Mapped[Optional[str]] = mapped_column(LONGTEXT, comment='提示消息')
     cost_time: Mapped[float] = mapped_column(insert_default=0.0, comment='请求耗时ms')
     opera_time: Mapped[datetime] = mapped_column(comment='操作时间')
-    create_time: Mapped[datetime] = mapped_column(init=False, default_factory=timezone.now, comment='创建时间')
+    create_time: Mapped[datetime] = mapped_column(init=False, default_factory=timezone.now, index=True, comment='创建时间')
@@ -39,7 +39,7 @@ class User(DataClassBase):
     status: Mapped[StatusType] = mapped_column(SQLIntEnum(StatusType), default=StatusType.enable, comment='用户账号状态(0停用 1启用)')
     avatar: Mapped[Optional[str]] = mapped_column(String(255), default=None, comment='头像')
     phone: Mapped[Optional[str]] = mapped_column(String(11), default=None, comment='手机号')
-    join_time: Mapped[datetime] = mapped_column(init=False, default_factory=timezone.now, comment='注册时间')
+    join_time: Mapped[datetime] = mapped_column(init=False, default_factory=timezone.now, index=True, comment='注册时间')
     last_login_time: Mapped[Optional[datetime]] = mapped_column(init=False, onupdate=timezone.now, comment='上次登录')
     # 部门用户一对多
     dept_id: Mapped[Optional[int]] = mapped_column(ForeignKey('sys_dept.id', ondelete='SET NULL'), default=None, comment='部门关联ID')
@@ -34,6 +34,10 @@ class UpdateDeptParam(DeptSchemaBase):
     pass
 
 
+class BulkUpdateDeptParam(UpdateDeptParam):
+    id: int
+
+
 class GetDeptListDetails(DeptSchemaBase):
     model_config = ConfigDict(from_attributes=True)
 
@@ -34,6 +34,10 @@ class UpdateDictDataParam(DictDataSchemaBase):
     pass
 
 
+class BulkUpdateDictDataParam(UpdateDictDataParam):
+    id: int
+
+
 class GetDictDataListDetails(DictDataSchemaBase):
     model_config = ConfigDict(from_attributes=True)
 
@@ -39,6 +39,10 @@ class UpdateMenuParam(MenuSchemaBase):
     pass
 
 
+class BulkUpdateMenuParam(UpdateMenuParam):
+    id: int
+
+
 class GetMenuListDetails(MenuSchemaBase):
     model_config = ConfigDict(from_attributes=True)
 
@@ -89,7 +89,7 @@ class GetCurrentUserInfoDetail(GetUserInfoNoRelationDetail):
     roles: Optional[Union[list[GetRoleListDetails], list[str]]] = None
 
     @model_validator(mode='after')
-    def handel(self, values):
+    def handel(self):
         """处理部门和角色"""
         dept = self.dept
         if dept:
@@ -97,7 +97,7 @@ class GetCurrentUserInfoDetail(GetUserInfoNoRelationDetail):
         roles = self.roles
         if roles:
             self.roles = [role.name for role in roles]  # type: ignore
-        return values
+        return self
 
 class ResetPasswordParam(SchemaBase):
     old_password: str
@@ -25,7 +25,6 @@ from backend.app.crud.crud_user import CRUDUser, user_dao
 from backend.app.services.service_login_log import login_log_service
 from backend.app.models import User
 from backend.app.schemas import AuthLoginParam, CreateUserParam, UpdateUserParam
-from backend.app.databases.mysql import async_session
 from backend.app.utils.timezone import timezone
 
 class ServiceAuth(ServiceBase[User, CreateUserParam, UpdateUserParam]):
@@ -35,7 +34,7 @@ class ServiceAuth(ServiceBase[User, CreateUserParam, UpdateUserParam]):
         self.crud_dao: CRUDUser
 
     async def swagger_login(self, *, credentials: HTTPBasicCredentials):
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             current_user = await self.crud_dao.get_by_username(db, username=credentials.username)
             if not current_user:
                 raise errors.NotFoundError(msg='用户不存在')
@@ -50,7 +49,7 @@ class ServiceAuth(ServiceBase[User, CreateUserParam, UpdateUserParam]):
             return access_token, current_user
 
     async def login(self, *, request: Request, obj: AuthLoginParam, background_tasks: BackgroundTasks)->Tuple[str, str, datetime, datetime, User]:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             try:
                 current_user = await self.crud_dao.get_by_username(db, username=obj.username)
                 if not current_user:
@@ -100,7 +99,7 @@ class ServiceAuth(ServiceBase[User, CreateUserParam, UpdateUserParam]):
         user_id = await jwt.jwt_decode(refresh_token)
         if request.user.id != user_id:
             raise errors.TokenError(msg='刷新 token 无效')
-        async with async_session() as db:
+        async with self.read_session(primary=True) as db:
             current_user = await self.crud_dao.get(db, pk=user_id)
             if not current_user:
                 raise errors.NotFoundError(msg='用户不存在')
@@ -112,7 +111,7 @@ class ServiceAuth(ServiceBase[User, CreateUserParam, UpdateUserParam]):
 
     async def logout(self, *, request: Request):
         token = await jwt.get_token(request)
-        prefix = f'{settings.TOKEN_REDIS_PREFIX}:{request.user.id}:'
-        await redis_client.delete_prefix(prefix)
+        prefix = f'{settings.TOKEN_REDIS_PREFIX}:{request.user.id}'
+        await redis_client.delete_indexed(prefix)
 
 auth_service = ServiceAuth(user_dao)
\ No newline at end of file
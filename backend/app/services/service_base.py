@@ -8,16 +8,19 @@
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+from typing import Any, AsyncContextManager, Dict, Generic, List, Optional, Sequence, Type, TypeVar, Union
 
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 
+from backend.app.common.tracing import trace_public_methods
 from backend.app.models.base import Base
 from backend.app.crud.crud_base import CRUDBase
-from backend.app.databases.mysql import async_session
+from backend.app.databases import uow
+from backend.app.databases.mysql import async_session, read_router
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
@@ -34,12 +37,57 @@ class ServiceBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         """
         self.crud_dao = crud_dao
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # 启用链路记录时以 span 记录各服务的公开方法
+        trace_public_methods(cls)
+
+    @staticmethod
+    def read_session(*, primary: bool = False, independent: bool = False) -> AsyncContextManager[AsyncSession]:
+        """
+        获取只读会话
+
+        默认路由到从库; 需要读取主库时(未配置从库、当前用户刚写入过或显式指定)加入请求级工作单元
+
+        :param primary: 是否强制使用主库
+        :param independent: 是否使用独立的会话
+        :return:
+        """
+        if not read_router.prefers_primary(primary=primary):
+            return read_router.replica()
+        return uow.primary_session(async_session, independent=independent)
+
+    @staticmethod
+    def transaction(*, independent: bool = False) -> AsyncContextManager[AsyncSession]:
+        """
+        开启事务, 加入请求级工作单元的事务, 最外层退出时提交
+
+        :param independent: 是否使用独立的事务
+        :return:
+        """
+        return uow.transaction(async_session, independent=independent)
+
+    @staticmethod
+    def use_primary():
+        """
+        在上下文中强制读取主库
+
+        E.g. ::
+
+            with user_service.use_primary():
+                user = await user_service.get(pk=pk)
+
+        :return:
+        """
+        return read_router.use_primary()
+
     async def get(self, 
                   *, 
                   pk: int, 
                   name: Optional[str] = None,
                   status: Optional[str] = None,
                   del_flag: Optional[int] = None,
+                  primary: bool = False,
                   ) -> Optional[ModelType]:
         """
         通过主键 id 或者 name 获取一条数据
@@ -49,43 +97,48 @@ class ServiceBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         :param name:
         :param status:
         :param del_flag:
+        :param primary: 是否强制使用主库
         :return:
         """
-        async with async_session() as db:
+        async with self.read_session(primary=primary) as db:
             return await self.crud_dao.get(db, pk=pk, name=name, status=status, del_flag=del_flag)
 
     async def single(
             self, 
             *, 
-            filters: Optional[Dict[str, Any]] = None
+            filters: Optional[Dict[str, Any]] = None,
+            primary: bool = False
         ) -> Optional[ModelType]:
-        async with async_session() as db:
+        async with self.read_session(primary=primary) as db:
             return await self.crud_dao.single(db, filters=filters)
 
     async def list(
             self, 
             *,
             filters: Optional[Dict[str, Any]] = None,
-            sorts: Optional[Dict[str, Any]] = None
+            sorts: Optional[Dict[str, Any]] = None,
+            primary: bool = False
         ) -> List[ModelType]:
         """
         通过 filters 过滤条件获取列表数据，如果没有过滤条件返回全部数据，慎用
 
         :param db:
         :param filters: 字典类型
+        :param primary: 是否强制使用主库
         :return:
         """
-        async with async_session() as db:
+        async with self.read_session(primary=primary) as db:
             return await self.crud_dao.list(db, filters=filters,sorts=sorts)
 
-    async def all(self) -> List[ModelType]:
+    async def all(self, *, primary: bool = False) -> List[ModelType]:
         """
         获取所有数据，没有过滤条件，慎用
 
         :param db:
+        :param primary: 是否强制使用主库
         :return:
         """
-        async with async_session() as db:
+        async with self.read_session(primary=primary) as db:
             return await self.crud_dao.all(db)
 
     def get_select(self,
@@ -108,7 +161,7 @@ class ServiceBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         :param user_id:
         :return:
         """
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             return await self.crud_dao.create(db, obj=obj, user_id=user_id)
 
     async def update(
@@ -127,9 +180,59 @@ class ServiceBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         :param user_id:
         :return:
         """
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             return await self.crud_dao.update(db, pk=pk, obj=obj)
     
+    async def bulk_create(
+            self,
+            *,
+            objs: Sequence[Union[CreateSchemaType, Dict[str, Any]]],
+            user_id: Optional[int] = None
+        ) -> int:
+        """
+        批量新增数据
+
+        :param objs: Pydantic 模型类 or 对应数据库字段的字典
+        :param user_id:
+        :return:
+        """
+        async with self.transaction() as db:
+            return await self.crud_dao.bulk_create(db, objs=objs, user_id=user_id)
+
+    async def bulk_update(
+            self,
+            *,
+            objs: Sequence[Union[UpdateSchemaType, Dict[str, Any]]],
+            user_id: Optional[int] = None
+        ) -> int:
+        """
+        通过主键 id 批量更新数据
+
+        :param objs: 包含 id 的 Pydantic 模型类 or 对应数据库字段的字典
+        :param user_id:
+        :return:
+        """
+        async with self.transaction() as db:
+            return await self.crud_dao.bulk_update(db, objs=objs, user_id=user_id)
+
+    async def bulk_upsert(
+            self,
+            *,
+            objs: Sequence[Union[CreateSchemaType, Dict[str, Any]]],
+            update_columns: Optional[Sequence[str]] = None,
+            user_id: Optional[int] = None
+        ) -> int:
+        """
+        批量新增或更新数据, 仅支持 MySQL
+
+        :param objs: Pydantic 模型类 or 对应数据库字段的字典
+        :param update_columns: 冲突时更新的字段
+        :param user_id:
+        :return:
+        """
+        async with self.transaction() as db:
+            return await self.crud_dao.bulk_upsert(db, objs=objs, update_columns=update_columns, user_id=user_id)
+
     async def delete(
             self,
             *,
@@ -144,5 +247,5 @@ class ServiceBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         :param del_flag:
         :return:
         """
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             return await self.crud_dao.delete(db, pk=pk, del_flag=del_flag)
\ No newline at end of file
@@ -23,7 +23,7 @@ from backend.app.schemas.casbin_rule import (
 from backend.app.common.pagination import paging_data
 from backend.app.common.exception import errors
 from backend.app.common.security.rbac import rbac
-from backend.app.databases.mysql import async_session
+from backend.app.common.security.casbin_watcher import casbin_watcher
 from backend.app.services.service_base import ServiceBase
 from backend.app.crud import casbin_dao, CRUDCasbin
 from backend.app.models import CasbinRule
@@ -37,8 +37,8 @@ class ServiceCasbin(ServiceBase[CasbinRule, CreateUserRoleParam, UpdatePolicyPar
 
     async def get_pagination(self, *, ptype:str, sub:str):
         select_stmt = self.crud_dao.get_select_list(ptype=ptype, sub=sub)
-        async with async_session() as db:
-            page_data = await paging_data(db, select_stmt, GetPolicyListDetails)
+        async with self.read_session() as db:
+            page_data = await paging_data(db, select_stmt, GetPolicyListDetails, count_mode='cached')
         return page_data
     
     async def get_policy_list(self, *, role: Optional[int] = None) -> list:
@@ -54,13 +54,16 @@ class ServiceCasbin(ServiceBase[CasbinRule, CreateUserRoleParam, UpdatePolicyPar
         data = await enforcer.add_policy(p.sub, p.path, p.method)
         if not data:
             raise errors.ForbiddenError(msg='权限已存在')
+        await casbin_watcher.notify('add', 'p', 'p', rules=[[p.sub, p.path, p.method]])
         return data
     
     async def create_policies(self, *, ps: list[CreatePolicyParam]) -> bool:
         enforcer = await rbac.enforcer()
-        data = await enforcer.add_policies([list(p.model_dump().values()) for p in ps])
+        rules = [list(p.model_dump().values()) for p in ps]
+        data = await enforcer.add_policies(rules)
         if not data:
             raise errors.ForbiddenError(msg='权限已存在')
+        await casbin_watcher.notify('add', 'p', 'p', rules=rules)
         return data
     
     async def update_policy(self, *, old: UpdatePolicyParam, new: UpdatePolicyParam) -> bool:
@@ -69,13 +72,19 @@ class ServiceCasbin(ServiceBase[CasbinRule, CreateUserRoleParam, UpdatePolicyPar
         if not _p:
             raise errors.NotFoundError(msg='权限不存在')
         data = await enforcer.update_policy([old.sub, old.path, old.method], [new.sub, new.path, new.method])
+        if data:
+            await casbin_watcher.notify(
+                'update', 'p', 'p', rules=[[old.sub, old.path, old.method]], new_rules=[[new.sub, new.path, new.method]]
+            )
         return data
     
     async def update_policies(self, *, old: list[UpdatePolicyParam], new: list[UpdatePolicyParam]) -> bool:
         enforcer = await rbac.enforcer()
-        data = await enforcer.update_policies(
-            [list(o.model_dump().values()) for o in old], [list(n.model_dump().values()) for n in new]
-        )
+        old_rules = [list(o.model_dump().values()) for o in old]
+        new_rules = [list(n.model_dump().values()) for n in new]
+        data = await enforcer.update_policies(old_rules, new_rules)
+        if data:
+            await casbin_watcher.notify('update', 'p', 'p', rules=old_rules, new_rules=new_rules)
         return data
     
     async def delete_policy(self, *, p: DeletePolicyParam) -> bool:
@@ -84,18 +93,24 @@ class ServiceCasbin(ServiceBase[CasbinRule, CreateUserRoleParam, UpdatePolicyPar
         if not _p:
             raise errors.NotFoundError(msg='权限不存在')
         data = await enforcer.remove_policy(p.sub, p.path, p.method)
+        if data:
+            await casbin_watcher.notify('remove', 'p', 'p', rules=[[p.sub, p.path, p.method]])
         return data
     
     async def delete_policies(self, *, ps: list[DeletePolicyParam]) -> bool:
         enforcer = await rbac.enforcer()
-        data = await enforcer.remove_policies([list(p.model_dump().values()) for p in ps])
+        rules = [list(p.model_dump().values()) for p in ps]
+        data = await enforcer.remove_policies(rules)
         if not data:
             raise errors.NotFoundError(msg='权限不存在')
+        await casbin_watcher.notify('remove', 'p', 'p', rules=rules)
         return data
     
     async def delete_all_policies(self, *, sub: DeleteAllPoliciesParam) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             count = await self.crud_dao.delete_policies_by_sub(db, sub=sub)
+        subs = [sub.role, str(sub.uuid)] if sub.uuid else [sub.role]
+        await self._notify_remove_by_sub(subs)
         return count
     
     async def get_group_list(self) -> list:
@@ -108,13 +123,16 @@ class ServiceCasbin(ServiceBase[CasbinRule, CreateUserRoleParam, UpdatePolicyPar
         data = await enforcer.add_grouping_policy(g.uuid, g.role)
         if not data:
             raise errors.ForbiddenError(msg='权限已存在')
+        await casbin_watcher.notify('add', 'g', 'g', rules=[[g.uuid, g.role]])
         return data
     
     async def create_groups(self, *, gs: list[CreateUserRoleParam]) -> bool:
         enforcer = await rbac.enforcer()
-        data = await enforcer.add_grouping_policies([list(g.model_dump().values()) for g in gs])
+        rules = [list(g.model_dump().values()) for g in gs]
+        data = await enforcer.add_grouping_policies(rules)
         if not data:
             raise errors.ForbiddenError(msg='权限已存在')
+        await casbin_watcher.notify('add', 'g', 'g', rules=rules)
         return data
     
     async def delete_group(self, *, g: DeleteUserRoleParam) -> bool:
@@ -123,18 +141,37 @@ class ServiceCasbin(ServiceBase[CasbinRule, CreateUserRoleParam, UpdatePolicyPar
         if not _g:
             raise errors.NotFoundError(msg='权限不存在')
         data = await enforcer.remove_grouping_policy(g.uuid, g.role)
+        if data:
+            await casbin_watcher.notify('remove', 'g', 'g', rules=[[g.uuid, g.role]])
         return data
     
     async def delete_groups(self, *, gs: list[DeleteUserRoleParam]) -> bool:
         enforcer = await rbac.enforcer()
-        data = await enforcer.remove_grouping_policies([list(g.model_dump().values()) for g in gs])
+        rules = [list(g.model_dump().values()) for g in gs]
+        data = await enforcer.remove_grouping_policies(rules)
         if not data:
             raise errors.NotFoundError(msg='权限不存在')
+        await casbin_watcher.notify('remove', 'g', 'g', rules=rules)
         return data
     
     async def delete_all_groups(self, *, uuid: UUID) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             count = await self.crud_dao.delete_groups_by_uuid(db, uuid=uuid)
+        await self._notify_remove_by_sub([str(uuid)])
         return count
+
+    @staticmethod
+    async def _notify_remove_by_sub(subs: list[str]) -> None:
+        """
+        直接删除数据库策略后(未经过执行器), 按 v0 过滤移除本进程及其他 worker 内存中的 p/g 策略
+
+        :param subs:
+        :return:
+        """
+        for sub in subs:
+            for sec in ('p', 'g'):
+                await casbin_watcher.notify(
+                    'remove_filtered', sec, sec, field_index=0, field_values=[sub], apply_local=True
+                )
     
 casbin_service = ServiceCasbin(casbin_dao)
\ No newline at end of file
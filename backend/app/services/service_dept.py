@@ -8,15 +8,17 @@
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
-from typing import Any, Optional
+from typing import Any, Optional, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.app.common.exception import errors
+from backend.app.common.cache.tree import dept_tree_cache
+from backend.app.common.security.principal import principal_cache
 from backend.app.services.service_base import ServiceBase
 from backend.app.models import Dept
-from backend.app.schemas import CreateDeptParam, UpdateDeptParam
-from backend.app.databases import async_session
+from backend.app.schemas import BulkUpdateDeptParam, CreateDeptParam, UpdateDeptParam
 from backend.app.crud import dept_dao, CRUDDept
-from backend.app.utils.build_tree import get_tree_data
 
 class ServiceDept(ServiceBase[Dept, CreateDeptParam, UpdateDeptParam]):
 
@@ -24,15 +26,32 @@ class ServiceDept(ServiceBase[Dept, CreateDeptParam, UpdateDeptParam]):
         super().__init__(crud_dao)
         self.crud_dao: CRUDDept
 
+    async def _load_depts(self) -> Sequence[Dept]:
+        # 缓存在版本号变更后加载, 读取从库可能缓存到延迟的数据
+        async with self.read_session(primary=True) as db:
+            return await self.crud_dao.get_all(db)
+
     async def get_dept_tree(self,
         *, name: Optional[str] = None, leader: Optional[str] = None, phone: Optional[str] = None, status: Optional[int] = None) -> list[dict[str, Any]]:
-        async with async_session() as db:
-            depts = await self.crud_dao.get_all(db, name=name, leader=leader, phone=phone, status=status)
-            tree_data = await get_tree_data(depts)
-            return tree_data
-        
+        if not name and not leader and not phone and status is None:
+            return await dept_tree_cache.get_tree(self._load_depts)
+        index = await dept_tree_cache.get_index(self._load_depts)
+        name = name.casefold() if name else None
+        leader = leader.casefold() if leader else None
+
+        def match(dept: dict[str, Any]) -> bool:
+            if name and name not in dept['name'].casefold():
+                return False
+            if leader and leader not in (dept['leader'] or '').casefold():
+                return False
+            if phone and not (dept['phone'] or '').startswith(phone):
+                return False
+            return status is None or dept['status'] == status
+
+        return index.search_tree(match)
+
     async def create(self, *, obj: CreateDeptParam) -> None:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             dept = await self.crud_dao.get_by_name(db, name=obj.name)
             if dept:
                 raise errors.ForbiddenError(msg='部门名称已存在')
@@ -41,9 +60,10 @@ class ServiceDept(ServiceBase[Dept, CreateDeptParam, UpdateDeptParam]):
                 if not parent_dept:
                     raise errors.NotFoundError(msg='父级部门不存在')
             await self.crud_dao.create(db, obj=obj)
+        await dept_tree_cache.invalidate()
 
     async def update(self, *, dept_id: int, obj: UpdateDeptParam) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             dept = await self.crud_dao.get(db, pk=dept_id)
             if not dept:
                 raise errors.NotFoundError(msg='部门不存在')
@@ -57,10 +77,48 @@ class ServiceDept(ServiceBase[Dept, CreateDeptParam, UpdateDeptParam]):
             if obj.parent_id == dept.id:
                 raise errors.ForbiddenError(msg='禁止关联自身为父级')
             count = await self.crud_dao.update(db, pk=dept_id, obj=obj)
-            return count
+        await dept_tree_cache.invalidate()
+        await principal_cache.evict_all()
+        return count
         
+    async def _check_bulk(self, db: AsyncSession, objs: Sequence[CreateDeptParam], *, pks: frozenset[int] = frozenset()) -> None:
+        names = {obj.name for obj in objs}
+        if len(names) != len(objs):
+            raise errors.ForbiddenError(msg='部门名称重复')
+        exists = await self.crud_dao.list(db, filters=[Dept.name.in_(names)])
+        if any(dept.id not in pks for dept in exists):
+            raise errors.ForbiddenError(msg='部门名称已存在')
+        parent_ids = {obj.parent_id for obj in objs if obj.parent_id}
+        if any(obj.parent_id and obj.parent_id == getattr(obj, 'id', None) for obj in objs):
+            raise errors.ForbiddenError(msg='禁止关联自身为父级')
+        if parent_ids:
+            parents = await self.crud_dao.list(db, filters=[Dept.id.in_(parent_ids)])
+            if len(parents) != len(parent_ids):
+                raise errors.NotFoundError(msg='父级部门不存在')
+
+    async def bulk_create(self, *, objs: list[CreateDeptParam]) -> int:
+        async with self.transaction() as db:
+            await self._check_bulk(db, objs)
+            count = await self.crud_dao.bulk_create(db, objs=objs)
+        await dept_tree_cache.invalidate()
+        return count
+
+    async def bulk_update(self, *, objs: list[BulkUpdateDeptParam]) -> int:
+        async with self.transaction() as db:
+            pks = frozenset(obj.id for obj in objs)
+            if len(pks) != len(objs):
+                raise errors.ForbiddenError(msg='部门重复')
+            exists = await self.crud_dao.list(db, filters=[Dept.id.in_(pks)])
+            if len(exists) != len(pks):
+                raise errors.NotFoundError(msg='部门不存在')
+            await self._check_bulk(db, objs, pks=pks)
+            count = await self.crud_dao.bulk_update(db, objs=objs)
+        await dept_tree_cache.invalidate()
+        await principal_cache.evict_all()
+        return count
+
     async def delete(self, *, dept_id: int) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             dept_user = await self.crud_dao.get_with_relation(db, dept_id=dept_id)
             if dept_user:
                 raise errors.ForbiddenError(msg='部门下存在用户，无法删除')
@@ -68,6 +126,7 @@ class ServiceDept(ServiceBase[Dept, CreateDeptParam, UpdateDeptParam]):
             if children:
                 raise errors.ForbiddenError(msg='部门下存在子部门，无法删除')
             count = await self.crud_dao.delete(db, pk=dept_id)
-            return count
+        await dept_tree_cache.invalidate()
+        return count
         
 dept_service = ServiceDept(dept_dao)
\ No newline at end of file
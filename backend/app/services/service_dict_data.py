@@ -8,14 +8,15 @@
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
-from typing import Any, Optional
+from typing import Any, Optional, Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from backend.app.common.exception import errors
 from backend.app.common.pagination import paging_data
 from backend.app.services.service_base import ServiceBase
-from backend.app.models import DictData
-from backend.app.schemas import CreateDictDataParam, UpdateDictDataParam, GetDictDataListDetails
-from backend.app.databases import async_session
+from backend.app.models import DictData, DictType
+from backend.app.schemas import BulkUpdateDictDataParam, CreateDictDataParam, UpdateDictDataParam, GetDictDataListDetails
 from backend.app.crud import dict_data_dao, dict_type_dao, CRUDDictData
 from backend.app.utils.build_tree import get_tree_data
 
@@ -27,12 +28,12 @@ class ServiceDictData(ServiceBase[DictData, CreateDictDataParam, UpdateDictDataP
 
     async def get_pagination(self, *, label: str = None, value: str = None, status: int = None):
         select_stmt = self.crud_dao.get_select_list(label=label, value=value, status=status)
-        async with async_session() as db:
+        async with self.read_session() as db:
             page_data = await paging_data(db, select_stmt, GetDictDataListDetails)
         return page_data
 
     async def create(self, *, obj: CreateDictDataParam) -> DictData:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             dict_data = await self.crud_dao.get_by_label(db, label=obj.label)
             if dict_data:
                 raise errors.ForbiddenError(msg='字典数据已存在')
@@ -42,7 +43,7 @@ class ServiceDictData(ServiceBase[DictData, CreateDictDataParam, UpdateDictDataP
             return await self.crud_dao.create(db, obj=obj)
 
     async def update(self, *, pk: int, obj: UpdateDictDataParam) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             dict_data = await self.crud_dao.get(db, pk=pk)
             if not dict_data:
                 raise errors.NotFoundError(msg='字典数据不存在')
@@ -55,8 +56,45 @@ class ServiceDictData(ServiceBase[DictData, CreateDictDataParam, UpdateDictDataP
             count = await self.crud_dao.update(db, pk=pk, obj=obj)
             return count
         
+    async def _check_bulk(self, db: AsyncSession, objs: Sequence[CreateDictDataParam], *, pks: frozenset[int] = frozenset()) -> None:
+        labels = {obj.label for obj in objs}
+        if len(labels) != len(objs):
+            raise errors.ForbiddenError(msg='字典数据重复')
+        exists = await self.crud_dao.list(db, filters=[DictData.label.in_(labels)])
+        if any(dict_data.id not in pks for dict_data in exists):
+            raise errors.ForbiddenError(msg='字典数据已存在')
+        type_ids = {obj.type_id for obj in objs}
+        dict_types = await dict_type_dao.list(db, filters=[DictType.id.in_(type_ids)])
+        if len(dict_types) != len(type_ids):
+            raise errors.ForbiddenError(msg='字典类型不存在')
+
+    async def bulk_create(self, *, objs: list[CreateDictDataParam]) -> int:
+        async with self.transaction() as db:
+            await self._check_bulk(db, objs)
+            return await self.crud_dao.bulk_create(db, objs=objs)
+
+    async def bulk_update(self, *, objs: list[BulkUpdateDictDataParam]) -> int:
+        async with self.transaction() as db:
+            pks = frozenset(obj.id for obj in objs)
+            if len(pks) != len(objs):
+                raise errors.ForbiddenError(msg='字典数据重复')
+            exists = await self.crud_dao.list(db, filters=[DictData.id.in_(pks)])
+            if len(exists) != len(pks):
+                raise errors.NotFoundError(msg='字典数据不存在')
+            await self._check_bulk(db, objs, pks=pks)
+            return await self.crud_dao.bulk_update(db, objs=objs)
+
+    async def bulk_upsert(self, *, objs: list[CreateDictDataParam]) -> int:
+        async with self.transaction() as db:
+            # label 与 value 为唯一索引, 已存在的字典数据按冲突的唯一索引更新
+            type_ids = {obj.type_id for obj in objs}
+            dict_types = await dict_type_dao.list(db, filters=[DictType.id.in_(type_ids)])
+            if len(dict_types) != len(type_ids):
+                raise errors.ForbiddenError(msg='字典类型不存在')
+            return await self.crud_dao.bulk_upsert(db, objs=objs)
+
     async def delete(self, *, pk: list[int]) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             count = await self.crud_dao.delete(db, pk=pk)
             return count
 
@@ -10,17 +10,18 @@
 '''
 from typing import Optional
 from datetime import datetime
+from uuid import uuid4
 
 from fastapi import Request
 from sqlalchemy import Select
 
 from backend.app.common.log import log
-from backend.app.common.pagination import paging_data
+from backend.app.common.pagination import paging_data, cursor_paging_data, CursorParams
 from backend.app.crud.crud_login_log import CRUDLoginLog, login_log_dao
 from backend.app.services.service_base import ServiceBase
-from backend.app.databases.mysql import async_session
 from backend.app.models import LoginLog, User
 from backend.app.schemas import CreateLoginLogParam, UpdateLoginLogParam, GetLoginLogListDetails
+from backend.app.tasks import enqueue, persist_login_log
 
 
 class ServiceLoginLog((ServiceBase[LoginLog, CreateLoginLogParam, UpdateLoginLogParam])):
@@ -31,8 +32,14 @@ class ServiceLoginLog((ServiceBase[LoginLog, CreateLoginLogParam, UpdateLoginLog
 
     async def get_pagination(self, *, username: str, status: int, ip: str):
         select_stmt =  self.crud_dao.get_select_list(username=username, status=status, ip=ip)
-        async with async_session() as db:
-            page_data = await paging_data(db, select_stmt, GetLoginLogListDetails)
+        async with self.read_session() as db:
+            page_data = await paging_data(db, select_stmt, GetLoginLogListDetails, count_mode='estimated')
+        return page_data
+
+    async def get_cursor_pagination(self, *, params: CursorParams, username: str, status: int, ip: str):
+        select_stmt = self.crud_dao.get_select_list(username=username, status=status, ip=ip)
+        async with self.read_session() as db:
+            page_data = await cursor_paging_data(db, select_stmt, GetLoginLogListDetails, params=params, keys=self.crud_dao.cursor_keys)
         return page_data
 
     async def append(self, 
@@ -42,31 +49,32 @@ class ServiceLoginLog((ServiceBase[LoginLog, CreateLoginLogParam, UpdateLoginLog
         login_time: datetime, 
         status: int, 
         msg: str
-    ) -> LoginLog:
+    ) -> None:
         try:
             # request.state 来自 opera log 中间件定义的扩展参数，详见 opera_log_middleware.py
-            async with async_session.begin() as db:
-                obj = CreateLoginLogParam(
-                    user_uuid=user.uuid,
-                    username=user.username,
-                    status=status,
-                    ip=request.state.ip,
-                    country=request.state.country,
-                    region=request.state.region,
-                    city=request.state.city,
-                    user_agent=request.state.user_agent,
-                    browser=request.state.browser,
-                    os=request.state.os,
-                    device=request.state.device,
-                    msg=msg,
-                    login_time=login_time,
-                )
-                return await self.crud_dao.create(db, obj=obj)
+            obj = CreateLoginLogParam(
+                user_uuid=user.uuid,
+                username=user.username,
+                status=status,
+                ip=request.state.ip,
+                # 属地未在请求中解析时由后台任务补全
+                country=getattr(request.state, 'country', None),
+                region=getattr(request.state, 'region', None),
+                city=getattr(request.state, 'city', None),
+                user_agent=request.state.user_agent,
+                browser=request.state.browser,
+                os=request.state.os,
+                device=request.state.device,
+                msg=msg,
+                login_time=login_time,
+            )
+            # 启用任务队列时由 worker 写入, 不使用请求事务, 登录失败时日志同样保存
+            await enqueue(persist_login_log, key=uuid4().hex, obj=obj.model_dump())
         except Exception as e:
             log.exception(f'登录日志创建失败: {e}')
 
     async def delete_all(self) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             count = await self.crud_dao.delete_all(db)
             return count
 
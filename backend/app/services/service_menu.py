@@ -8,18 +8,18 @@
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
-from typing import Any, Optional
+from typing import Any, Optional, Sequence
 from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.app.core.conf import settings
 from backend.app.common.exception import errors
-from backend.app.common.cache.redis import redis_client
+from backend.app.common.cache.permission import permission_store
+from backend.app.common.cache.tree import menu_tree_cache
+from backend.app.common.security.principal import principal_cache
 from backend.app.services.service_base import ServiceBase
 from backend.app.models import Menu
-from backend.app.schemas import CreateMenuParam, UpdateMenuParam
-from backend.app.databases import async_session
+from backend.app.schemas import BulkUpdateMenuParam, CreateMenuParam, UpdateMenuParam
 from backend.app.crud import menu_dao, role_dao, CRUDMenu
-from backend.app.utils.build_tree import get_tree_data
 
 
 class ServiceMenu(ServiceBase[Menu, CreateMenuParam, UpdateMenuParam]):
@@ -27,36 +27,45 @@ class ServiceMenu(ServiceBase[Menu, CreateMenuParam, UpdateMenuParam]):
         super().__init__(crud_dao)
         self.crud_dao: CRUDMenu
 
+    async def _load_menus(self) -> Sequence[Menu]:
+        # 缓存在版本号变更后加载, 读取从库可能缓存到延迟的数据
+        async with self.read_session(primary=True) as db:
+            return await self.crud_dao.get_all(db)
+
     async def get_menu_tree(self, *, title: Optional[str] = None, status: Optional[int] = None) -> list[dict[str, Any]]:
-        async with async_session() as db:
-            menu_select = await self.crud_dao.get_all(db, title=title, status=status)
-            menu_tree = await get_tree_data(menu_select)
-            return menu_tree
-        
+        if not title and status is None:
+            return await menu_tree_cache.get_tree(self._load_menus)
+        index = await menu_tree_cache.get_index(self._load_menus)
+        title = title.casefold() if title else None
+
+        def match(menu: dict[str, Any]) -> bool:
+            if title and title not in menu['title'].casefold():
+                return False
+            return status is None or menu['status'] == status
+
+        return index.search_tree(match)
+
+    async def _get_role_menu_tree(self, *, superuser: bool, menu_ids: set[int]) -> list[dict[str, Any]]:
+        index = await menu_tree_cache.get_index(self._load_menus)
+        return index.filter_tree(lambda menu: menu['menu_type'] in (0, 1) and (superuser or menu['id'] in menu_ids))
+
     async def get_role_menu_tree(self, *, pk: int) -> list[dict[str, Any]]:
-        async with async_session() as db:
+        async with self.read_session() as db:
             role = await role_dao.get_with_relation(db, role_id=pk)
             if not role:
                 raise errors.NotFoundError(msg='角色不存在')
-            menu_ids = [menu.id for menu in role.menus]
-            menu_select = await self.crud_dao.get_role_menus(db, superuser=False, menu_ids=menu_ids)
-            menu_tree = await get_tree_data(menu_select)
-            return menu_tree
-        
+            menu_ids = {menu.id for menu in role.menus}
+        return await self._get_role_menu_tree(superuser=False, menu_ids=menu_ids)
+
     async def get_user_menu_tree(self, *, request: Request) -> list[dict[str, Any]]:
-        async with async_session() as db:
-            roles = request.user.roles
-            menu_ids = []
-            menu_tree = []
-            if roles:
-                for role in roles:
-                    menu_ids.extend([menu.id for menu in role.menus])
-                menu_select = await self.crud_dao.get_role_menus(db, superuser=request.user.is_superuser, menu_ids=menu_ids)
-                menu_tree = await get_tree_data(menu_select)
-            return menu_tree
-        
+        roles = request.user.roles
+        if not roles:
+            return []
+        menu_ids = {menu.id for role in roles for menu in role.menus}
+        return await self._get_role_menu_tree(superuser=request.user.is_superuser, menu_ids=menu_ids)
+
     async def create(self, *, obj: CreateMenuParam) -> Menu:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             title = await self.crud_dao.get_by_title(db, title=obj.title)
             if title:
                 raise errors.ForbiddenError(msg='菜单标题已存在')
@@ -64,10 +73,12 @@ class ServiceMenu(ServiceBase[Menu, CreateMenuParam, UpdateMenuParam]):
                 parent_menu = await self.crud_dao.get(db, pk=obj.parent_id)
                 if not parent_menu:
                     raise errors.NotFoundError(msg='父级菜单不存在')
-            return await self.crud_dao.create(db, obj=obj)
+            menu = await self.crud_dao.create(db, obj=obj)
+        await menu_tree_cache.invalidate()
+        return menu
         
     async def update(self, *, pk: int, obj: UpdateMenuParam) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             menu = await self.crud_dao.get(db, pk=pk)
             if not menu:
                 raise errors.NotFoundError(msg='菜单不存在')
@@ -81,15 +92,60 @@ class ServiceMenu(ServiceBase[Menu, CreateMenuParam, UpdateMenuParam]):
             if obj.parent_id == menu.id:
                 raise errors.ForbiddenError(msg='禁止关联自身为父级')
             count = await self.crud_dao.update(db, pk=pk, obj=obj)
-            await redis_client.delete_prefix(settings.PERMISSION_REDIS_PREFIX)
-            return count
+            perms = await role_dao.get_menu_perms(db)
+        await permission_store.rebuild(perms)
+        await menu_tree_cache.invalidate()
+        await principal_cache.evict_all()
+        return count
         
+    async def _check_bulk(self, db: AsyncSession, objs: Sequence[CreateMenuParam], *, pks: frozenset[int] = frozenset()) -> None:
+        titles = {obj.title for obj in objs}
+        if len(titles) != len(objs):
+            raise errors.ForbiddenError(msg='菜单标题重复')
+        exists = await self.crud_dao.list(db, filters=[Menu.title.in_(titles)])
+        if any(menu.id not in pks for menu in exists):
+            raise errors.ForbiddenError(msg='菜单标题已存在')
+        parent_ids = {obj.parent_id for obj in objs if obj.parent_id}
+        if any(obj.parent_id and obj.parent_id == getattr(obj, 'id', None) for obj in objs):
+            raise errors.ForbiddenError(msg='禁止关联自身为父级')
+        if parent_ids:
+            parents = await self.crud_dao.list(db, filters=[Menu.id.in_(parent_ids)])
+            if len(parents) != len(parent_ids):
+                raise errors.NotFoundError(msg='父级菜单不存在')
+
+    async def bulk_create(self, *, objs: list[CreateMenuParam]) -> int:
+        async with self.transaction() as db:
+            await self._check_bulk(db, objs)
+            count = await self.crud_dao.bulk_create(db, objs=objs)
+        await menu_tree_cache.invalidate()
+        return count
+
+    async def bulk_update(self, *, objs: list[BulkUpdateMenuParam]) -> int:
+        async with self.transaction() as db:
+            pks = frozenset(obj.id for obj in objs)
+            if len(pks) != len(objs):
+                raise errors.ForbiddenError(msg='菜单重复')
+            exists = await self.crud_dao.list(db, filters=[Menu.id.in_(pks)])
+            if len(exists) != len(pks):
+                raise errors.NotFoundError(msg='菜单不存在')
+            await self._check_bulk(db, objs, pks=pks)
+            count = await self.crud_dao.bulk_update(db, objs=objs)
+            perms = await role_dao.get_menu_perms(db)
+        await permission_store.rebuild(perms)
+        await menu_tree_cache.invalidate()
+        await principal_cache.evict_all()
+        return count
+
     async def delete(self, *, pk: int) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             children = await self.crud_dao.get_children(db, menu_id=pk)
             if children:
                 raise errors.ForbiddenError(msg='菜单下存在子菜单，无法删除')
             count = await self.crud_dao.delete(db, pk=pk)
-            return count
+            perms = await role_dao.get_menu_perms(db)
+        await permission_store.rebuild(perms)
+        await menu_tree_cache.invalidate()
+        await principal_cache.evict_all()
+        return count
         
 menu_service = ServiceMenu(menu_dao)
\ No newline at end of file
@@ -8,14 +8,31 @@
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
-from typing import Optional, Union
+from typing import Any, Optional, Union
+from uuid import uuid4
 
-from backend.app.common.pagination import paging_data
-from backend.app.databases import async_session
+from backend.app.core.conf import settings
+from backend.app.common.pagination import paging_data, cursor_paging_data, CursorParams
+from backend.app.databases.batch_writer import BatchWriter
 from backend.app.crud.crud_opera_log import CRUDOperaLog, opera_log_dao
 from backend.app.services.service_base import ServiceBase
 from backend.app.models import OperaLog
 from backend.app.schemas import CreateOperaLogParam, UpdateOperaLogParam, GetOperaLogListDetails
+from backend.app.tasks import enqueue, persist_opera_logs
+from backend.app.utils.timezone import timezone
+
+async def _enqueue_opera_logs(rows: list[dict[str, Any]]) -> None:
+    await enqueue(persist_opera_logs, key=uuid4().hex, rows=rows)
+
+
+opera_log_writer = BatchWriter(
+    OperaLog,
+    batch_size=settings.OPERA_LOG_BATCH_SIZE,
+    flush_interval_ms=settings.OPERA_LOG_FLUSH_INTERVAL_MS,
+    max_queue_size=settings.OPERA_LOG_QUEUE_MAX_SIZE,
+    overflow=settings.OPERA_LOG_QUEUE_OVERFLOW,
+    sink=_enqueue_opera_logs,
+)
 
 
 class ServiceOperaLog(ServiceBase[OperaLog, CreateOperaLogParam, UpdateOperaLogParam]):
@@ -25,12 +42,27 @@ class ServiceOperaLog(ServiceBase[OperaLog, CreateOperaLogParam, UpdateOperaLogP
 
     async def get_pagination(self, *, username: Optional[str] = None, status: Optional[int] = None, ip: Optional[str] = None):
         select_stmt = self.crud_dao.get_select_list(username=username,status=status, ip=ip)
-        async with async_session() as db:
-            page_data = await paging_data(db, select_stmt, GetOperaLogListDetails)
+        async with self.read_session() as db:
+            page_data = await paging_data(db, select_stmt, GetOperaLogListDetails, count_mode='estimated')
         return page_data
 
+    async def get_cursor_pagination(self, *, params: CursorParams, username: Optional[str] = None, status: Optional[int] = None, ip: Optional[str] = None):
+        select_stmt = self.crud_dao.get_select_list(username=username, status=status, ip=ip)
+        async with self.read_session() as db:
+            page_data = await cursor_paging_data(db, select_stmt, GetOperaLogListDetails, params=params, keys=self.crud_dao.cursor_keys)
+        return page_data
+
+    async def append(self, *, obj: CreateOperaLogParam) -> None:
+        """
+        提交操作日志, 由 opera_log_writer 批量写入
+
+        :param obj:
+        :return:
+        """
+        await opera_log_writer.put({**obj.model_dump(), 'create_time': timezone.now()})
+
     async def delete_all(self):
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             count = await self.crud_dao.delete_all(db)
             return count
 
@@ -8,17 +8,16 @@
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
-from typing import Any, Optional, Sequence
+from typing import Any, List, Optional, Sequence, Union
 from fastapi import Request
 
-from backend.app.core.conf import settings
 from backend.app.common.exception import errors
-from backend.app.common.cache.redis import redis_client
+from backend.app.common.cache.permission import permission_store
+from backend.app.common.security.principal import principal_cache
 from backend.app.common.pagination import paging_data
 from backend.app.services.service_base import ServiceBase
 from backend.app.models import Role
 from backend.app.schemas import CreateRoleParam, UpdateRoleParam, UpdateRoleMenuParam, GetRoleListDetails
-from backend.app.databases import async_session
 from backend.app.crud import role_dao, menu_dao, CRUDRole
 
 
@@ -28,32 +27,32 @@ class ServiceRole(ServiceBase[Role, CreateRoleParam, UpdateRoleParam]):
         self.crud_dao: CRUDRole
     
     async def get(self, *, pk: int) -> Role:
-        async with async_session() as db:
+        async with self.read_session() as db:
             role = await self.crud_dao.get_with_relation(db, role_id=pk)
             if not role:
                 raise errors.NotFoundError(msg='角色不存在')
             return role
         
     async def get_user_roles(self, *, pk: int) -> Sequence[Role]:
-        async with async_session() as db:
+        async with self.read_session() as db:
             roles = await self.crud_dao.get_user_roles(db, user_id=pk)
             return roles
 
     async def get_pagination(self, name: str = None, data_scope: int = None, status: int = None):
         select_stmt = self.crud_dao.get_select_list(name=name, data_scope=data_scope, status=status)
-        async with async_session() as db:
+        async with self.read_session() as db:
             page_data = await paging_data(db, select_stmt, GetRoleListDetails)
         return page_data
 
     async def create(self, *, obj: CreateRoleParam) -> None:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             role = await self.crud_dao.get_by_name(db, name=obj.name)
             if role:
                 raise errors.ForbiddenError(msg='角色已存在')
             await self.crud_dao.create(db, obj=obj)
 
     async def update(self, *, pk: int, obj: UpdateRoleParam) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             role = await self.crud_dao.get(db, pk=pk)
             if not role:
                 raise errors.NotFoundError(msg='角色不存在')
@@ -62,19 +61,42 @@ class ServiceRole(ServiceBase[Role, CreateRoleParam, UpdateRoleParam]):
                 if role:
                     raise errors.ForbiddenError(msg='角色已存在')
             count = await self.crud_dao.update(db, pk=pk, obj=obj)
-            return count
+        await principal_cache.evict_all()
+        return count
         
     async def update_role_menu(self, *, request: Request, pk: int, menu_ids: UpdateRoleMenuParam) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             role = await self.crud_dao.get(db, pk=pk)
             if not role:
                 raise errors.NotFoundError(msg='角色不存在')
-            for menu_id in menu_ids.menus:
-                menu = await menu_dao.get(db, pk=menu_id)
-                if not menu:
-                    raise errors.NotFoundError(msg='菜单不存在')
-            count = await self.crud_dao.update_menus(db, role_id=pk, menu_ids=menu_ids)
-            await redis_client.delete_prefix(f'{settings.PERMISSION_REDIS_PREFIX}:{request.user.uuid}')
-            return count
+            missing = await menu_dao.get_missing_ids(db, pks=menu_ids.menus)
+            if missing:
+                raise errors.NotFoundError(msg=f'菜单不存在: {", ".join(map(str, sorted(missing)))}')
+            count = await self.crud_dao.update_menus(db, role=role, menu_ids=menu_ids)
+            perms = await self.crud_dao.get_menu_perms(db)
+        await permission_store.rebuild(perms)
+        await principal_cache.evict_all()
+        return count
+
+    async def delete(self, *, pk: Union[int, List[int]]) -> int:
+        async with self.transaction() as db:
+            count = await self.crud_dao.delete(db, pk=pk)
+            perms = await self.crud_dao.get_menu_perms(db)
+        await permission_store.rebuild(perms)
+        await principal_cache.evict_all()
+        return count
+
+    async def rebuild_permissions(self, *, missing_only: bool = False) -> None:
+        """
+        重新计算所有角色的权限标识集合
+
+        :param missing_only: 仅在 redis 中没有预计算结果时计算, 用于应用启动
+        :return:
+        """
+        if missing_only and await permission_store.exists():
+            return
+        async with self.transaction() as db:
+            perms = await self.crud_dao.get_menu_perms(db)
+        await permission_store.rebuild(perms)
         
 role_service = ServiceRole(role_dao)
\ No newline at end of file
@@ -18,8 +18,9 @@ from backend.app.core.conf import settings
 from backend.app.common.exception import errors
 from backend.app.common.cache import redis_client
 from backend.app.common.security import jwt
+from backend.app.common.security.principal import principal_cache
 from backend.app.common.log import log
-from backend.app.common.pagination import paging_data
+from backend.app.common.pagination import paging_data, cursor_paging_data, CursorParams
 from backend.app.common.response.response_code import CustomErrorCode
 from backend.app.services.service_base import ServiceBase
 from backend.app.models import User
@@ -32,7 +33,6 @@ from backend.app.schemas import (
     RegisterUserSubmissionParam, 
     GetUserInfoListDetails)
 from backend.app.crud import user_dao, role_dao, dept_dao, CRUDUser
-from backend.app.databases import async_session
 
 
 
@@ -44,7 +44,7 @@ class ServiceUser(ServiceBase[User, CreateUserParam, UpdateUserParam]):
     async def register(self, request: Request, *, obj: RegisterUserSubmissionParam) -> Optional[User]:
         if not settings.USERS_OPEN_REGISTRATION:
             raise errors.ForbiddenError(msg="未开放注册")
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             if not obj.password:
                 raise errors.ForbiddenError(msg='密码为空')
             captcha_code = await redis_client.get(f'{settings.CAPTCHA_LOGIN_REDIS_PREFIX}:{request.state.ip}')
@@ -67,7 +67,7 @@ class ServiceUser(ServiceBase[User, CreateUserParam, UpdateUserParam]):
         return registered_user
 
     async def add(self, *, request: Request, obj: CreateUserParam):
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             if not obj.password:
                 raise errors.ForbiddenError(msg='密码为空')
             await jwt.superuser_verify(request)
@@ -81,19 +81,18 @@ class ServiceUser(ServiceBase[User, CreateUserParam, UpdateUserParam]):
             dept = await dept_dao.get(db, pk=obj.dept_id)
             if not dept:
                 raise errors.NotFoundError(msg='部门不存在')
-            for role_id in obj.roles:
-                role = await role_dao.get(db, pk=role_id)
-                if not role:
-                    raise errors.NotFoundError(msg='角色不存在')
+            missing = await role_dao.get_missing_ids(db, pks=obj.roles)
+            if missing:
+                raise errors.NotFoundError(msg=f'角色不存在: {", ".join(map(str, sorted(missing)))}')
             await self.crud_dao.add(db, obj=obj)
 
 
     async def get_by_username(self, *, username: str) -> Optional[User]:
-        async with async_session() as db:
+        async with self.read_session() as db:
             return await self.crud_dao.get_by_username(db, username=username)
         
     async def get_by_nickname(self, *, username: str) -> Optional[User]:
-        async with async_session() as db:
+        async with self.read_session() as db:
             return await self.crud_dao.get_by_nickname(db, username=username)
 
     async def authenticate(self, *, username: str, password: str) -> Optional[User]:
@@ -107,7 +106,7 @@ class ServiceUser(ServiceBase[User, CreateUserParam, UpdateUserParam]):
         return user
 
     async def update_userinfo(self, *, request: Request, username: str, obj: UpdateUserParam) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             if not request.user.is_superuser and request.user.username != username:
                 raise errors.ForbiddenError(msg="只能修改本人信息")
             input_user = await self.crud_dao.get_by_username(db, username=username)
@@ -126,17 +125,18 @@ class ServiceUser(ServiceBase[User, CreateUserParam, UpdateUserParam]):
                 if email:
                     raise errors.ForbiddenError(msg='该邮箱已注册')
             count = await self.crud_dao.update_userinfo(db, pk=input_user.id, obj=obj)
-            return count
+        await principal_cache.evict(input_user.id)
+        return count
 
     async def get_userinfo(self, *, username: str) -> User:
-        async with async_session() as db:
+        async with self.read_session() as db:
             user = await self.crud_dao.get_with_relation(db, username=username)
             if not user:
                 raise errors.NotFoundError(msg='用户不存在')
             return user
 
     async def update_status(self, *, request: Request, pk: int, status:int) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             await jwt.superuser_verify(request)
             if not await self.crud_dao.get(db, pk=pk):
                 raise errors.NotFoundError(msg='用户不存在')
@@ -144,25 +144,25 @@ class ServiceUser(ServiceBase[User, CreateUserParam, UpdateUserParam]):
                 if pk == request.user.id:
                     raise errors.ForbiddenError(msg='禁止修改自身状态')
                 count = await self.crud_dao.update_status(db, pk=pk, status=status)
-                return count
+        await principal_cache.evict(pk)
+        return count
 
     async def update_roles(self, *, request: Request, username: str, obj: UpdateUserRoleParam) -> None:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             if not request.user.is_superuser:
                 if request.user.username != username:
                     raise errors.ForbiddenError(msg='只能修改本人的角色')
-            input_user = await self.crud_dao.get_with_relation(db, username=username)
+            input_user = await self.crud_dao.get_by_username(db, username=username)
             if not input_user:
                 raise errors.NotFoundError(msg='用户不存在')
-            for role_id in obj.roles:
-                role = await role_dao.get(db, pk=role_id)
-                if not role:
-                    raise errors.NotFoundError(msg='角色不存在')
+            missing = await role_dao.get_missing_ids(db, pks=obj.roles)
+            if missing:
+                raise errors.NotFoundError(msg=f'角色不存在: {", ".join(map(str, sorted(missing)))}')
             await self.crud_dao.update_role(db, input_user=input_user, obj=obj)
-            await redis_client.delete_prefix(f'{settings.PERMISSION_REDIS_PREFIX}:{request.user.uuid}')
+        await principal_cache.evict(input_user.id)
 
     async def pwd_reset(self, *, request: Request, obj: ResetPasswordParam) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             op = obj.old_password
             if not await jwt.verify_password(op + request.user.salt, request.user.password):
                 raise errors.ForbiddenError(msg='旧密码错误')
@@ -172,32 +172,40 @@ class ServiceUser(ServiceBase[User, CreateUserParam, UpdateUserParam]):
                 raise errors.ForbiddenError(msg='两次密码输入不一致')
             count = await self.crud_dao.reset_password(db, request.user.id, obj.new_password, request.user.salt)
             prefix = [
-                f'{settings.TOKEN_REDIS_PREFIX}:{request.user.id}:',
-                f'{settings.TOKEN_REFRESH_REDIS_PREFIX}:{request.user.id}:',
+                f'{settings.TOKEN_REDIS_PREFIX}:{request.user.id}',
+                f'{settings.TOKEN_REFRESH_REDIS_PREFIX}:{request.user.id}',
             ]
             for i in prefix:
-                await redis_client.delete_prefix(i)
-            return count
+                await redis_client.delete_indexed(i)
+        await principal_cache.evict(request.user.id)
+        return count
 
 
     async def get_pagination(self, *, dept:int, username: Optional[str] = None, phone: Optional[str] = None, status: Optional[int] = None):
         select_stmt = self.crud_dao.get_select_list(dept=dept, username=username, phone=phone, status=status)
-        async with async_session() as db:
-            page_data = await paging_data(db, select_stmt, GetUserInfoListDetails)
+        async with self.read_session() as db:
+            page_data = await paging_data(db, select_stmt, GetUserInfoListDetails, count_mode='cached')
+        return page_data
+
+    async def get_cursor_pagination(self, *, params: CursorParams, dept: int, username: Optional[str] = None, phone: Optional[str] = None, status: Optional[int] = None):
+        select_stmt = self.crud_dao.get_select_list(dept=dept, username=username, phone=phone, status=status)
+        async with self.read_session() as db:
+            page_data = await cursor_paging_data(db, select_stmt, GetUserInfoListDetails, params=params, keys=self.crud_dao.cursor_keys)
         return page_data
     
     async def delete_by_username(self, *, username: str) -> int:
-        async with async_session.begin() as db:
+        async with self.transaction() as db:
             input_user = await user_dao.get_by_username(db, username=username)
             if not input_user:
                 raise errors.NotFoundError(msg='用户不存在')
             count = await user_dao.delete(db, pk=input_user.id)
             prefix = [
-                f'{settings.TOKEN_REDIS_PREFIX}:{input_user.id}:',
-                f'{settings.TOKEN_REFRESH_REDIS_PREFIX}:{input_user.id}:',
+                f'{settings.TOKEN_REDIS_PREFIX}:{input_user.id}',
+                f'{settings.TOKEN_REFRESH_REDIS_PREFIX}:{input_user.id}',
             ]
             for i in prefix:
-                await redis_client.delete_prefix(i)
-            return count
+                await redis_client.delete_indexed(i)
+        await principal_cache.evict(input_user.id)
+        return count
 
 user_service: ServiceUser = ServiceUser(user_dao)
\ No newline at end of file
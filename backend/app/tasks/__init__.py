@@ -0,0 +1,3 @@
+from .celery_app import celery_app, drain, enqueue
+from .log import persist_login_log, persist_opera_logs
+from .location import enrich_log_location
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   celery_app.py
+@Time    :   2024/05/26 16:20:45
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+
+celery -A backend.app.tasks worker -l info
+'''
+import asyncio
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Coroutine, Optional
+
+from celery import Celery, Task
+from starlette.concurrency import run_in_threadpool
+
+from backend.app.common.cache.redis import redis_client
+from backend.app.common.log import log
+from backend.app.core.conf import settings
+
+
+def _broker_url() -> str:
+    if settings.TASK_QUEUE_BROKER_URL:
+        return settings.TASK_QUEUE_BROKER_URL
+    return (
+        f'amqp://{settings.TASK_QUEUE_USER}:{settings.TASK_QUEUE_PASSWORD}'
+        f'@{settings.TASK_QUEUE_HOST}:{settings.TASK_QUEUE_PORT}//'
+    )
+
+
+celery_app = Celery(settings.APP_NAME, broker=_broker_url(), include=['backend.app.tasks.log', 'backend.app.tasks.location'])
+celery_app.conf.update(
+    task_default_queue=settings.TASK_QUEUE_NAME,
+    task_serializer='json',
+    accept_content=['json'],
+    task_ignore_result=True,
+    # 任务均为幂等, 执行完成后再确认, worker 异常退出时重新投递
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=4,
+    # 提交失败时不在请求中重试, 由 enqueue 改为本地执行
+    task_publish_retry=False,
+    broker_connection_timeout=1,
+    broker_transport_options={'max_retries': 0},
+    task_always_eager=settings.TASK_QUEUE_ALWAYS_EAGER,
+    task_eager_propagates=True,
+    timezone=settings.DATETIME_TIMEZONE,
+)
+
+# worker 进程中执行协程的事件循环, 每个进程一个, 使连接池中的数据库与 redis 连接可以跨任务复用
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+# 本地后台执行的任务
+_background: set[asyncio.Task] = set()
+
+
+def run_async(coro: Coroutine) -> Any:
+    """
+    在任务中执行协程
+
+    worker 中使用进程内常驻的事件循环执行; 已处于事件循环中(enqueue 本地执行或 eager 模式)时返回协程交给调用方 await.
+    因此在事件循环中只能通过 enqueue 提交任务, 直接调用 delay / apply 时协程不会被执行
+
+    :param coro:
+    :return:
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        global _worker_loop
+        if _worker_loop is None:
+            _worker_loop = asyncio.new_event_loop()
+        return _worker_loop.run_until_complete(coro)
+    return coro
+
+
+async def enqueue(task: Task, **kwargs: Any) -> None:
+    """
+    提交任务
+
+    未启用任务队列时在当前请求中直接执行; eager 模式经 celery 在当前请求中执行;
+    提交失败时改为在当前进程后台执行, 不影响请求, 执行失败时记录日志
+
+    :param task:
+    :param kwargs: 任务参数, 需要可以 json 序列化
+    :return:
+    """
+    if not settings.TASK_QUEUE_ENABLED:
+        await task.run(**kwargs)
+        return
+    if celery_app.conf.task_always_eager:
+        # 任务体由 run_async 返回协程, 在当前事件循环中执行
+        result = task.apply_async(kwargs=kwargs).get()
+        if asyncio.iscoroutine(result):
+            await result
+        return
+    try:
+        # 向 broker 发布消息是阻塞 IO
+        await run_in_threadpool(task.apply_async, kwargs=kwargs)
+    except Exception as e:
+        log.warning(f'任务 {task.name} 提交失败, 改为本地执行: {e}')
+        background = asyncio.create_task(task.run(**kwargs))
+        _background.add(background)
+        background.add_done_callback(_background.discard)
+        background.add_done_callback(lambda t: _log_background_error(task, t))
+
+
+def _log_background_error(task: Task, background: asyncio.Task) -> None:
+    if background.cancelled():
+        log.warning(f'任务 {task.name} 本地执行被取消')
+        return
+    e = background.exception()
+    if e is not None:
+        log.opt(exception=e).error(f'任务 {task.name} 本地执行失败: {e}')
+
+
+async def drain() -> None:
+    """
+    等待本地后台执行的任务完成, 在应用关闭时调用
+
+    :return:
+    """
+    if _background:
+        await asyncio.gather(*_background, return_exceptions=True)
+
+
+async def run_once(key: str, func: Callable[[], Awaitable[Any]]) -> bool:
+    """
+    以 key 去重执行, 重复投递的任务只执行一次
+
+    执行期间持有短期标记, 完成后标记保留 TASK_QUEUE_ONCE_EXPIRE_SECONDS 秒; 执行失败时清除标记以便重试.
+    redis 不可用时不去重直接执行, 重复写入好过丢失日志
+
+    :param key: 调用方生成的唯一标识
+    :param func:
+    :return: 是否执行
+    """
+    name = f'{settings.TASK_QUEUE_ONCE_REDIS_PREFIX}:{key}'
+    try:
+        acquired = await redis_client.set(name, 'running', nx=True, ex=60)
+    except Exception as e:
+        log.warning(f'任务标记 {name} 设置失败, 不去重直接执行: {e}')
+        await func()
+        return True
+    if not acquired:
+        return False
+    try:
+        await func()
+    except BaseException:
+        with suppress(Exception):
+            await redis_client.delete(name)
+        raise
+    try:
+        await redis_client.set(name, 'done', ex=settings.TASK_QUEUE_ONCE_EXPIRE_SECONDS)
+    except Exception as e:
+        log.warning(f'任务标记 {name} 设置失败: {e}')
+    return True
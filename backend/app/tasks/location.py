@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   location.py
+@Time    :   2024/05/26 17:05:37
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Iterable, Optional, Union
+
+from sqlalchemy import case, update
+
+from backend.app.databases.mysql import async_session
+from backend.app.models import LoginLog, OperaLog
+from backend.app.tasks.celery_app import celery_app, run_async
+from backend.app.utils.request_parse import get_ip_location
+
+LOG_MODELS = {model.__tablename__: model for model in (LoginLog, OperaLog)}
+
+
+def unresolved_ips(rows: Iterable[dict[str, Any]]) -> list[str]:
+    """
+    日志行中尚未填写属地的 ip, 去重
+
+    :param rows:
+    :return:
+    """
+    return list(
+        dict.fromkeys(row['ip'] for row in rows if row.get('ip') and not (row.get('country') or row.get('region') or row.get('city')))
+    )
+
+
+def log_window(times: Iterable[Union[datetime, str]]) -> tuple[str, str]:
+    """
+    日志 create_time 所在的时间范围, 按秒向外取整, 覆盖数据库对小数秒的舍入
+
+    :param times: create_time, 经任务队列传递时为 ISO 格式字符串
+    :return: ISO 格式的开始、结束时间
+    """
+    times = [t if isinstance(t, datetime) else datetime.fromisoformat(t) for t in times]
+    start = min(times).replace(microsecond=0)
+    end = max(times).replace(microsecond=0) + timedelta(seconds=1)
+    return start.isoformat(), end.isoformat()
+
+
+async def _enrich_log_location(table: str, ips: list[str], start: str, end: str) -> None:
+    model = LOG_MODELS[table]
+    unique = list(dict.fromkeys(ip for ip in ips if ip))
+    locations = await asyncio.gather(*(get_ip_location(ip) for ip in unique))
+    resolved: dict[str, tuple[Optional[str], Optional[str], Optional[str]]] = {
+        ip: location for ip, location in zip(unique, locations) if any(location)
+    }
+    if not resolved:
+        return
+    async with async_session.begin() as db:
+        # 按 create_time 索引限定在本批写入的时间范围内, 一条 UPDATE 按 ip 取对应属地;
+        # 只补全尚未填写属地的记录, 重复执行结果不变
+        await db.execute(
+            update(model)
+            .where(
+                model.create_time.between(datetime.fromisoformat(start), datetime.fromisoformat(end)),
+                model.ip.in_(list(resolved)),
+                model.country.is_(None),
+                model.region.is_(None),
+                model.city.is_(None),
+            )
+            .values(
+                country=case({ip: location[0] for ip, location in resolved.items()}, value=model.ip),
+                region=case({ip: location[1] for ip, location in resolved.items()}, value=model.ip),
+                city=case({ip: location[2] for ip, location in resolved.items()}, value=model.ip),
+            )
+        )
+
+
+@celery_app.task(name='location.enrich_log_location')
+def enrich_log_location(*, table: str, ips: list[str], start: str, end: str) -> Any:
+    """
+    批量解析 ip 属地并补全一批日志
+
+    :param table: sys_login_log / sys_opera_log
+    :param ips:
+    :param start: 本批日志 create_time 的范围, 见 log_window
+    :param end:
+    :return:
+    """
+    return run_async(_enrich_log_location(table, ips, start, end))
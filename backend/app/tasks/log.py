@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   log.py
+@Time    :   2024/05/26 16:41:02
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   None
+'''
+from typing import Any
+
+from sqlalchemy import insert
+
+from backend.app.crud.crud_login_log import login_log_dao
+from backend.app.databases.mysql import async_session
+from backend.app.models import LoginLog, OperaLog
+from backend.app.schemas.login_log import CreateLoginLogParam
+from backend.app.tasks.celery_app import celery_app, enqueue, run_async, run_once
+from backend.app.tasks.location import enrich_log_location, log_window, unresolved_ips
+
+
+async def _persist_login_log(key: str, obj: dict[str, Any]) -> None:
+    created = []
+
+    async def write() -> None:
+        async with async_session.begin() as db:
+            login_log = await login_log_dao.create(db, obj=CreateLoginLogParam(**obj))
+        created.append(login_log.create_time)
+
+    ips = unresolved_ips([obj])
+    if await run_once(f'login_log:{key}', write) and ips:
+        start, end = log_window(created)
+        await enqueue(enrich_log_location, table=LoginLog.__tablename__, ips=ips, start=start, end=end)
+
+
+async def _persist_opera_logs(key: str, rows: list[dict[str, Any]]) -> None:
+    async def write() -> None:
+        async with async_session.begin() as db:
+            await db.execute(insert(OperaLog.__table__).values(rows))
+
+    # 属地在日志写入后按批补全
+    ips = unresolved_ips(rows)
+    if await run_once(f'opera_log:{key}', write) and ips:
+        start, end = log_window(row['create_time'] for row in rows)
+        await enqueue(enrich_log_location, table=OperaLog.__tablename__, ips=ips, start=start, end=end)
+
+
+@celery_app.task(name='log.persist_login_log')
+def persist_login_log(*, key: str, obj: dict[str, Any]) -> Any:
+    """
+    写入登录日志
+
+    :param key: 幂等标识
+    :param obj: CreateLoginLogParam 字段
+    :return:
+    """
+    return run_async(_persist_login_log(key, obj))
+
+
+@celery_app.task(name='log.persist_opera_logs')
+def persist_opera_logs(*, key: str, rows: list[dict[str, Any]]) -> Any:
+    """
+    批量写入操作日志
+
+    :param key: 幂等标识
+    :param rows: 列名 -> 值
+    :return:
+    """
+    return run_async(_persist_opera_logs(key, rows))
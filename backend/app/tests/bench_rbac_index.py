@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   bench_rbac_index.py
+@Time    :   2024/05/21 16:40:02
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   casbin 原生鉴权与预编译索引鉴权的性能对比
+
+python -m backend.app.tests.bench_rbac_index
+'''
+import random
+import time
+
+import casbin
+
+from backend.app.common.security.rbac_index import PolicyIndex
+
+MODEL_TEXT = """
+[request_definition]
+r = sub, obj, act
+
+[policy_definition]
+p = sub, obj, act
+
+[role_definition]
+g = _, _
+
+[policy_effect]
+e = some(where (p.eft == allow))
+
+[matchers]
+m = g(r.sub, p.sub) && (keyMatch(r.obj, p.obj) || keyMatch3(r.obj, p.obj)) && (r.act == p.act || p.act == "*")
+"""
+
+METHODS = ['GET', 'POST', 'PUT', 'DELETE']
+
+
+def make_policies(n: int, roles: int = 50, users: int = 500):
+    rnd = random.Random(n)
+    policies = []
+    for i in range(n):
+        resource = f'res{i // 4}'
+        kind = i % 4
+        if kind == 0:
+            path = f'/api/v1/{resource}'
+        elif kind == 1:
+            path = f'/api/v1/{resource}/{{pk}}'
+        elif kind == 2:
+            path = f'/api/v1/{resource}/*'
+        else:
+            path = f'/api/v1/{resource}/{{pk}}/items'
+        policies.append([f'role{rnd.randrange(roles)}', path, rnd.choice(METHODS)])
+    groupings = [[f'user{u}', f'role{r}'] for u in range(users) for r in rnd.sample(range(roles), 3)]
+    requests = []
+    for _ in range(2000):
+        resource = f'res{rnd.randrange(max(n // 4, 1))}'
+        path = rnd.choice(
+            [f'/api/v1/{resource}', f'/api/v1/{resource}/12', f'/api/v1/{resource}/12/items', f'/api/v1/{resource}/a/b']
+        )
+        requests.append((f'user{rnd.randrange(users)}', path, rnd.choice(METHODS)))
+    return policies, groupings, requests
+
+
+def bench(n: int) -> None:
+    policies, groupings, requests = make_policies(n)
+
+    enforcer = casbin.Enforcer(casbin.Enforcer.new_model(text=MODEL_TEXT))
+    enforcer.add_named_policies('p', policies)
+    enforcer.add_named_grouping_policies('g', groupings)
+
+    start = time.perf_counter()
+    index = PolicyIndex(enforcer.get_policy(), enforcer.get_grouping_policy())
+    build = time.perf_counter() - start
+
+    # 原生执行器在大策略量下很慢, 只取部分请求
+    sample = requests[: max(20, 200000 // n)]
+    start = time.perf_counter()
+    expected = [enforcer.enforce(*r) for r in sample]
+    stock = (time.perf_counter() - start) / len(sample)
+
+    start = time.perf_counter()
+    for r in requests:
+        index.enforce(*r)
+    compiled = (time.perf_counter() - start) / len(requests)
+
+    assert expected == [index.enforce(*r) for r in sample], '索引鉴权结果与 casbin 不一致'
+    print(
+        f'{n:>7} policies | casbin {stock * 1e6:>10.1f} us/op | index {compiled * 1e6:>6.1f} us/op '
+        f'| x{stock / compiled:>8.0f} | index build {build * 1e3:.0f} ms'
+    )
+
+
+if __name__ == '__main__':
+    for size in (1_000, 10_000, 100_000):
+        bench(size)
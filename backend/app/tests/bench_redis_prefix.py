@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   bench_redis_prefix.py
+@Time    :   2024/05/22 15:20:47
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   KEYS / SCAN / 前缀索引 三种按前缀删除方式的性能对比
+
+python -m backend.app.tests.bench_redis_prefix --db 15
+python -m backend.app.tests.bench_redis_prefix --fake --keys 1000000
+
+会清空目标 db, 请勿指向业务库
+'''
+import argparse
+import asyncio
+import time
+
+from backend.app.common.cache.redis import RedisCli
+
+TOKENS_PER_USER = 5
+
+
+async def seed(redis: RedisCli, total: int, users: int) -> None:
+    batch = 10000
+    for start in range(0, total, batch):
+        async with redis.pipeline(transaction=False) as pipe:
+            mapping = {f'bench_filler:{i % 97}:{i}': 1 for i in range(start, min(start + batch, total))}
+            pipe.mset(mapping)
+            await pipe.execute()
+    for user in range(users):
+        await seed_tokens(redis, user)
+
+
+async def seed_tokens(redis: RedisCli, user: int) -> None:
+    prefix = f'bench_token:{user}'
+    for i in range(TOKENS_PER_USER):
+        await redis.set_indexed(prefix, f'{prefix}:{i}', 'token', ex=3600)
+
+
+async def keys_delete(redis: RedisCli, prefix: str) -> None:
+    # 原实现
+    keys = await redis.keys(f'{prefix}*')
+    if keys:
+        await redis.delete(*keys)
+
+
+async def timed(name: str, redis: RedisCli, func, prefix: str, user: int) -> None:
+    start = time.perf_counter()
+    await func(prefix)
+    elapsed = time.perf_counter() - start
+    left = len(await redis.keys(f'bench_token:{user}:[0-9]*'))
+    print(f'{name:<16} {elapsed * 1e3:>10.2f} ms | 剩余 {left} 个 token')
+    await seed_tokens(redis, user)
+
+
+async def main(args) -> None:
+    if args.fake:
+        from fakeredis.aioredis import FakeRedis
+
+        redis = RedisCli(connection_pool=FakeRedis(decode_responses=True).connection_pool)
+    else:
+        redis = RedisCli(db=args.db)
+    await redis.flushdb()
+    start = time.perf_counter()
+    await seed(redis, args.keys, args.users)
+    print(f'写入 {await redis.dbsize()} 个 key, 耗时 {time.perf_counter() - start:.1f} s')
+
+    user = args.users // 2
+    await timed('KEYS + DEL', redis, lambda p: keys_delete(redis, f'{p}:'), f'bench_token:{user}', user)
+    await timed('SCAN + UNLINK', redis, lambda p: redis.delete_prefix(f'{p}:'), f'bench_token:{user}', user)
+    await timed('索引 + UNLINK', redis, redis.delete_indexed, f'bench_token:{user}', user)
+    await redis.flushdb()
+    await redis.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keys', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--db', type=int, default=15)
+    parser.add_argument('--fake', action='store_true', help='使用 fakeredis 代替真实 redis')
+    asyncio.run(main(parser.parse_args()))
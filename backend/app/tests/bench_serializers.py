@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   bench_serializers.py
+@Time    :   2024/05/24 11:12:05
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   逐行 sync_to_async 序列化与批量序列化的性能对比
+
+python -m backend.app.tests.bench_serializers
+'''
+import asyncio
+import time
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from backend.app.models import Menu
+from backend.app.utils.serializers import select_list_serialize, serialize_rows
+from backend.app.utils.timezone import timezone
+
+ROWS = 10_000
+
+
+@sync_to_async
+def old_select_columns_serialize(row) -> dict:
+    # 原实现
+    obj_dict = {}
+    for column in row.__table__.columns.keys():
+        val = getattr(row, column)
+        if isinstance(val, Decimal):
+            if val % 1 == 0:
+                val = int(val)
+            val = float(val)
+        obj_dict[column] = val
+    return obj_dict
+
+
+async def old_select_list_serialize(row) -> list:
+    return [await old_select_columns_serialize(_) for _ in row]
+
+
+def load():
+    engine = create_engine('sqlite://')
+    Menu.__table__.create(engine)
+    now = timezone.now()
+    with engine.begin() as conn:
+        conn.execute(
+            insert(Menu.__table__),
+            [dict(title=f'menu{i}', name=f'menu{i}', path=f'/menu/{i}', perms=f'sys:menu{i}', create_time=now) for i in range(ROWS)],
+        )
+    with Session(engine) as session:
+        objects = session.scalars(select(Menu)).all()
+        rows = session.execute(select(*Menu.__table__.columns)).all()
+    return objects, rows
+
+
+async def main() -> None:
+    objects, rows = load()
+
+    start = time.perf_counter()
+    expected = await old_select_list_serialize(objects)
+    old = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = await select_list_serialize(objects)
+    new = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from_rows = serialize_rows(rows)
+    raw = time.perf_counter() - start
+
+    assert result == [{k: getattr(v, 'value', v) for k, v in d.items()} for d in expected]
+    assert from_rows == result
+    print(f'{ROWS} rows | per-row sync_to_async {old * 1e3:>8.1f} ms')
+    print(f'{ROWS} rows | column plan (ORM)     {new * 1e3:>8.1f} ms | x{old / new:.0f}')
+    print(f'{ROWS} rows | Row tuples            {raw * 1e3:>8.1f} ms | x{old / raw:.0f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
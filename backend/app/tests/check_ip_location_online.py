@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   check_ip_location_online.py
+@Time    :   2024/05/23 16:02:37
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   使用本地 http 服务代替 ip-api, 验证在线 ip 属地查询的合并、熔断与失败缓存
+
+python -m backend.app.tests.check_ip_location_online
+'''
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from backend.app.utils.request_parse import OnlineLocationClient
+
+
+class StandIn(BaseHTTPRequestHandler):
+    hits: list[str] = []
+    mode = 'ok'
+
+    def do_GET(self):
+        ip = self.path.split('/')[-1].split('?')[0]
+        StandIn.hits.append(ip)
+        time.sleep(0.1)
+        if StandIn.mode == 'error':
+            self.send_response(500)
+            self.end_headers()
+            return
+        if ip.startswith('10.'):
+            body = {'status': 'fail', 'message': 'private range'}
+        else:
+            body = {'status': 'success', 'country': '中国', 'regionName': '江苏省', 'city': '南京市'}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def new_client(port: int, **kwargs) -> OnlineLocationClient:
+    options = dict(timeout=1, concurrency=4, failure_threshold=3, recovery_seconds=60, negative_expire_seconds=60)
+    options.update(kwargs)
+    return OnlineLocationClient(f'http://127.0.0.1:{port}/json/{{ip}}?lang=zh-CN', **options)
+
+
+async def main(port: int) -> None:
+    client = new_client(port)
+    await client.startup()
+
+    # 同一 ip 的并发查询只产生一次请求
+    results = await asyncio.gather(*[client.get('1.1.1.1', 'check') for _ in range(50)])
+    assert all(r and r['city'] == '南京市' for r in results)
+    assert StandIn.hits.count('1.1.1.1') == 1, StandIn.hits
+    print('coalescing: 50 callers -> 1 request')
+
+    # 超出并发上限的查询直接放弃
+    StandIn.hits.clear()
+    results = await asyncio.gather(*[client.get(f'2.2.2.{i}', 'check') for i in range(10)])
+    assert len(StandIn.hits) == 4 and sum(r is not None for r in results) == 4, StandIn.hits
+    print('concurrency: 10 distinct ips -> 4 requests, 6 skipped')
+
+    # 查询失败的 ip 进入失败缓存
+    StandIn.hits.clear()
+    assert await client.get('10.0.0.1', 'check') is None
+    assert await client.get('10.0.0.1', 'check') is None
+    assert StandIn.hits == ['10.0.0.1'], StandIn.hits
+    print('negative cache: 2 lookups -> 1 request')
+
+    # 连续失败后熔断
+    StandIn.hits.clear()
+    StandIn.mode = 'error'
+    for i in range(6):
+        assert await client.get(f'3.3.3.{i}', 'check') is None
+    assert len(StandIn.hits) == 3 and client.is_open, StandIn.hits
+    print('circuit breaker: 6 lookups -> 3 requests, then open')
+    await client.shutdown()
+
+
+if __name__ == '__main__':
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        asyncio.run(main(server.server_address[1]))
+    finally:
+        server.shutdown()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   test_tasks.py
+@Time    :   2024/05/28 14:36:05
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   登录日志经任务队列(memory:// broker, eager 模式)写入并补全属地
+
+python -m pytest backend/app/tests/test_tasks.py
+'''
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+from fakeredis.aioredis import FakeRedis
+from sqlalchemy import select
+from sqlalchemy.dialects.mysql import LONGTEXT
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import backend.app.tasks.location as location_tasks
+import backend.app.tasks.log as log_tasks
+from backend.app.common.cache.redis import redis_client
+from backend.app.core.conf import settings
+from backend.app.models import LoginLog
+from backend.app.services import login_log_service
+from backend.app.tasks import celery_app, drain
+from backend.app.utils.timezone import timezone
+
+IP = '203.0.113.7'
+
+
+@compiles(LONGTEXT, 'sqlite')
+def _longtext_sqlite(type_, compiler, **kw) -> str:
+    return 'TEXT'
+
+
+@pytest.fixture
+def eager_queue(monkeypatch):
+    monkeypatch.setattr(settings, 'TASK_QUEUE_ENABLED', True)
+    monkeypatch.setitem(celery_app.conf, 'broker_url', 'memory://')
+    monkeypatch.setitem(celery_app.conf, 'task_always_eager', True)
+    pool = redis_client.connection_pool
+    yield
+    redis_client.connection_pool = pool
+
+
+def fake_request() -> SimpleNamespace:
+    return SimpleNamespace(
+        state=SimpleNamespace(ip=IP, user_agent='pytest', browser='pytest', os='pytest', device='pytest')
+    )
+
+
+async def persist_login_log(url: str, monkeypatch) -> list[LoginLog]:
+    # fakeredis 需要在当前事件循环中创建
+    redis_client.connection_pool = FakeRedis(decode_responses=True).connection_pool
+    await redis_client.set(f'{settings.IP_LOCATION_REDIS_PREFIX}:{IP}', '中国 广东省 深圳市')
+
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(LoginLog.metadata.create_all, tables=[LoginLog.__table__])
+    session = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(log_tasks, 'async_session', session)
+    monkeypatch.setattr(location_tasks, 'async_session', session)
+    try:
+        user = SimpleNamespace(uuid='pytest', username='pytest')
+        await login_log_service.append(request=fake_request(), user=user, login_time=timezone.now(), status=1, msg='ok')
+        await drain()
+        async with session() as db:
+            return list((await db.execute(select(LoginLog))).scalars())
+    finally:
+        await engine.dispose()
+
+
+def test_persist_login_log_eager(eager_queue, monkeypatch, tmp_path):
+    rows = asyncio.run(persist_login_log(f'sqlite+aiosqlite:///{os.path.join(tmp_path, "test.db")}', monkeypatch))
+    assert len(rows) == 1
+    assert rows[0].username == 'pytest'
+    assert rows[0].ip == IP
+    assert (rows[0].country, rows[0].region, rows[0].city) == ('中国', '广东省', '深圳市')
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+@File    :   test_user_me.py
+@Time    :   2024/05/28 10:12:40
+@Author  :   xy
+@Version :   1.0
+@Copyright : ©Copyright 2020-2023 Wukong Company
+@Desc    :   获取当前用户信息接口, 认证结果为用户快照
+
+python -m pytest backend/app/tests/test_user_me.py
+'''
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app.common.security import jwt
+from backend.app.common.security.principal import DeptSnapshot, RoleSnapshot, UserSnapshot
+from backend.app.core.conf import settings
+from backend.app.main import app
+
+NOW = datetime(2024, 5, 22, 9, 46, 11)
+
+
+def make_user(*, dept: bool = True) -> UserSnapshot:
+    return UserSnapshot(
+        id=1,
+        uuid='7f0a8c6e-5a1b-4c1e-9f55-2b6d3e9a1c01',
+        username='admin',
+        nickname='管理员',
+        password='hashed',
+        salt=None,
+        email='admin@example.com',
+        is_superuser=True,
+        status=1,
+        avatar=None,
+        phone=None,
+        join_time=NOW,
+        last_login_time=None,
+        dept_id=1 if dept else None,
+        dept=DeptSnapshot(
+            id=1, name='研发部', level=0, sort=0, leader=None, phone=None, email=None, status=1, del_flag=False,
+            parent_id=None, create_time=NOW, update_time=None,
+        ) if dept else None,
+        roles=(
+            RoleSnapshot(id=1, name='管理员', data_scope=1, status=1, remark=None, create_time=NOW, update_time=None, menus=()),
+            RoleSnapshot(id=2, name='测试', data_scope=2, status=1, remark=None, create_time=NOW, update_time=None, menus=()),
+        ),
+    )
+
+
+@pytest.fixture
+def client(monkeypatch):
+    user = make_user()
+
+    async def jwt_authentication(token: str) -> UserSnapshot:
+        return user
+
+    monkeypatch.setattr(jwt, 'jwt_authentication', jwt_authentication)
+    monkeypatch.setattr(settings, 'OPERA_LOG_EXCLUDE', [*settings.OPERA_LOG_EXCLUDE, f'{settings.API_V1_STR}/users/me'])
+    return TestClient(app)
+
+
+def test_get_current_user(client):
+    response = client.get(f'{settings.API_V1_STR}/users/me', headers={'Authorization': 'Bearer token'})
+    assert response.status_code == 200
+    data = response.json()['data']
+    assert data['username'] == 'admin'
+    assert data['dept'] == '研发部'
+    assert data['roles'] == ['管理员', '测试']
+    assert 'password' not in data
+
+
+def test_get_current_user_without_dept(client, monkeypatch):
+    user = make_user(dept=False)
+
+    async def jwt_authentication(token: str) -> UserSnapshot:
+        return user
+
+    monkeypatch.setattr(jwt, 'jwt_authentication', jwt_authentication)
+    response = client.get(f'{settings.API_V1_STR}/users/me', headers={'Authorization': 'Bearer token'})
+    assert response.status_code == 200
+    data = response.json()['data']
+    assert data['dept'] is None
+    assert data['roles'] == ['管理员', '测试']
+
+
+def test_get_current_user_unauthenticated(client):
+    response = client.get(f'{settings.API_V1_STR}/users/me')
+    assert response.status_code == 403
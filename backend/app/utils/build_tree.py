@@ -3,48 +3,96 @@
 '''
 @File    :   build_tree.py
 @Time    :   2024/04/19 13:04:44
-@Author  :   xy 
+@Author  :   xy
 @Version :   1.0
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
-from typing import Any, Sequence, Optional
-from asgiref.sync import sync_to_async
+from collections import defaultdict
+from typing import Any, Callable, Sequence, Optional
 
 from backend.app.common.enums import BuildTreeType
-from backend.app.utils.serializers import RowData, select_list_serialize
+from backend.app.utils.serializers import RowData, serialize_rows
+
+
+class TreeIndex:
+    """
+    树形结构邻接索引
+
+    节点按 sort 排序后一次性建立 id -> 节点 与 parent_id -> 子节点 的映射, 之后的整树构建、子树过滤与
+    保留祖先的搜索都只需遍历一次索引, 耗时 O(n); 索引中的节点不会被修改, 构建结果中的节点均为副本
+    """
+
+    def __init__(self, nodes: list[dict[str, Any]]):
+        nodes = sorted(nodes, key=lambda x: x['sort'])
+        self.nodes: dict[int, dict[str, Any]] = {node['id']: node for node in nodes}
+        self.children: dict[Optional[int], list[dict[str, Any]]] = defaultdict(list)
+        for node in nodes:
+            self.children[node['parent_id']].append(node)
+
+    def _build(self, parent_id: Optional[int], include: Optional[Callable[[dict[str, Any]], bool]]) -> list[dict[str, Any]]:
+        tree = []
+        for node in self.children.get(parent_id, ()):
+            if include is not None and not include(node):
+                continue
+            item = dict(node)
+            children = self._build(node['id'], include)
+            if children:
+                item['children'] = children
+            tree.append(item)
+        return tree
+
+    def to_tree(self, *, parent_id: Optional[int] = None) -> list[dict[str, Any]]:
+        """
+        构建完整的树, 父节点不存在的节点不会出现在结果中
+
+        :param parent_id: 根节点的父节点 id
+        :return:
+        """
+        return self._build(parent_id, None)
+
+    def filter_tree(self, include: Callable[[dict[str, Any]], bool]) -> list[dict[str, Any]]:
+        """
+        子树过滤, 节点本身满足条件且其父节点被保留时才保留
+
+        :param include:
+        :return:
+        """
+        return self._build(None, include)
+
+    def search_tree(self, match: Callable[[dict[str, Any]], bool]) -> list[dict[str, Any]]:
+        """
+        搜索, 保留满足条件的节点及其全部祖先节点
+
+        :param match:
+        :return:
+        """
+        keep: set[int] = set()
+        for node in self.nodes.values():
+            if not match(node):
+                continue
+            current = node
+            while current is not None and current['id'] not in keep:
+                keep.add(current['id'])
+                current = self.nodes.get(current['parent_id'])
+        return self._build(None, lambda node: node['id'] in keep)
 
 
 async def get_tree_nodes(row: Sequence[RowData]) -> list[dict[str, Any]]:
     """获取所有树形结构节点"""
-    tree_nodes = await select_list_serialize(row)
+    tree_nodes = serialize_rows(row)
     tree_nodes.sort(key=lambda x: x['sort'])
     return tree_nodes
 
 
-@sync_to_async
-def traversal_to_tree(nodes: list[dict[str, Any]]) -> list[dict[str, Any]]:
+async def traversal_to_tree(nodes: list[dict[str, Any]]) -> list[dict[str, Any]]:
     """
     通过遍历算法构造树形结构
 
     :param nodes:
     :return:
     """
-    tree = []
-    node_dict = {node['id']: node for node in nodes}
-
-    for node in nodes:
-        parent_id = node['parent_id']
-        if parent_id is None:
-            tree.append(node)
-        else:
-            parent_node = node_dict.get(parent_id)
-            if parent_node is not None:
-                if 'children' not in parent_node:
-                    parent_node['children'] = []
-                parent_node['children'].append(node)
-
-    return tree
+    return TreeIndex(nodes).to_tree()
 
 
 async def recursive_to_tree(nodes: list[dict[str, Any]], *, parent_id: Optional[int] = None) -> list[dict[str, Any]]:
@@ -55,14 +103,7 @@ async def recursive_to_tree(nodes: list[dict[str, Any]], *, parent_id: Optional[
     :param parent_id:
     :return:
     """
-    tree = []
-    for node in nodes:
-        if node['parent_id'] == parent_id:
-            child_node = await recursive_to_tree(nodes, parent_id=node['id'])
-            if child_node:
-                node['children'] = child_node
-            tree.append(node)
-    return tree
+    return TreeIndex(nodes).to_tree(parent_id=parent_id)
 
 
 async def get_tree_data(
@@ -84,4 +125,4 @@ async def get_tree_data(
             tree = await recursive_to_tree(nodes, parent_id=parent_id)
         case _:
             raise ValueError(f'无效的算法类型：{build_type}')
-    return tree
\ No newline at end of file
+    return tree
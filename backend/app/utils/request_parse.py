@@ -8,6 +8,11 @@
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
+import asyncio
+import mmap
+import time
+from functools import lru_cache
+from typing import Optional
 
 import httpx
 
@@ -18,9 +23,13 @@ from XdbSearchIP.xdbSearcher import XdbSearcher
 
 from backend.app.common.log import log
 from backend.app.common.cache.redis import redis_client
+from backend.app.common.cache.memory import LRUCache, ip_location_cache
+from backend.app.common.metrics import observe_cache
 from backend.app.core.conf import settings
 from backend.app.core.path_conf import IP2REGION_XDB
 
+# 进程内唯一的 xdb 查询器, 首次使用时加载
+_xdb_searcher: Optional[XdbSearcher] = None
 
 
 @sync_to_async
@@ -41,6 +50,116 @@ def get_request_ip(request: Request) -> str:
     return ip
 
 
+class OnlineLocationClient:
+    """
+    在线 ip 属地查询客户端
+
+    + 复用同一个 httpx 客户端(keep-alive), 由 lifespan 管理
+    + 并发查询数达到上限时不排队, 直接放弃在线查询
+    + 同一 ip 的并发查询合并为一次请求
+    + 连续失败达到阈值后熔断一段时间
+    + 查询失败的 ip 在一段时间内不再查询
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        timeout: float,
+        concurrency: int,
+        failure_threshold: int,
+        recovery_seconds: int,
+        negative_expire_seconds: int,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.negative_expire_seconds = negative_expire_seconds
+        self.failures = 0
+        self._open_until = 0.0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._negative = LRUCache(settings.IP_LOCATION_LRU_CACHE_CAPACITY)
+
+    async def startup(self) -> None:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            )
+
+    async def shutdown(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def is_open(self) -> bool:
+        """是否处于熔断状态"""
+        return time.monotonic() < self._open_until
+
+    async def get(self, ip: str, user_agent: str) -> dict | None:
+        """
+        查询 ip 属地
+
+        :param ip:
+        :param user_agent:
+        :return: 熔断、失败或无法查询时返回 None
+        """
+        expire_at = self._negative.get(ip)
+        if expire_at is not None and expire_at > time.monotonic():
+            return None
+        if self.is_open:
+            return None
+        task = self._inflight.get(ip)
+        if task is None:
+            if len(self._inflight) >= self.concurrency:
+                return None
+            await self.startup()
+            task = asyncio.create_task(self._fetch(ip, user_agent))
+            self._inflight[ip] = task
+            task.add_done_callback(lambda _: self._inflight.pop(ip, None))
+        # 某个等待方被取消时不影响其他等待方
+        return await asyncio.shield(task)
+
+    async def _fetch(self, ip: str, user_agent: str) -> dict | None:
+        async with self._semaphore:
+            try:
+                response = await self._client.get(self.url.format(ip=ip), headers={'User-Agent': user_agent or ''})
+                response.raise_for_status()
+                data = response.json()
+            except Exception as e:
+                log.error(f'在线获取 ip 地址属地失败，错误信息：{e}')
+                self._record_failure()
+                self._negative.put(ip, time.monotonic() + self.negative_expire_seconds)
+                return None
+        self.failures = 0
+        # ip-api 对内网等无法查询的 ip 返回 status: fail
+        if data.get('status', 'success') != 'success':
+            self._negative.put(ip, time.monotonic() + self.negative_expire_seconds)
+            return None
+        return data
+
+    def _record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self._open_until = time.monotonic() + self.recovery_seconds
+            log.warning(f'在线获取 ip 地址属地连续失败 {self.failures} 次，{self.recovery_seconds} 秒内改用离线查询')
+
+
+online_location_client = OnlineLocationClient(
+    settings.IP_LOCATION_ONLINE_URL,
+    timeout=settings.IP_LOCATION_ONLINE_TIMEOUT,
+    concurrency=settings.IP_LOCATION_ONLINE_CONCURRENCY,
+    failure_threshold=settings.IP_LOCATION_ONLINE_FAILURE_THRESHOLD,
+    recovery_seconds=settings.IP_LOCATION_ONLINE_RECOVERY_SECONDS,
+    negative_expire_seconds=settings.IP_LOCATION_NEGATIVE_EXPIRE_SECONDS,
+)
+
+
 async def get_location_online(ip: str, user_agent: str) -> dict | None:
     """
     在线获取 ip 地址属地，无法保证可用性，准确率较高
@@ -49,31 +168,36 @@ async def get_location_online(ip: str, user_agent: str) -> dict | None:
     :param user_agent:
     :return:
     """
-    async with httpx.AsyncClient(timeout=3) as client:
-        ip_api_url = f'http://ip-api.com/json/{ip}?lang=zh-CN'
-        headers = {'User-Agent': user_agent}
-        try:
-            response = await client.get(ip_api_url, headers=headers)
-            if response.status_code == 200:
-                return response.json()
-        except Exception as e:
-            log.error(f'在线获取 ip 地址属地失败，错误信息：{e}')
-            return None
+    return await online_location_client.get(ip, user_agent)
+
+
+def get_xdb_searcher() -> XdbSearcher:
+    """
+    获取 xdb 查询器
+
+    xdb 文件通过 mmap 只读映射, 每个进程只映射一次, 多个 worker 共享同一份系统页缓存
+
+    :return:
+    """
+    global _xdb_searcher
+    if _xdb_searcher is None:
+        with open(IP2REGION_XDB, 'rb') as f:
+            content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _xdb_searcher = XdbSearcher(contentBuff=content)
+    return _xdb_searcher
 
 
-@sync_to_async
 def get_location_offline(ip: str) -> dict | None:
     """
     离线获取 ip 地址属地，无法保证准确率，100%可用
 
+    查询只是内存中的二分查找, 直接在事件循环中执行
+
     :param ip:
     :return:
     """
     try:
-        cb = XdbSearcher.loadContentFromFile(dbfile=IP2REGION_XDB)
-        searcher = XdbSearcher(contentBuff=cb)
-        data = searcher.search(ip)
-        searcher.close()
+        data = get_xdb_searcher().search(ip)
         data = data.split('|')
         return {
             'country': data[0] if data[0] != '0' else None,
@@ -85,36 +209,76 @@ def get_location_offline(ip: str) -> dict | None:
         return None
 
 
-async def parse_ip_info(request: Request) -> tuple[str, str, str, str]:
+async def get_ip_location(ip: str, user_agent: Optional[str] = None) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    获取 ip 属地, 依次查询进程内缓存、redis 缓存与 LOCATION_PARSE 指定的查询方式
+
+    :param ip:
+    :param user_agent:
+    :return: country, region, city
+    """
     country, region, city = None, None, None
-    ip = await get_request_ip(request)
+    location = ip_location_cache.get(ip)
+    if location:
+        return location
     location = await redis_client.get(f'{settings.IP_LOCATION_REDIS_PREFIX}:{ip}')
+    observe_cache('ip_location_redis', bool(location))
     if location:
-        country, region, city = location.split(' ')
-        return ip, country, region, city
+        country, region, city = (None if i == 'None' else i for i in location.split(' '))
+        ip_location_cache.put(ip, (country, region, city))
+        return country, region, city
     if settings.LOCATION_PARSE == 'online':
-        location_info = await get_location_online(ip, request.headers.get('User-Agent'))
+        # 在线查询不可用时回退到离线查询
+        location_info = await get_location_online(ip, user_agent) or get_location_offline(ip)
     elif settings.LOCATION_PARSE == 'offline':
-        location_info = await get_location_offline(ip)
+        location_info = get_location_offline(ip)
     else:
         location_info = None
     if location_info:
         country = location_info.get('country')
         region = location_info.get('regionName')
         city = location_info.get('city')
+        ip_location_cache.put(ip, (country, region, city))
         await redis_client.set(
             f'{settings.IP_LOCATION_REDIS_PREFIX}:{ip}',
             f'{country} {region} {city}',
             ex=settings.IP_LOCATION_EXPIRE_SECONDS,
         )
-    return ip, country, region, city
+    return country, region, city
+
+
+async def get_request_location(request: Request) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    按需获取当前请求的 ip 属地
+
+    操作日志中间件只记录 ip, 属地由后台任务补全; 接口需要属地时调用此方法, 结果保存在
+    request.state.country、region、city 中, 同一请求内只解析一次
+
+    :param request:
+    :return: country, region, city
+    """
+    state = request.state
+    if not hasattr(state, 'country'):
+        ip = getattr(state, 'ip', None) or await get_request_ip(request)
+        state.country, state.region, state.city = await get_ip_location(ip, request.headers.get('User-Agent'))
+    return state.country, state.region, state.city
+
+
+@lru_cache(maxsize=settings.USER_AGENT_LRU_CACHE_CAPACITY)
+def parse_user_agent(user_agent: str) -> tuple[str, str, str]:
+    """
+    解析 user agent, 结果按 user agent 字符串缓存, 命中情况见 parse_user_agent.cache_info()
+
+    :param user_agent:
+    :return: device, os, browser
+    """
+    _user_agent = parse(user_agent)
+    return _user_agent.get_device(), _user_agent.get_os(), _user_agent.get_browser()
 
 
-@sync_to_async
 def parse_user_agent_info(request: Request) -> tuple[str, str, str, str]:
     user_agent = request.headers.get('User-Agent')
-    _user_agent = parse(user_agent)
-    device = _user_agent.get_device()
-    os = _user_agent.get_os()
-    browser = _user_agent.get_browser()
+    hits = parse_user_agent.cache_info().hits
+    device, os, browser = parse_user_agent(user_agent or '')
+    observe_cache('user_agent', parse_user_agent.cache_info().hits > hits)
     return user_agent, device, os, browser
@@ -8,40 +8,170 @@
 @Copyright : ©Copyright 2020-2023 Wukong Company
 @Desc    :   None
 '''
-from typing import Any, Sequence, TypeVar, Union
+from typing import Any, Callable, Optional, Sequence, TypeVar, Union
 from decimal import Decimal
+from enum import Enum
+from operator import attrgetter, itemgetter
 
 
 import msgspec
 
 from asgiref.sync import sync_to_async
-from sqlalchemy import Row, RowMapping
+from sqlalchemy import Float, Numeric, Row, RowMapping, TypeDecorator
 from starlette.responses import JSONResponse
 
+from backend.app.common.tracing import span
+
 RowData = Union[Row, RowMapping, Any]
 
 R = TypeVar('R', bound=RowData)
 
+# 模型 -> (列名, 取值函数, 需要转换的列)
+_ColumnPlan = tuple[tuple[str, ...], Callable[[Any], tuple], tuple[tuple[str, Callable[[Any], Any]], ...]]
+_Converters = tuple[tuple[str, Callable[[Any], Any]], ...]
+_column_plans: dict[type, _ColumnPlan] = {}
 
-@sync_to_async
-def select_columns_serialize(row: R) -> dict:
+
+def _convert_decimal(val: Any) -> Any:
+    if isinstance(val, Decimal):
+        return float(val)
+    return val
+
+
+def _convert_enum(val: Any) -> Any:
+    return val.value if isinstance(val, Enum) else val
+
+
+def _convert_value(val: Any) -> Any:
+    if isinstance(val, Decimal):
+        return _convert_decimal(val)
+    if isinstance(val, Enum):
+        return val.value
+    return val
+
+
+def _column_converter(column) -> Optional[Callable[[Any], Any]]:
+    if isinstance(column.type, Numeric) and not isinstance(column.type, Float):
+        return _convert_decimal
+    if isinstance(column.type, TypeDecorator):
+        return _convert_enum
+    return None
+
+
+def _instance_getter(keys: tuple[str, ...]) -> Callable[[Any], tuple]:
+    # 已加载的列值直接从实例 __dict__ 读取, 绕过属性描述符; 存在未加载(过期/延迟)的列时回退为 getattr
+    from_dict = itemgetter(*keys)
+    from_attr = attrgetter(*keys)
+    single = len(keys) == 1
+
+    def getter(obj: Any) -> tuple:
+        try:
+            values = from_dict(obj.__dict__)
+        except KeyError:
+            values = from_attr(obj)
+        return (values,) if single else values
+
+    return getter
+
+
+def _row_converters(keys: tuple[str, ...], rows: Sequence[Sequence[Any]]) -> _Converters:
+    # 同一列的值类型一致, 按每列第一个非空值决定是否需要转换
+    converters = []
+    for i, key in enumerate(keys):
+        for row in rows:
+            val = row[i]
+            if val is not None:
+                if isinstance(val, Decimal):
+                    converters.append((key, _convert_decimal))
+                elif isinstance(val, Enum):
+                    converters.append((key, _convert_enum))
+                break
+    return tuple(converters)
+
+
+def _get_column_plan(model: type) -> _ColumnPlan:
     """
-    Serialize SQLAlchemy select table columns, does not contain relational columns
+    获取模型的序列化方案, 每个模型只计算一次
+
+    :param model:
+    :return:
+    """
+    plan = _column_plans.get(model)
+    if plan is None:
+        columns = model.__table__.columns
+        keys = tuple(columns.keys())
+        getter = _instance_getter(keys)
+        converters = tuple(
+            (key, converter) for key in keys if (converter := _column_converter(columns[key])) is not None
+        )
+        plan = _column_plans[model] = (keys, getter, converters)
+    return plan
+
+
+def serialize_row(row: R) -> dict:
+    """
+    Serialize one SQLAlchemy model instance, Row or RowMapping, does not contain relational columns
 
     :param row:
     :return:
     """
-    obj_dict = {}
-    for column in row.__table__.columns.keys():
-        val = getattr(row, column)
-        if isinstance(val, Decimal):
-            if val % 1 == 0:
-                val = int(val)
-            val = float(val)
-        obj_dict[column] = val
+    if isinstance(row, (Row, RowMapping)):
+        mapping = row._mapping if isinstance(row, Row) else row
+        return {key: _convert_value(val) for key, val in mapping.items()}
+    keys, getter, converters = _get_column_plan(type(row))
+    obj_dict = dict(zip(keys, getter(row)))
+    for key, converter in converters:
+        obj_dict[key] = converter(obj_dict[key])
     return obj_dict
 
 
+def serialize_rows(rows: Sequence[R]) -> list[dict]:
+    """
+    Serialize a whole SQLAlchemy result set in one call
+
+    :param rows: model instances, or Row / RowMapping from a column select (no ORM objects are built)
+    :return:
+    """
+    if not rows:
+        return []
+    first = rows[0]
+    if isinstance(first, (Row, RowMapping)):
+        if isinstance(first, RowMapping):
+            keys = tuple(first.keys())
+            rows = [tuple(row.values()) for row in rows]
+        else:
+            keys = tuple(first._fields)
+        converters = _row_converters(keys, rows)
+        ret_list = [dict(zip(keys, row)) for row in rows]
+        if converters:
+            for obj_dict in ret_list:
+                for key, converter in converters:
+                    obj_dict[key] = converter(obj_dict[key])
+        return ret_list
+    model = type(first)
+    keys, getter, converters = _get_column_plan(model)
+    ret_list = []
+    for row in rows:
+        if type(row) is not model:
+            ret_list.append(serialize_row(row))
+            continue
+        obj_dict = dict(zip(keys, getter(row)))
+        for key, converter in converters:
+            obj_dict[key] = converter(obj_dict[key])
+        ret_list.append(obj_dict)
+    return ret_list
+
+
+async def select_columns_serialize(row: R) -> dict:
+    """
+    Serialize SQLAlchemy select table columns, does not contain relational columns
+
+    :param row:
+    :return:
+    """
+    return serialize_row(row)
+
+
 async def select_list_serialize(row: Sequence[R]) -> list:
     """
     Serialize SQLAlchemy select list
@@ -49,8 +179,7 @@ async def select_list_serialize(row: Sequence[R]) -> list:
     :param row:
     :return:
     """
-    ret_list = [await select_columns_serialize(_) for _ in row]
-    return ret_list
+    return serialize_rows(row)
 
 
 @sync_to_async
@@ -74,4 +203,5 @@ class MsgSpecJSONResponse(JSONResponse):
     """
 
     def render(self, content: Any) -> bytes:
-        return msgspec.json.encode(content)
+        with span('response.render'):
+            return msgspec.json.encode(content)